@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   bindiff.py
+#   Comparación de archivos BIN de LIDER
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Comparación de datos horarios de dos archivos .BIN de un mismo edificio
+
+Las zonas se emparejan por nombre y, para cada variable horaria, se calcula
+la raíz del error cuadrático medio (rms), la diferencia máxima en valor
+absoluto (maxabs) y la diferencia de la suma anual (suma) de los valores del
+segundo archivo respecto al primero.
+
+Los archivos se recorren por bloques de zonas, de modo que la memoria
+empleada queda limitada por el parámetro maxmem independientemente del
+tamaño de los archivos.
+"""
+
+import numpy as np
+import pandas as pd
+
+from sol.binparser import mapBIN, nombreszonas
+
+VARIABLES = ('QS', 'QL', 'Treal', 'Vventinf')
+ESTADISTICOS = ('rms', 'maxabs', 'suma')
+
+def diffBIN(file1, file2, variables=VARIABLES, maxmem=64 * 2**20):
+    """Compara los datos horarios de las zonas comunes a dos archivos .BIN
+
+    file1, file2 - Archivos .BIN de LIDER (el primero actúa como referencia)
+    variables - Variables horarias comparadas
+    maxmem - Memoria máxima aproximada empleada en cada bloque [bytes]
+
+    Devuelve una tupla con:
+    - DataFrame indexado por nombre de zona y con columnas (variable, estadístico)
+    - lista de zonas presentes solamente en el primer archivo
+    - lista de zonas presentes solamente en el segundo archivo
+    """
+    data1, data2 = mapBIN(file1), mapBIN(file2)
+    nombres1, nombres2 = nombreszonas(data1), nombreszonas(data2)
+    indice2 = dict((nombre, i) for (i, nombre) in enumerate(nombres2))
+    conjunto1 = set(nombres1)
+
+    comunes = [nombre for nombre in nombres1 if nombre in indice2]
+    solo1 = [nombre for nombre in nombres1 if nombre not in indice2]
+    solo2 = [nombre for nombre in nombres2 if nombre not in conjunto1]
+    idx1 = np.array([i for (i, nombre) in enumerate(nombres1) if nombre in indice2], dtype=int)
+    idx2 = np.array([indice2[nombre] for nombre in comunes], dtype=int)
+
+    # Cada zona del bloque ocupa, por variable, dos series float32 leídas
+    # y una serie float64 de diferencias
+    nhoras = data1.dtype['QS'].shape[0]
+    bytesporzona = nhoras * (4 + 4 + 8)
+    bloque = max(1, int(maxmem // bytesporzona))
+
+    nz = len(comunes)
+    resultados = dict(((var, est), np.zeros(nz))
+                      for var in variables for est in ESTADISTICOS)
+    for var in variables:
+        campo1, campo2 = data1[var], data2[var]
+        for inicio in range(0, nz, bloque):
+            fin = min(inicio + bloque, nz)
+            diff = campo2[idx2[inicio:fin]].astype(np.float64)
+            diff -= campo1[idx1[inicio:fin]]
+            resultados[(var, 'rms')][inicio:fin] = np.sqrt(np.mean(diff * diff, axis=1))
+            resultados[(var, 'maxabs')][inicio:fin] = np.abs(diff).max(axis=1)
+            resultados[(var, 'suma')][inicio:fin] = diff.sum(axis=1)
+            del diff
+
+    columnas = pd.MultiIndex.from_tuples([(var, est) for var in variables
+                                          for est in ESTADISTICOS])
+    df = pd.DataFrame(dict((col, resultados[col]) for col in columnas),
+                      index=pd.Index(comunes, name='Nombre'), columns=columnas)
+    return df, solo1, solo2
+
+def ranking(diffdf, variable='QS', estadistico='rms', num=10):
+    """Zonas con mayores diferencias para una variable y estadístico"""
+    return diffdf.sort_values((variable, estadistico), ascending=False).head(num)
+
+if __name__ == '__main__':
+    import argparse
+
+    usage = """%(prog)s [opciones] archivo1.bin archivo2.bin
+
+    Comparación de archivos .BIN de LIDER
+    (C) 2015 Rafael Villar Burke <pachi@rvburke.com>"""
+    parser = argparse.ArgumentParser(usage=usage)
+    parser.add_argument('binpath1', action='store', help=u'Archivo .BIN de referencia')
+    parser.add_argument('binpath2', action='store', help=u'Archivo .BIN comparado')
+    parser.add_argument('-v', '--variable', action='store', default='QS',
+                        choices=VARIABLES, help=u"Variable para ordenar las zonas")
+    parser.add_argument('-e', '--estadistico', action='store', default='rms',
+                        choices=ESTADISTICOS, help=u"Estadístico para ordenar las zonas")
+    parser.add_argument('-n', '--num', action='store', type=int, default=10,
+                        help=u"Número de zonas mostradas")
+    parser.add_argument('-m', '--maxmem', action='store', type=int, default=64,
+                        help=u"Memoria máxima por bloque (MB)")
+    args = parser.parse_args()
+
+    df, solo1, solo2 = diffBIN(args.binpath1, args.binpath2, maxmem=args.maxmem * 2**20)
+    print(u"Comparadas %i zonas comunes" % len(df))
+    if solo1:
+        print(u"* Zonas solo en %s: %s" % (args.binpath1, u", ".join(solo1)))
+    if solo2:
+        print(u"* Zonas solo en %s: %s" % (args.binpath2, u", ".join(solo2)))
+    print(u"* Zonas con mayores diferencias (%s, %s)" % (args.variable, args.estadistico))
+    print(ranking(df, args.variable, args.estadistico, args.num))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   binindex.py
+#   Localización del archivo BIN correspondiente a un archivo de resultados
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Índice de archivos .BIN de un directorio
+
+En directorios con varios archivos de resultados y varios archivos .BIN el
+nombre del archivo no basta para saber qué .BIN corresponde a cada .res.
+Se comparan los nombres de las zonas del .res con los de cada .BIN, que se
+obtienen leyendo solo los nombres de zona de cada archivo.
+
+Los nombres de zona de los .BIN de cada directorio se guardan en un índice
+junto con la fecha de modificación y el tamaño de cada archivo, de modo que
+solo se vuelven a leer los archivos que han cambiado. Los índices de todos
+los directorios se guardan en memoria y en el archivo INDEXNAME del
+directorio de caché del usuario, por ruta absoluta del directorio, sin
+escribir nada junto a los archivos de resultados.
+"""
+
+import io
+import os
+import json
+
+from sol.binparser import leenombreszonas
+from sol.util import get_cachedir
+
+INDEXNAME = 'binindex.json'
+
+# Índices de directorios ya consultados en este proceso
+_INDICES = {}
+
+def _leeindices():
+    """Índices guardados en el directorio de caché del usuario, por directorio"""
+    try:
+        with io.open(get_cachedir(INDEXNAME), 'r', encoding='utf-8') as ff:
+            indices = json.load(ff)
+    except (IOError, OSError, ValueError):
+        indices = {}
+    return indices if isinstance(indices, dict) else {}
+
+def _leeindice(directorio):
+    """Índice guardado de un directorio (en memoria o en disco)"""
+    if directorio in _INDICES:
+        return _INDICES[directorio]
+    return _leeindices().get(directorio, {})
+
+def _guardaindice(directorio, indice):
+    """Guarda el índice de un directorio, en memoria y en disco si es posible
+
+    Se conservan los índices de otros directorios guardados en disco.
+    """
+    _INDICES[directorio] = indice
+    indices = _leeindices()
+    indices[directorio] = indice
+    try:
+        if not os.path.isdir(get_cachedir()):
+            os.makedirs(get_cachedir())
+        with io.open(get_cachedir(INDEXNAME), 'w', encoding='utf-8') as ff:
+            ff.write(u'%s' % json.dumps(indices, ensure_ascii=False))
+    except (IOError, OSError):
+        pass
+
+def indicebin(directorio):
+    """Nombres de zona de los archivos .BIN de un directorio
+
+    Devuelve un diccionario indexado por nombre de archivo .BIN con la lista
+    de nombres de sus zonas. Solo se leen los archivos nuevos o modificados.
+    """
+    directorio = os.path.abspath(directorio)
+    anterior = _leeindice(directorio)
+    indice = {}
+    for nombre in os.listdir(directorio):
+        if not nombre.lower().endswith('.bin'):
+            continue
+        try:
+            stat = os.stat(os.path.join(directorio, nombre))
+        except OSError:
+            continue
+        entrada = anterior.get(nombre, None)
+        if entrada is None or entrada['mtime'] != stat.st_mtime or entrada['size'] != stat.st_size:
+            try:
+                zonas = leenombreszonas(os.path.join(directorio, nombre))
+            except (IOError, OSError, ValueError, IndexError, UnicodeDecodeError):
+                zonas = []
+            entrada = dict(mtime=stat.st_mtime, size=stat.st_size, zonas=zonas)
+        indice[nombre] = entrada
+    if indice != anterior:
+        _guardaindice(directorio, indice)
+    else:
+        _INDICES[directorio] = indice
+    return dict((nombre, entrada['zonas']) for (nombre, entrada) in indice.items())
+
+def _prioridadnombre(resfile, binfile):
+    """Prioridad según el nombre: mismo nombre que el .res, ResumenRCC_nombre.bin, otros"""
+    resname = os.path.splitext(os.path.basename(resfile))[0]
+    if binfile == resname + '.bin':
+        return 2
+    elif binfile == 'ResumenRCC_' + resname + '.bin':
+        return 1
+    return 0
+
+def buscabin(resfile, zonas):
+    """Localiza el archivo .BIN correspondiente a un archivo de resultados
+
+    resfile - Ruta del archivo de resultados
+    zonas - Nombres de las zonas del archivo de resultados
+
+    Se elige el .BIN del mismo directorio con mayor coincidencia de nombres
+    de zona (índice de Jaccard) y, a igualdad, el que tiene el mismo nombre
+    que el .res o se llama ResumenRCC_nombre.bin. Devuelve None si no hay
+    ningún .BIN con zonas comunes.
+    """
+    directorio = os.path.dirname(os.path.abspath(resfile))
+    zonas = set(zonas)
+    mejor, mejorclave = None, None
+    for binfile, binzonas in sorted(indicebin(directorio).items()):
+        binzonas = set(binzonas)
+        comunes = len(zonas & binzonas)
+        if not comunes:
+            continue
+        clave = (float(comunes) / len(zonas | binzonas),
+                 _prioridadnombre(resfile, binfile))
+        if mejorclave is None or clave > mejorclave:
+            mejor, mejorclave = binfile, clave
+    return os.path.join(directorio, mejor) if mejor is not None else None
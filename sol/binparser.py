@@ -22,9 +22,18 @@
 #   02110-1301, USA.#!/usr/bin/env python
 
 import io
+import os
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 
+from sol.estadisticas import EstadisticasCarga
+from sol.submuestreo import Piramide
+from sol.cargas import AnalisisCargas, UMBRALES
+from sol.confort import AnalisisConfort, SINCONSIGNA
+from sol.ventilacion import AnalisisVentilacion
+from sol import rts
+
 """Estructura de datos de zonas LIDER
 
 La estructura del formato está documentada en el archivo "esto2_nucleo.jar",
@@ -103,45 +112,399 @@ _ZONASTRUCT = np.dtype({'names': ['nombreZona', 'Area', 'Volumen', 'multiplicado
                                     ('f4', 8760)]},
                        align=True)
 
-def readBIN(filename='ResumenRCC.bin'):
-    """Genera dataframes a partir de archivo LIDER con información de zonas"""
+def mapBIN(filename='ResumenRCC.bin'):
+    """Proyecta en memoria (memmap) los registros de zonas de un archivo LIDER
+
+    Los datos no se leen del disco hasta que se accede a ellos, de modo que
+    pueden procesarse archivos grandes por bloques de zonas.
+    """
+    return np.memmap(filename, dtype=_ZONASTRUCT, mode='r', offset=4)
+
+def nombreszonas(rawdata):
+    """Lista de nombres de zona de un array de registros de zonas"""
+    return [nombre.decode().strip('"') for nombre in rawdata['nombreZona']]
+
+def leenombreszonas(filename):
+    """Nombres de zona de un archivo BIN de LIDER sin leer los datos horarios
+
+    Solamente se leen el número de zonas y el nombre de cada una de ellas.
+    Devuelve una lista vacía si el tamaño del archivo no corresponde al
+    número de zonas de su cabecera (no es un archivo BIN de LIDER).
+    """
+    itemsize = _ZONASTRUCT.itemsize
+    tamano = os.path.getsize(filename)
     with io.open(filename, "rb") as f:
-        f.seek(4) #No necesitamos leer explícitamente el número de zonas
-        rawdata = np.fromfile(f, dtype=_ZONASTRUCT)
-
-    # Información general de zonas
-    zidata = [dict(Nombre=zona['nombreZona'].decode().strip('"'),
-                   Area=zona['Area'],
-                   Volumen=zona['Volumen'],
-                   Multiplicador=zona['multiplicador'],
-                   **dict({'p%i' % i: p for (i, p) in enumerate(zona['p'])},
-                          **{'g%i' % i: g for (i, g) in enumerate(zona['g'])})
-                  ) for zona in rawdata]
-    zidf = pd.DataFrame(zidata)
-    zidf.set_index('Nombre', drop=True, inplace=True)
-
-    # Conectividades (UA con exterior y con zonas adyacentes)
-    zcdata = [dict(Nombre=zona['nombreZona'].decode().strip('"'),
-                   Ext=zona['UAext'],
-                   **{local.decode().strip('"'): zona['UAint'][i] for (i, local) in enumerate(zona['localAdyacente']) if local})
-              for zona in rawdata]
-    zcdf = pd.DataFrame(zcdata)
-    zcdf.set_index('Nombre', drop=True, inplace=True)
-
-    # Datos horarios de las zonas
-    zddata = [pd.DataFrame(dict(Nombre=zona['nombreZona'].decode().strip('"'),
-                                HasCal=zona['daCal'],
-                                HasRef=zona['daRef'],
-                                QSen=zona['QS'],
-                                QLat=zona['QL'],
-                                Temp=zona['Treal'],
-                                Tmax=zona['Tmax'],
-                                Tmin=zona['Tmin'],
-                                Vventinf=zona['Vventinf']))
-              for zona in rawdata]
-    zddf = pd.concat(zddata)
-
-    return zidf, zcdf, zddf
+        cabecera = f.read(4)
+        if len(cabecera) < 4:
+            return []
+        numzonas = int(np.frombuffer(cabecera, dtype='<i4')[0])
+        if numzonas < 0 or tamano != 4 + numzonas * itemsize:
+            return []
+        nombres = []
+        for izona in range(numzonas):
+            f.seek(4 + izona * itemsize)
+            nombre = f.read(50)
+            if len(nombre) < 50:
+                break
+            nombres.append(nombre.split(b'\0', 1)[0].decode().strip('"'))
+    return nombres
+
+def readBIN(filename='ResumenRCC.bin', estadisticas=None):
+    """Genera dataframes a partir de archivo LIDER con información de zonas
+
+    estadisticas - EstadisticasCarga que se rellena con los datos de la lectura
+                   (ver DatosHorarios.desdeBIN), añadiendo la fase dataframes
+    """
+    hook = None
+    if estadisticas is not None:
+        # Se llama al hook al terminar la lectura completa
+        hook, estadisticas.hook = estadisticas.hook, None
+    datos = DatosHorarios.desdeBIN(filename, estadisticas=estadisticas)
+    if estadisticas is None:
+        return datos.dataframes()
+    with estadisticas.fase('dataframes'):
+        dataframes = datos.dataframes()
+    estadisticas.hook = hook
+    estadisticas.termina()
+    return dataframes
+
+VARIABLESHORARIAS = ('daCal', 'daRef', 'QS', 'QL', 'Treal', 'Tmax', 'Tmin', 'Vventinf')
+VARIABLESZONA = ('Area', 'Volumen', 'multiplicador', 'p', 'g', 'UAext', 'UAint')
+# Variables cuyo rango en todas las zonas se calcula al cargar los datos
+VARIABLESRANGO = ('Treal', 'QS')
+
+def _clavegrupos(grupos):
+    """Clave de un diccionario de grupos de zonas"""
+    return tuple((nombre, tuple(zonas)) for (nombre, zonas) in grupos.items())
+
+def _agrupaconsigna(pesos, consignas, sinconsigna):
+    """Consignas de grupos (grupos x horas) como media de las de sus zonas con consigna
+
+    pesos - Matriz grupos x zonas de pesos de cada zona (p.e. volumen)
+    consignas - Array zonas x horas de consignas. Los valores de más de
+                SINCONSIGNA en valor absoluto indican horas sin consigna.
+    sinconsigna - Valor de los grupos en las horas en las que ninguna de
+                  sus zonas tiene consigna (p.e. 99 para Tmax)
+    """
+    consignas = np.asarray(consignas, dtype=float)
+    conconsigna = np.abs(consignas) < SINCONSIGNA
+    pesoconsigna = np.dot(pesos, conconsigna)
+    suma = np.dot(pesos, np.where(conconsigna, consignas, 0.0))
+    return np.where(pesoconsigna > 0, suma / np.maximum(pesoconsigna, np.finfo(float).tiny),
+                    sinconsigna).astype(np.float32)
+
+def _localesadyacentes(locales):
+    """Nombres de los locales adyacentes de una zona conservando su posición
+
+    Las posiciones vacías se guardan como '' y se omiten las finales.
+    """
+    nombres = [local.decode().strip('"') if local else '' for local in locales]
+    while nombres and not nombres[-1]:
+        nombres.pop()
+    return nombres
+
+class DatosHorarios(object):
+    """Datos de zonas de un archivo BIN de LIDER organizados por variables
+
+    A diferencia de readBIN, que genera un DataFrame con todas las zonas
+    concatenadas, guarda cada variable en un array de zonas x horas, de modo
+    que los datos de una zona son una fila y las operaciones sobre todas las
+    zonas se pueden vectorizar.
+
+    nombres - Lista de nombres de las zonas
+    adyacentes - Lista con los nombres de los locales adyacentes de cada zona,
+                 en la posición de su valor en UAint ('' en las posiciones vacías)
+    zonas - Diccionario de arrays con datos generales de zona (VARIABLESZONA)
+    horarios - Diccionario de arrays zonas x 8760 de datos horarios (VARIABLESHORARIAS)
+    """
+    def __init__(self, nombres, adyacentes, zonas, horarios):
+        self.nombres = list(nombres)
+        self.adyacentes = [list(locales) for locales in adyacentes]
+        self.zonas = zonas
+        self.horarios = horarios
+        self._indice = dict((nombre, i) for (i, nombre) in enumerate(self.nombres))
+        self._diarios = {}
+        self._rangos = {}
+        self._piramides = {}
+        self._diariaszonas = {}
+        self._agrupados = {}
+        self._cargas = {}
+        self._confort = {}
+        self._ventilacion = None
+        self._cargaequipos = None
+
+    @classmethod
+    def desdeBIN(cls, filename='ResumenRCC.bin', copia=True, estadisticas=None):
+        """Lee los datos de zonas de un archivo BIN de LIDER
+
+        Con copia=False los arrays son vistas del archivo proyectado en
+        memoria, que solo se leen del disco al acceder a cada zona.
+
+        estadisticas - EstadisticasCarga que se rellena con los datos de la
+                       lectura (bytes leídos, zonas y tiempos de las fases de
+                       lectura y conversión)
+        """
+        est = estadisticas if estadisticas is not None else EstadisticasCarga()
+        with est.fase('lectura'):
+            rawdata = mapBIN(filename)
+            conversion = np.array if copia else (lambda x: x)
+            zonas = dict((var, conversion(rawdata[var])) for var in VARIABLESZONA)
+            horarios = dict((var, conversion(rawdata[var])) for var in VARIABLESHORARIAS)
+        with est.fase('conversion'):
+            nombres = nombreszonas(rawdata)
+            adyacentes = [_localesadyacentes(locales) for locales in rawdata['localAdyacente']]
+        datos = cls(nombres, adyacentes, zonas, horarios)
+        if estadisticas is not None:
+            if estadisticas.archivo is None:
+                estadisticas.archivo = filename
+            # Sin copia solo se leen los nombres de zonas y locales adyacentes
+            estadisticas.bytes = 4 + (rawdata.nbytes if copia else
+                                      len(nombres) * (rawdata.dtype['nombreZona'].itemsize +
+                                                      rawdata.dtype['localAdyacente'].itemsize))
+            estadisticas.zonas = len(nombres)
+            estadisticas.termina()
+        return datos
+
+    def indice(self, nombre):
+        """Índice de la zona de nombre dado"""
+        return self._indice[nombre]
+
+    def __contains__(self, nombre):
+        return nombre in self._indice
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def zona(self, nombre, variable):
+        """Serie horaria de una variable para una zona"""
+        return self.horarios[variable][self._indice[nombre]]
+
+    def mapa(self, nombre, variable):
+        """Valores horarios de una zona como array días x horas (365 x 24)
+
+        Es una vista de los datos, sin copia.
+        """
+        return self.zona(nombre, variable)[:365 * 24].reshape(365, 24)
+
+    def diarios(self, nombre):
+        """Valores diarios de una zona (365 días), que se guardan una vez calculados
+
+        Devuelve un diccionario con temperaturas media, mínima y máxima
+        (Tmed, Tmin, Tmax) y valores medios de cargas sensible y latente y de
+        caudal de ventilación e infiltraciones (QS, QL, Vventinf).
+        """
+        if nombre not in self._diarios:
+            dias = lambda variable: self.mapa(nombre, variable)
+            treal = dias('Treal')
+            self._diarios[nombre] = dict(Tmed=treal.mean(axis=1),
+                                         Tmin=treal.min(axis=1),
+                                         Tmax=treal.max(axis=1),
+                                         QS=dias('QS').mean(axis=1),
+                                         QL=dias('QL').mean(axis=1),
+                                         Vventinf=dias('Vventinf').mean(axis=1))
+        return self._diarios[nombre]
+
+    def diariaszonas(self, variable):
+        """Valores medios diarios de una variable horaria en todas las zonas (zonas x 365)
+
+        La variable puede ser una suma de variables horarias (p.e. 'QS+QL').
+        Los valores se guardan una vez calculados.
+        """
+        if variable not in self._diariaszonas:
+            datos = sum(self.horarios[var][:, :365 * 24] for var in variable.split('+'))
+            self._diariaszonas[variable] = datos.reshape(len(self), 365, 24).mean(axis=2)
+        return self._diariaszonas[variable]
+
+    def agrupa(self, grupos):
+        """Datos horarios agregados de grupos de zonas (p.e. plantas o edificio)
+
+        grupos - Diccionario ordenado de nombres de grupo y listas de nombres
+                 de zonas (se ignoran las zonas sin datos horarios)
+
+        Devuelve un DatosHorarios en el que cada grupo es una zona con:
+        - cargas QS y QL y caudal Vventinf: sumas de las zonas ponderadas por
+          su multiplicador
+        - temperatura Treal: media ponderada por el volumen de las zonas
+          (incluido su multiplicador)
+        - consignas Tmax y Tmin: media ponderada por el volumen de las zonas
+          con consigna en cada hora. Sin ninguna, la de la hora sin consigna
+          (ver confort.SINCONSIGNA)
+        - indicadores de demanda daCal y daRef: fracción del volumen con demanda
+        - Area, Volumen y UAext: sumas ponderadas por el multiplicador
+        No incluye datos que no se pueden agregar (p, g, UAint y locales adyacentes).
+
+        Se obtiene aplicando matrices de agrupación grupos x zonas a los
+        arrays zonas x horas y se guarda una vez calculado.
+        """
+        clave = _clavegrupos(grupos)
+        if clave not in self._agrupados:
+            suma = self.matrizgrupos(grupos)
+            volumen = suma * self.zonas['Volumen']
+            media = volumen / np.maximum(volumen.sum(axis=1), np.finfo(float).tiny)[:, None]
+            matrices = dict(QS=suma, QL=suma, Vventinf=suma, Treal=media,
+                            daCal=media, daRef=media)
+            horarios = dict((var, np.dot(matriz, self.horarios[var]).astype(np.float32))
+                            for (var, matriz) in matrices.items())
+            for var, sinconsigna in (('Tmax', 99.0), ('Tmin', -99.0)):
+                horarios[var] = _agrupaconsigna(volumen, self.horarios[var], sinconsigna)
+            zonas = dict((var, np.dot(suma, self.zonas[var]))
+                         for var in ('Area', 'Volumen', 'UAext'))
+            zonas['multiplicador'] = np.ones(len(grupos), dtype=self.zonas['multiplicador'].dtype)
+            self._agrupados[clave] = DatosHorarios(list(grupos), [[] for grupo in grupos],
+                                                   zonas, horarios)
+        return self._agrupados[clave]
+
+    def matrizgrupos(self, grupos):
+        """Matriz grupos x zonas con el multiplicador de las zonas de cada grupo
+
+        grupos - Diccionario ordenado de nombres de grupo y listas de nombres
+                 de zonas (se ignoran las zonas sin datos horarios)
+        """
+        pertenencia = np.zeros((len(grupos), len(self)))
+        for i, zonas in enumerate(grupos.values()):
+            pertenencia[i, [self._indice[zona] for zona in zonas if zona in self._indice]] = 1.0
+        return pertenencia * self.zonas['multiplicador'].astype(float)
+
+    def confort(self, grupos=None):
+        """Horas y grados hora fuera de consigna (AnalisisConfort) de zonas o grupos
+
+        grupos - Diccionario ordenado de nombres de grupo y listas de nombres
+                 de zonas, cuyos resultados son la suma de los de sus zonas
+                 (teniendo en cuenta su multiplicador). Con None, de las zonas.
+
+        Se guardan una vez calculados.
+        """
+        clave = None if grupos is None else _clavegrupos(grupos)
+        if clave not in self._confort:
+            if grupos is None:
+                self._confort[clave] = AnalisisConfort.desdehorarios(self)
+            else:
+                self._confort[clave] = self.confort().agrupa(list(grupos), self.matrizgrupos(grupos))
+        return self._confort[clave]
+
+    def ventilacion(self):
+        """Renovaciones hora de las zonas (AnalisisVentilacion), que se guardan una vez calculadas"""
+        if self._ventilacion is None:
+            self._ventilacion = AnalisisVentilacion(self)
+        return self._ventilacion
+
+    def cargaequipos(self):
+        """Carga sensible sobre los equipos de las zonas (zonas x 8760) [W]
+
+        Se obtiene con los factores de respuesta p y g de las zonas (ver
+        rts.cargaequipos) y se guarda una vez calculada.
+        """
+        if self._cargaequipos is None:
+            self._cargaequipos = rts.cargaequipos(self)
+        return self._cargaequipos
+
+    def cargas(self, umbrales=UMBRALES):
+        """Cargas punta y curvas de duración de carga de las zonas (AnalisisCargas)
+
+        Se guardan una vez calculadas para cada conjunto de umbrales [W/m²].
+        """
+        umbrales = tuple(umbrales)
+        if umbrales not in self._cargas:
+            self._cargas[umbrales] = AnalisisCargas(self, umbrales)
+        return self._cargas[umbrales]
+
+    def piramide(self, nombre, variable):
+        """Piramide de mínimos y máximos de una variable horaria de una zona
+
+        La variable puede ser una suma de variables horarias (p.e. 'QS+QL').
+        Las pirámides se guardan una vez calculadas.
+        """
+        clave = (nombre, variable)
+        if clave not in self._piramides:
+            valores = sum(self.zona(nombre, var) for var in variable.split('+'))
+            self._piramides[clave] = Piramide(valores)
+        return self._piramides[clave]
+
+    @property
+    def proyectado(self):
+        """Indica si los datos son vistas del archivo proyectado en memoria (ver desdeBIN)"""
+        return any(isinstance(datos, np.memmap) for datos in self.horarios.values())
+
+    def rango(self, variable, nombre=None):
+        """Valores mínimo y máximo de una variable horaria en todas las zonas
+
+        Se guardan una vez calculados. Si no se han calculado y los datos
+        están proyectados en memoria, para no leer el archivo completo se
+        devuelven los de la zona nombre (de su pirámide), si se indica.
+        """
+        if variable not in self._rangos:
+            if nombre is not None and self.proyectado:
+                paso, minimos, maximos = self.piramide(nombre, variable).niveles[-1]
+                return minimos.min(), maximos.max()
+            datos = self.horarios[variable]
+            self._rangos[variable] = (datos.min(), datos.max())
+        return self._rangos[variable]
+
+    @property
+    def nbytes(self):
+        """Tamaño de los arrays de datos y de los valores derivados calculados [bytes]"""
+        return (sum(array.nbytes for array in self.zonas.values()) +
+                sum(array.nbytes for array in self.horarios.values()) +
+                sum(array.nbytes for diarios in list(self._diarios.values())
+                    for array in diarios.values()) +
+                sum(piramide.nbytes for piramide in list(self._piramides.values())) +
+                sum(array.nbytes for array in list(self._diariaszonas.values())) +
+                sum(agrupados.nbytes for agrupados in list(self._agrupados.values())) +
+                sum(cargas.nbytes for cargas in list(self._cargas.values())) +
+                sum(confort.nbytes for confort in list(self._confort.values())) +
+                (self._ventilacion.nbytes if self._ventilacion is not None else 0) +
+                (self._cargaequipos.nbytes if self._cargaequipos is not None else 0))
+
+    def arrays(self):
+        """Cabecera (diccionario) y arrays (diccionario ordenado) de los datos"""
+        cabecera = dict(nombres=self.nombres, adyacentes=self.adyacentes)
+        arrays = OrderedDict([('zona_' + var, self.zonas[var]) for var in VARIABLESZONA] +
+                             [(var, self.horarios[var]) for var in VARIABLESHORARIAS])
+        return cabecera, arrays
+
+    def dataframes(self):
+        """Dataframes de información general, conectividades y datos horarios
+
+        Devuelve los mismos dataframes que readBIN.
+        """
+        nombres = self.nombres
+        zonas = self.zonas
+
+        # Información general de zonas
+        columnas = OrderedDict([('Area', zonas['Area']),
+                                ('Volumen', zonas['Volumen']),
+                                ('Multiplicador', zonas['multiplicador'])])
+        columnas.update(('p%i' % i, zonas['p'][:, i]) for i in range(zonas['p'].shape[1]))
+        columnas.update(('g%i' % i, zonas['g'][:, i]) for i in range(zonas['g'].shape[1]))
+        zidf = pd.DataFrame(columnas, index=pd.Index(nombres, name='Nombre'))
+
+        # Conectividades (UA con exterior y con zonas adyacentes)
+        zcdata = [dict(Ext=zonas['UAext'][iz],
+                       **{local: zonas['UAint'][iz][i] for (i, local) in enumerate(locales) if local})
+                  for (iz, locales) in enumerate(self.adyacentes)]
+        zcdf = pd.DataFrame(zcdata, index=pd.Index(nombres, name='Nombre'))
+
+        # Datos horarios de las zonas
+        horarios = self.horarios
+        nhoras = horarios['QS'].shape[1]
+        zddf = pd.DataFrame(OrderedDict([('Nombre', np.repeat(nombres, nhoras)),
+                                         ('HasCal', horarios['daCal'].ravel()),
+                                         ('HasRef', horarios['daRef'].ravel()),
+                                         ('QSen', horarios['QS'].ravel()),
+                                         ('QLat', horarios['QL'].ravel()),
+                                         ('Temp', horarios['Treal'].ravel()),
+                                         ('Tmax', horarios['Tmax'].ravel()),
+                                         ('Tmin', horarios['Tmin'].ravel()),
+                                         ('Vventinf', horarios['Vventinf'].ravel())]),
+                            index=np.tile(np.arange(nhoras), len(nombres)))
+        return zidf, zcdf, zddf
+
+    @classmethod
+    def desdearrays(cls, cabecera, arrays):
+        """Reconstruye los datos a partir de cabecera y arrays (sin copiarlos)"""
+        zonas = dict((var, arrays['zona_' + var]) for var in VARIABLESZONA)
+        horarios = dict((var, arrays[var]) for var in VARIABLESHORARIAS)
+        return cls(cabecera['nombres'], cabecera['adyacentes'], zonas, horarios)
 
 def saveBINdata(zi, zc, zd):
     "Guarda en disco datos de zonas de LIDER"
@@ -167,7 +530,6 @@ def saveBINdata(zi, zc, zd):
                     columns=('HasCal HasRef QLat QSen Temp Tmax Tmin Vventinf').split())
 
 if __name__ == '__main__':
-    import os
     import argparse
 
     usage = """%(prog)s [opciones] archivo.bin
@@ -181,13 +543,17 @@ if __name__ == '__main__':
     parser.add_argument('-i', '--info', action='store_true', help=u"Muestra información general de zonas")
     parser.add_argument('-c', '--conectividades', action='store_true', help=u"Muestra conectividades de zonas")
     parser.add_argument('-d', '--datoshorarios', action='store_true', help=u"Muestra datos horarios de zonas")
+    parser.add_argument('-e', '--estadisticas', action='store_true', help=u"Muestra estadísticas de lectura")
 
     args = parser.parse_args()
 
     binpath = args.binpath
     if os.path.exists(binpath):
-        zi, zc, zd = readBIN(binpath)
+        estadisticas = EstadisticasCarga()
+        zi, zc, zd = readBIN(binpath, estadisticas)
         print(u"Leído archivo %s (%i zonas, %i vínculos, %i datos)" % (binpath, len(zi), len(zc), len(zd)))
+        if args.estadisticas:
+            print(estadisticas.resumen())
         if args.save:
             saveBINdata(zi, zc, zd)
         if args.info:
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   cargas.py
+#   Cargas punta y curvas de duración de carga
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Cargas punta y curvas de duración de carga
+
+A partir de los datos horarios de un archivo BIN (DatosHorarios) se obtienen,
+para todas las zonas a la vez, las cargas sensible, latente y total máximas
+(refrigeración) y mínimas (calefacción) y su hora, las curvas de duración de
+carga (valores horarios ordenados de mayor a menor) y las horas en las que la
+carga total por superficie supera, en valor absoluto, unos umbrales.
+
+Aplicado a los datos agregados (DatosHorarios.agrupa) da los mismos
+resultados para plantas y edificio. Los resultados se pueden exportar a CSV
+o JSON (ver filas, exportacsv y exportajson).
+
+Ejemplo:
+
+    python -m sol.cargas ResumenRCC.bin -c cargas.csv
+"""
+
+import datetime
+import io
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+# Cargas analizadas y variables horarias que las componen
+CARGAS = OrderedDict([('QS', ('QS',)), ('QL', ('QL',)), ('QT', ('QS', 'QL'))])
+# Umbrales de carga total por superficie por defecto [W/m²]
+UMBRALES = (25.0, 50.0, 100.0)
+
+def umbrales(config):
+    """Umbrales de carga total [W/m²] de la opción umbralescarga (valores separados por comas)"""
+    valor = config.get('umbralescarga', None)
+    if not valor:
+        return UMBRALES
+    return tuple(float(umbral) for umbral in valor.split(','))
+
+def fechahora(hora):
+    """Fecha y hora (dd/mm hh:00) de una hora del año (0 a 8759)"""
+    fecha = datetime.datetime(2007, 1, 1) + datetime.timedelta(hours=int(hora))
+    return u'%02i/%02i %02i:00' % (fecha.day, fecha.month, fecha.hour)
+
+class AnalisisCargas(object):
+    """Cargas punta, curvas de duración y horas sobre umbrales de un DatosHorarios
+
+    nombres - Nombres de las zonas (o grupos de zonas)
+    area - Superficie de cada zona [m²]
+    umbrales - Umbrales de carga total por superficie [W/m²]
+    maximos, minimos - Diccionarios de arrays con la carga máxima y mínima de
+                       cada zona para cada carga de CARGAS [W]
+    horasmaximo, horasminimo - Diccionarios de arrays con la hora del año del
+                               máximo y del mínimo de cada zona
+    curvas - Diccionario de arrays zonas x 8760 con los valores horarios de
+             cada carga ordenados de mayor a menor [W]
+    horasumbral - Array zonas x umbrales con las horas en las que la carga
+                  total por superficie supera cada umbral en valor absoluto
+    """
+    def __init__(self, horarios, umbrales=UMBRALES):
+        self.nombres = list(horarios.nombres)
+        self.area = np.asarray(horarios.zonas['Area'], dtype=float)
+        self.umbrales = tuple(umbrales)
+        self._indice = dict((nombre, i) for (i, nombre) in enumerate(self.nombres))
+        self.maximos = OrderedDict()
+        self.minimos = OrderedDict()
+        self.horasmaximo = OrderedDict()
+        self.horasminimo = OrderedDict()
+        self.curvas = OrderedDict()
+        for carga, variables in CARGAS.items():
+            datos = sum(horarios.horarios[var] for var in variables)
+            # Una sola ordenación por fila da la curva de duración y sus extremos
+            orden = np.argsort(datos, axis=1)[:, ::-1]
+            curva = np.take_along_axis(datos, orden, axis=1)
+            self.curvas[carga] = curva
+            self.maximos[carga] = curva[:, 0]
+            self.minimos[carga] = curva[:, -1]
+            self.horasmaximo[carga] = orden[:, 0]
+            self.horasminimo[carga] = orden[:, -1]
+        densidad = np.abs(self.curvas['QT']) / np.maximum(self.area, 1e-6)[:, None]
+        self.horasumbral = np.zeros((len(self.nombres), len(self.umbrales)), dtype=int)
+        for j, umbral in enumerate(self.umbrales):
+            self.horasumbral[:, j] = np.count_nonzero(densidad > umbral, axis=1)
+
+    def indice(self, nombre):
+        """Índice de la zona de nombre dado"""
+        return self._indice[nombre]
+
+    def __contains__(self, nombre):
+        return nombre in self._indice
+
+    def curva(self, nombre, carga='QT'):
+        """Curva de duración de una carga de una zona (valores de mayor a menor) [W]"""
+        return self.curvas[carga][self._indice[nombre]]
+
+    @property
+    def nbytes(self):
+        """Tamaño de las curvas de duración [bytes]"""
+        return sum(curva.nbytes for curva in self.curvas.values())
+
+    def filas(self, tipo=u'zona'):
+        """Lista de diccionarios ordenados con los resultados de cada zona
+
+        tipo - Texto de la columna tipo (zona, planta, edificio...). Puede ser
+               un diccionario de nombres y tipos.
+        """
+        filas = []
+        for i, nombre in enumerate(self.nombres):
+            fila = OrderedDict([('nombre', nombre),
+                                ('tipo', tipo.get(nombre, u'') if isinstance(tipo, dict) else tipo),
+                                ('area', round(float(self.area[i]), 2))])
+            for carga in CARGAS:
+                fila[carga + '_max'] = round(float(self.maximos[carga][i]), 2)
+                fila[carga + '_hora_max'] = fechahora(self.horasmaximo[carga][i])
+                fila[carga + '_min'] = round(float(self.minimos[carga][i]), 2)
+                fila[carga + '_hora_min'] = fechahora(self.horasminimo[carga][i])
+            for j, umbral in enumerate(self.umbrales):
+                fila['horas_QT_%g' % umbral] = int(self.horasumbral[i, j])
+            filas.append(fila)
+        return filas
+
+def exportacsv(filas, filename):
+    """Guarda una lista de filas (diccionarios ordenados) como CSV (UTF-8)"""
+    def formato(valor):
+        if isinstance(valor, (int, float)):
+            return u'%s' % valor
+        return u'"%s"' % valor.replace(u'"', u'""')
+    with io.open(filename, 'w', encoding='utf-8') as ff:
+        if filas:
+            ff.write(u','.join(formato(u'%s' % clave) for clave in filas[0]) + u'\n')
+        for fila in filas:
+            ff.write(u','.join(formato(valor) for valor in fila.values()) + u'\n')
+
+def exportajson(filas, filename):
+    """Guarda una lista de filas (diccionarios ordenados) como JSON (UTF-8)"""
+    with io.open(filename, 'w', encoding='utf-8') as ff:
+        ff.write(u'%s' % json.dumps(filas, indent=1))
+
+if __name__ == '__main__':
+    import argparse
+    from sol.binparser import DatosHorarios
+
+    parser = argparse.ArgumentParser(description=u'Cargas punta y horas sobre umbrales de un archivo BIN de LIDER')
+    parser.add_argument('binfile', action="store", default='ResumenRCC.bin')
+    parser.add_argument('-u', '--umbrales', action="store", default=None,
+                        help=u'Umbrales de carga total [W/m²] separados por comas')
+    parser.add_argument('-c', '--csv', action="store", default=None, help=u'Archivo CSV de salida')
+    parser.add_argument('-j', '--json', action="store", default=None, help=u'Archivo JSON de salida')
+    params = parser.parse_args()
+
+    analisis = AnalisisCargas(DatosHorarios.desdeBIN(params.binfile),
+                              umbrales(dict(umbralescarga=params.umbrales)))
+    filas = analisis.filas()
+    if params.csv:
+        exportacsv(filas, params.csv)
+    if params.json:
+        exportajson(filas, params.json)
+    if not (params.csv or params.json):
+        for fila in filas:
+            print(u'%s: QT máx. %.0f W (%s), mín. %.0f W (%s)' % (fila['nombre'],
+                                                                  fila['QT_max'], fila['QT_hora_max'],
+                                                                  fila['QT_min'], fila['QT_hora_min']))
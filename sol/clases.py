@@ -29,19 +29,33 @@ def cached_property(function):
     """Propiedad cacheada
 
     Receta de: http://code.activestate.com/recipes/576563-cached-property/
+
+    Los valores se guardan en el diccionario _property_cache del objeto,
+    indexados por el nombre de la propiedad.
     """
+    name = function.__name__
     def get(self):
         try:
-            return self._property_cache[function]
+            return self._property_cache[name]
         except AttributeError:
             self._property_cache = {}
-            x = self._property_cache[function] = function(self)
+            x = self._property_cache[name] = function(self)
             return x
         except KeyError:
-            x = self._property_cache[function] = function(self)
+            x = self._property_cache[name] = function(self)
             return x
     return property(get)
 
+def cached_value(obj, name):
+    """Valor cacheado de la propiedad name de obj o None si no se ha calculado"""
+    return getattr(obj, '_property_cache', {}).get(name, None)
+
+def invalidate_cache(obj, *names):
+    """Elimina de la caché de obj los valores de las propiedades indicadas"""
+    cache = getattr(obj, '_property_cache', {})
+    for name in names:
+        cache.pop(name, None)
+
 GRUPOSLIDER = [u'Paredes Exteriores', u'Cubiertas', u'Suelos',
                u'Puentes Térmicos', u'Solar Ventanas',
                u'Transmisión Ventanas', u'Fuentes Internas',
@@ -75,6 +89,9 @@ class EdificioLIDER(OrderedDict):
         self.calefaccion_meses = []
         self.refrigeracion_meses = []
         self.resdata = ''
+        self.factores = OrderedDict()
+        # Demandas originales, antes de aplicar factores
+        self._demandas0 = None
 
     @property
     def zonas(self):
@@ -116,6 +133,71 @@ class EdificioLIDER(OrderedDict):
         d['grupos'] = self.grupos.keys() # mismos elementos que self.gruposlider
         return d
 
+    def aplicafactor(self, nombre, factor):
+        """Aplica un factor de escala a un grupo o componente de todas las zonas
+
+        nombre - Nombre del grupo (p.e. u'Puentes Térmicos') o del componente
+        factor - Factor de escala respecto a los valores originales (1.0 los
+                 restablece)
+
+        Los totales de plantas y edificio no se recalculan desde cero sino que
+        se les suma la variación de las zonas afectadas.
+
+        Devuelve la lista de zonas modificadas.
+        """
+        if factor == 1.0:
+            self.factores.pop(nombre, None)
+        else:
+            self.factores[nombre] = factor
+        modificadas = []
+        for planta in self.values():
+            for zona in planta.values():
+                deltas = zona.aplicafactor(nombre, factor)
+                if deltas is None:
+                    continue
+                modificadas.append(zona)
+                planta.propaga(zona, *deltas)
+                self.propaga(zona, *deltas)
+        return modificadas
+
+    def propaga(self, zona, dgrupos, dcal, dref):
+        """Suma al edificio la variación de flujos y demandas de una zona"""
+        if self._demandas0 is None:
+            self._demandas0 = self.demandasoriginales()
+        peso = zona.superficie * zona.multiplicador / self.superficie
+        grupos = cached_value(self, 'grupos')
+        if grupos is not None:
+            for grupo, delta in dgrupos.items():
+                grupos[grupo] = grupos[grupo] + peso * delta
+        self.calefaccion_meses = list(numpy.array(self.calefaccion_meses) + peso * dcal)
+        self.refrigeracion_meses = list(numpy.array(self.refrigeracion_meses) + peso * dref)
+        self.calefaccion += peso * dcal.sum()
+        self.refrigeracion += peso * dref.sum()
+        invalidate_cache(self, 'demandas')
+
+    def calculaagregados(self):
+        """Calcula las demandas agregadas del edificio y de sus plantas
+
+        Los valores quedan guardados en las propiedades cacheadas.
+        """
+        self.demandas
+        for planta in self.values():
+            planta.demandas
+            planta.calefaccion_meses
+            planta.refrigeracion_meses
+
+    def demandasoriginales(self):
+        """Demandas del edificio antes de aplicar factores de escala
+
+        Devuelve una tupla con las demandas anuales de calefacción y
+        refrigeración y los arrays de demandas mensuales.
+        """
+        if self._demandas0 is not None:
+            return self._demandas0
+        return (self.calefaccion, self.refrigeracion,
+                numpy.array(self.calefaccion_meses, dtype=float),
+                numpy.array(self.refrigeracion_meses, dtype=float))
+
     def minmaxgrupos(self):
         """Flujo máximo y mínimo de grupos en todas las zonas del edificio  [kW/m²·año]"""
         zonas = self.zonas
@@ -231,6 +313,27 @@ class PlantaLIDER(OrderedDict):
         d['grupos'] = self.grupos.keys()
         return d
 
+    def propaga(self, zona, dgrupos, dcal, dref):
+        """Suma a la planta la variación de flujos y demandas de una zona
+
+        Solo se actualizan los valores ya calculados. El resto se obtendrá a
+        partir de las zonas modificadas cuando se soliciten.
+        """
+        superficieplanta = self.superficie
+        grupos = cached_value(self, 'grupos')
+        if grupos is not None:
+            peso = zona.superficie * zona.multiplicador / superficieplanta
+            for grupo, delta in dgrupos.items():
+                grupos[grupo] = grupos[grupo] + peso * delta
+        peso = zona.superficie / superficieplanta
+        calmeses = cached_value(self, 'calefaccion_meses')
+        if calmeses is not None:
+            calmeses += peso * dcal
+        refmeses = cached_value(self, 'refrigeracion_meses')
+        if refmeses is not None:
+            refmeses += peso * dref
+        invalidate_cache(self, 'demandas')
+
 
 class ZonaLIDER(OrderedDict):
     """Zona de edificio de LIDER
@@ -269,6 +372,8 @@ class ZonaLIDER(OrderedDict):
         # Calef. positivo, Calef. negativo, Calef. neto
         # Ref. poisitivo, Ref. negativo, Ref. neto
         self.grupos = None
+        # Demandas originales, antes de aplicar factores
+        self._demandas0 = None
 
     @cached_property
     def demandas(self):
@@ -280,6 +385,62 @@ class ZonaLIDER(OrderedDict):
          d['ref+'], d['ref-'], d['ref']) = zip(*data)
         return d
 
+    def aplicafactor(self, nombre, factor):
+        """Aplica un factor de escala a un grupo o componente de la zona
+
+        La variación del grupo o componente se suma también al grupo TOTAL.
+        Las variaciones de componentes solo afectan al TOTAL, ya que no se
+        conoce el grupo al que pertenecen.
+
+        Las demandas mensuales se estiman escalando las originales en la
+        misma proporción que los flujos netos del grupo TOTAL.
+
+        Devuelve None si la zona no contiene el grupo o componente o una tupla
+        con las variaciones de los flujos por grupo (diccionario) y de las
+        demandas mensuales de calefacción y refrigeración.
+        """
+        if nombre in self.grupos and nombre != u'TOTAL':
+            elemento = self.grupos[nombre]
+        elif nombre in self:
+            elemento = self[nombre]
+        else:
+            return None
+        delta = elemento.escala(factor)
+        dgrupos = OrderedDict()
+        if elemento is self.grupos.get(nombre, None):
+            dgrupos[nombre] = delta
+        total = self.grupos[u'TOTAL']
+        total.setvalues(numpy.array(total.values) + delta)
+        dgrupos[u'TOTAL'] = delta
+
+        if self._demandas0 is None:
+            self._demandas0 = self.demandasoriginales()
+        calmeses0, refmeses0 = self._demandas0[2:]
+        calnet0, refnet0 = total.valores0[2], total.valores0[5]
+        kcal = max(0.0, total.values[2] / calnet0) if calnet0 else 1.0
+        kref = max(0.0, total.values[5] / refnet0) if refnet0 else 1.0
+        calmeses, refmeses = calmeses0 * kcal, refmeses0 * kref
+        dcal = calmeses - numpy.array(self.calefaccion_meses, dtype=float)
+        dref = refmeses - numpy.array(self.refrigeracion_meses, dtype=float)
+        self.calefaccion_meses = calmeses
+        self.refrigeracion_meses = refmeses
+        self.calefaccion += dcal.sum()
+        self.refrigeracion += dref.sum()
+        invalidate_cache(self, 'demandas')
+        return dgrupos, dcal, dref
+
+    def demandasoriginales(self):
+        """Demandas de la zona antes de aplicar factores de escala
+
+        Devuelve una tupla con las demandas anuales de calefacción y
+        refrigeración y los arrays de demandas mensuales.
+        """
+        if self._demandas0 is not None:
+            return self._demandas0
+        return (self.calefaccion, self.refrigeracion,
+                numpy.array(self.calefaccion_meses, dtype=float),
+                numpy.array(self.refrigeracion_meses, dtype=float))
+
 class ComponenteLIDER(object):
     """Componente del edificio en LIDER
 
@@ -297,6 +458,13 @@ class ComponenteLIDER(object):
         # Cmabio de formato en HULC
         nombre = u'Ventilación más Infiltración' if nombre == u'Infiltración' else nombre
         self.nombre = nombre
+        self.setvalues((calpos, calneg, calnet, refpos, refneg, refnet))
+        # Valores originales, antes de aplicar factores de escala
+        self.valores0 = self.values
+
+    def setvalues(self, values):
+        """Cambia los flujos de energía del componente"""
+        calpos, calneg, calnet, refpos, refneg, refnet = [float(val) for val in values]
         self.values = (calpos, calneg, calnet, refpos, refneg, refnet)
         self.demandas = OrderedDict([('grupos', [self.nombre]),
                                      ('cal+', [calpos]),
@@ -305,3 +473,12 @@ class ComponenteLIDER(object):
                                      ('ref+', [refpos]),
                                      ('ref-', [refneg]),
                                      ('ref', [refnet])])
+
+    def escala(self, factor):
+        """Escala los flujos originales del componente
+
+        Devuelve la variación de los flujos respecto a los valores anteriores.
+        """
+        anterior = numpy.array(self.values)
+        self.setvalues(numpy.array(self.valores0) * factor)
+        return numpy.array(self.values) - anterior
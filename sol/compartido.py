@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   compartido.py
+#   Publicación de edificios y datos horarios en memoria compartida
+#
+#   Copyright (C) 2014-2015 Rafael Villar Burke <pachi@ietcc.csic.es>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#
+"""Edificios y datos horarios en memoria compartida entre procesos
+
+El proceso principal publica el edificio (en el formato de instantánea de
+sol.snapshot) y sus datos horarios (sol.binparser.DatosHorarios) en bloques
+de multiprocessing.shared_memory. Los procesos de análisis reciben un
+manejador con los nombres de los bloques y acceden a los arrays sin
+copiarlos, en lugar de volver a leer los archivos .res y .bin.
+
+Ejemplo:
+
+    with EdificioCompartido(edificio, horarios) as compartido:
+        resultados = mapzonas(analisis, compartido.manejador, nombres)
+
+donde analisis(datos, nombre) es una función de nivel de módulo que recibe
+un objeto con atributos edificio (SnapshotEdificio) y horarios
+(DatosHorarios) y el nombre de la zona a analizar.
+
+El proceso que publica es el propietario de los bloques y debe liberarlos
+con close() (o usando la instrucción with). Los procesos que se adjuntan
+no los eliminan al terminar.
+"""
+
+import atexit
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from sol.snapshot import arraysedificio, empaqueta, escribe, desempaqueta, SnapshotEdificio
+from sol.binparser import DatosHorarios
+
+Manejador = namedtuple('Manejador', ['edificio', 'horarios'])
+
+class BloqueCompartido(object):
+    """Bloque de memoria compartida con una cabecera y un conjunto de arrays"""
+    def __init__(self, shm, propietario):
+        self.shm = shm
+        self.propietario = propietario
+
+    @classmethod
+    def publica(cls, cabecera, arrays):
+        """Crea un bloque compartido y copia en él cabecera y arrays"""
+        total, partes = empaqueta(cabecera, arrays)
+        shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+        escribe(shm.buf, partes)
+        return cls(shm, True)
+
+    @classmethod
+    def adjunta(cls, nombre):
+        """Se adjunta a un bloque existente, sin hacerse responsable de eliminarlo"""
+        try:
+            shm = shared_memory.SharedMemory(name=nombre, track=False)
+        except TypeError:
+            # Python < 3.13: evitamos que el bloque se registre en el
+            # resource_tracker, que lo eliminaría al terminar este proceso
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                shm = shared_memory.SharedMemory(name=nombre)
+            finally:
+                resource_tracker.register = register
+        return cls(shm, False)
+
+    @property
+    def nombre(self):
+        return self.shm.name
+
+    def datos(self):
+        """Cabecera y arrays (vistas sin copia) del bloque"""
+        return desempaqueta(self.shm.buf)
+
+    def close(self):
+        """Cierra el bloque y, si es el propietario, lo elimina
+
+        Los arrays obtenidos con datos() no deben usarse tras cerrar el bloque.
+        """
+        if self.shm is None:
+            return
+        try:
+            self.shm.close()
+        except BufferError:
+            # Quedan vistas del bloque en uso. Se libera al destruirlas.
+            pass
+        if self.propietario:
+            self.shm.unlink()
+        self.shm = None
+
+class EdificioCompartido(object):
+    """Edificio y datos horarios publicados en memoria compartida
+
+    manejador - Nombres de los bloques, que se pasan a los procesos de análisis
+    """
+    def __init__(self, edificio, horarios=None):
+        self._bloques = []
+        try:
+            bloqueedificio = BloqueCompartido.publica(*arraysedificio(edificio))
+            self._bloques.append(bloqueedificio)
+            nombrehorarios = None
+            if horarios is not None:
+                bloquehorarios = BloqueCompartido.publica(*horarios.arrays())
+                self._bloques.append(bloquehorarios)
+                nombrehorarios = bloquehorarios.nombre
+        except Exception:
+            self.close()
+            raise
+        self.manejador = Manejador(bloqueedificio.nombre, nombrehorarios)
+
+    def close(self):
+        """Elimina los bloques compartidos"""
+        for bloque in self._bloques:
+            bloque.close()
+        self._bloques = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+class DatosAdjuntos(object):
+    """Edificio y datos horarios de un proceso de análisis, sin copia
+
+    edificio - SnapshotEdificio con los arrays del edificio
+    horarios - DatosHorarios o None si no se publicaron
+    """
+    def __init__(self, manejador):
+        self._bloques = []
+        bloque = BloqueCompartido.adjunta(manejador.edificio)
+        self._bloques.append(bloque)
+        self.edificio = SnapshotEdificio(*bloque.datos())
+        self.horarios = None
+        if manejador.horarios is not None:
+            bloque = BloqueCompartido.adjunta(manejador.horarios)
+            self._bloques.append(bloque)
+            self.horarios = DatosHorarios.desdearrays(*bloque.datos())
+
+    def close(self):
+        """Libera las vistas y se desconecta de los bloques"""
+        self.edificio = None
+        self.horarios = None
+        for bloque in self._bloques:
+            bloque.close()
+        self._bloques = []
+
+# Datos adjuntos en este proceso, por manejador, para adjuntarse una sola vez
+_ADJUNTOS = {}
+
+def adjunta(manejador):
+    """Datos compartidos de un manejador, adjuntándose la primera vez"""
+    manejador = Manejador(*manejador)
+    if manejador not in _ADJUNTOS:
+        _ADJUNTOS[manejador] = DatosAdjuntos(manejador)
+    return _ADJUNTOS[manejador]
+
+@atexit.register
+def _desconecta():
+    """Libera los datos adjuntos al terminar el proceso"""
+    for datos in _ADJUNTOS.values():
+        datos.close()
+    _ADJUNTOS.clear()
+
+def _ejecuta(funcion, manejador, nombre):
+    """Ejecuta un análisis de zona en un proceso de análisis"""
+    return funcion(adjunta(manejador), nombre)
+
+def mapzonas(funcion, manejador, nombres, procesos=None):
+    """Aplica funcion(datos, nombre) a cada zona en procesos de análisis
+
+    funcion - Función de nivel de módulo (serializable)
+    manejador - Manejador de un EdificioCompartido
+    nombres - Nombres de las zonas analizadas
+    procesos - Número máximo de procesos (None, según CPUs)
+
+    Devuelve la lista de resultados, en el mismo orden que nombres.
+    """
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        return list(executor.map(_ejecuta, [funcion] * len(nombres),
+                                 [manejador] * len(nombres), nombres))
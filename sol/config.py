@@ -32,6 +32,11 @@ _validkeys = dict([('autolimits', 'bool'), # Límite automático de demanda
                    ('out_dpi', 'int'), # Resolución salida pantallazos
                    ('out_fmt', 'str'), # Formato fecha/hora pantallazos
                    ('out_basename', 'str'), # Nombre base pantallazos
+                   ('cachemb', 'int'), # Memoria máxima de la caché de proyectos (MB)
+                   ('cachedibujosmb', 'int'), # Memoria máxima de la caché de gráficas (MB)
+                   ('latencias', 'bool'), # Medida de tiempos de respuesta
+                   ('latencias_log', 'str'), # Archivo de registro de tiempos de respuesta
+                   ('umbralescarga', 'str'), # Umbrales de carga total (W/m²), separados por comas
 ])
 
 keys = []
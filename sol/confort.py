@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   confort.py
+#   Horas y grados hora fuera de consigna
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Horas y grados hora fuera de consigna
+
+Compara la temperatura de cada zona (Treal) con sus consignas de
+refrigeración (Tmax) y calefacción (Tmin) y obtiene, por zona y mes, las
+horas y grados hora por encima y por debajo de consigna y las horas con
+demanda de calefacción (daCal) y refrigeración (daRef).
+
+LIDER indica con consignas extremas (p.e. Tmax=99) las horas sin consigna,
+que no se consideran fuera de consigna.
+
+Los resultados de zonas se agregan por plantas y edificio con una matriz
+de agrupación (ver DatosHorarios.matrizgrupos), como horas de zona.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Consignas a partir de las que se considera que no hay consigna [ºC]
+SINCONSIGNA = 50.0
+# Días de cada mes y hora de comienzo de cada mes
+DIASMES = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+INICIOSMES = np.cumsum((0,) + DIASMES[:-1]) * 24
+# Resultados, por orden
+METRICAS = OrderedDict([('horassobre', u'Horas sobre consigna [h]'),
+                        ('gradoshorasobre', u'Grados hora sobre consigna [ºC·h]'),
+                        ('horasbajo', u'Horas bajo consigna [h]'),
+                        ('gradoshorabajo', u'Grados hora bajo consigna [ºC·h]'),
+                        ('horascal', u'Horas con demanda de calefacción [h]'),
+                        ('horasref', u'Horas con demanda de refrigeración [h]')])
+
+def fueraconsigna(treal, tmin, tmax, tolerancia=0.0):
+    """Diferencias de temperatura sobre y bajo consigna (0 dentro de consigna) [ºC]
+
+    Admite arrays de cualquier forma (p.e. zonas x horas).
+    """
+    sobre = np.where(tmax < SINCONSIGNA, treal - tmax - tolerancia, 0.0)
+    bajo = np.where(tmin > -SINCONSIGNA, tmin - treal - tolerancia, 0.0)
+    return np.maximum(sobre, 0.0), np.maximum(bajo, 0.0)
+
+class AnalisisConfort(object):
+    """Horas y grados hora fuera de consigna por zona (o grupo) y mes
+
+    nombres - Nombres de las zonas (o grupos de zonas)
+    mensual - Diccionario de arrays zonas x 12 de cada métrica de METRICAS
+    """
+    def __init__(self, nombres, mensual):
+        self.nombres = list(nombres)
+        self.mensual = mensual
+        self._indice = dict((nombre, i) for (i, nombre) in enumerate(self.nombres))
+
+    @classmethod
+    def desdehorarios(cls, horarios, tolerancia=0.0):
+        """Calcula las métricas de todas las zonas de un DatosHorarios a la vez
+
+        tolerancia - Diferencia con la consigna que no se considera fuera de ella [ºC]
+        """
+        datos = horarios.horarios
+        sobre, bajo = fueraconsigna(datos['Treal'], datos['Tmin'], datos['Tmax'], tolerancia)
+        horarias = OrderedDict([('horassobre', sobre > 0), ('gradoshorasobre', sobre),
+                                ('horasbajo', bajo > 0), ('gradoshorabajo', bajo),
+                                ('horascal', datos['daCal']), ('horasref', datos['daRef'])])
+        # Sumas mensuales de todas las zonas sumando en los tramos de cada mes
+        mensual = OrderedDict((metrica, np.add.reduceat(valores, INICIOSMES, axis=1, dtype=float))
+                              for (metrica, valores) in horarias.items())
+        return cls(horarios.nombres, mensual)
+
+    def agrupa(self, nombres, matriz):
+        """Métricas de grupos de zonas como suma de las de sus zonas
+
+        nombres - Nombres de los grupos
+        matriz - Matriz grupos x zonas de pesos de cada zona (p.e. multiplicadores)
+        """
+        return AnalisisConfort(nombres, OrderedDict((metrica, np.dot(matriz, valores))
+                                                    for (metrica, valores) in self.mensual.items()))
+
+    def indice(self, nombre):
+        """Índice de la zona de nombre dado"""
+        return self._indice[nombre]
+
+    def __contains__(self, nombre):
+        return nombre in self._indice
+
+    def anual(self, metrica):
+        """Valores anuales de una métrica para todas las zonas"""
+        return self.mensual[metrica].sum(axis=1)
+
+    def zona(self, nombre):
+        """Diccionario ordenado con los valores anuales de cada métrica de una zona"""
+        i = self._indice[nombre]
+        return OrderedDict((metrica, valores[i].sum()) for (metrica, valores) in self.mensual.items())
+
+    @property
+    def nbytes(self):
+        """Tamaño de los resultados [bytes]"""
+        return sum(valores.nbytes for valores in self.mensual.values())
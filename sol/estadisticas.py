@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   estadisticas.py
+#   Estadísticas de lectura de archivos de resultados y archivos BIN
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Estadísticas de lectura de archivos de resultados y archivos BIN
+
+Las funciones de lectura (resparser.loadfile, binparser.readBIN y
+binparser.DatosHorarios.desdeBIN) aceptan un objeto EstadisticasCarga que
+rellenan con los bytes leídos, las líneas recorridas y saltadas, el número
+de zonas y componentes y el tiempo empleado en cada fase de la lectura.
+
+Ejemplo:
+
+    est = EstadisticasCarga(hook=lambda est: log.info(est.resumen()))
+    edificio = loadfile('archivo.res', est)
+"""
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class EstadisticasCarga(object):
+    """Estadísticas de la lectura de un archivo
+
+    archivo - Ruta del archivo leído
+    bytes - Bytes leídos
+    lineas - Líneas recorridas (archivos de texto)
+    saltadas - Líneas saltadas al buscar el comienzo de bloques
+    zonas - Zonas leídas
+    componentes - Componentes leídos
+    tiempos - Diccionario ordenado con el tiempo de cada fase [s]
+    hook - Función a la que se pasan las estadísticas al terminar la lectura
+    """
+    def __init__(self, archivo=None, hook=None):
+        self.archivo = archivo
+        self.bytes = 0
+        self.lineas = 0
+        self.saltadas = 0
+        self.zonas = 0
+        self.componentes = 0
+        self.tiempos = OrderedDict()
+        self.hook = hook
+
+    @contextmanager
+    def fase(self, nombre):
+        """Mide el tiempo de una fase de la lectura, que se acumula si se repite"""
+        inicio = time.time()
+        try:
+            yield
+        finally:
+            self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + time.time() - inicio
+
+    @property
+    def total(self):
+        """Tiempo total de las fases medidas [s]"""
+        return sum(self.tiempos.values())
+
+    def termina(self):
+        """Da por terminada la lectura, pasando las estadísticas al hook"""
+        if self.hook is not None:
+            self.hook(self)
+
+    def asdict(self):
+        """Diccionario con las estadísticas (tiempos en s)"""
+        return OrderedDict([('archivo', self.archivo),
+                            ('bytes', self.bytes),
+                            ('lineas', self.lineas),
+                            ('saltadas', self.saltadas),
+                            ('zonas', self.zonas),
+                            ('componentes', self.componentes),
+                            ('tiempos', OrderedDict(self.tiempos)),
+                            ('total', self.total)])
+
+    def resumen(self):
+        """Texto con las estadísticas"""
+        fases = u', '.join(u'%s %.1fms' % (fase, 1000.0 * t) for (fase, t) in self.tiempos.items())
+        return (u'%s: %i bytes, %i líneas (%i saltadas), %i zonas, %i componentes. %s' %
+                (self.archivo, self.bytes, self.lineas, self.saltadas,
+                 self.zonas, self.componentes, fases))
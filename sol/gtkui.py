@@ -30,12 +30,16 @@ import os
 import datetime
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GdkPixbuf
+from gi.repository import Gtk, GdkPixbuf, GLib
 
 import sol
 from . import util
-from .widgets import HistoMeses, HistoElementos, PieGlobal, ZonasGraph
+from .widgets import (HistoMeses, HistoElementos, PieGlobal, ZonasGraph, MapaHorario, MapaZonas,
+                      CurvasCarga, MAPAVARIABLES, MAPAZONASVARIABLES)
+from .cargas import exportacsv, exportajson
 from .solmodel import VISOLModel
+from .clases import GRUPOSLIDER
+from .latencias import latencias
 
 TESTFILE = util.get_resource('data/test.res')
 
@@ -49,6 +53,12 @@ class GtkSol(object):
     def __init__(self):
         """Inicialización de datos e interfaz"""
         self.model = VISOLModel()
+        # Carga de archivos en segundo plano y notificaciones agrupadas en el bucle principal
+        self.model.asincrono = True
+        self.model.programador = GLib.idle_add
+        self.model.attach(self, ('carga', 'file'))
+        # Medida de tiempos de respuesta (opción latencias o VISOL_LATENCIAS=1)
+        latencias.configura(self.model.config)
 
         self.ui = Gtk.Builder()
         self.ui.add_from_file(util.get_resource('ui', 'sol.ui'))
@@ -93,6 +103,40 @@ class GtkSol(object):
         vb = self.ui.get_object('bzonas')
         vb.pack_start(self.zonaschart, expand=True, fill=True, padding=0)
 
+        # Mapa horario de zona, con selector de variable
+        self.mapahorario = MapaHorario(modelo=self.model)
+        vb = self.ui.get_object('bmapahorario')
+        vb.pack_start(self.mapahorario, expand=True, fill=True, padding=0)
+        cbmapa = self.ui.get_object('cbmapahorario')
+        for variable, (titulo, dummy_cmap) in MAPAVARIABLES.items():
+            cbmapa.append(variable, titulo)
+        cbmapa.set_active_id(self.mapahorario.variable)
+
+        # Mapa de zonas del edificio o planta, con selectores de variable y orden
+        self.mapazonas = MapaZonas(modelo=self.model)
+        self.mapazonas.alleer = lambda texto: self.sb.push(self.sb.get_context_id('mapazonas'), texto)
+        vb = self.ui.get_object('bmapazonas')
+        vb.pack_start(self.mapazonas, expand=True, fill=True, padding=0)
+        cbmapa = self.ui.get_object('cbmapazonas')
+        for variable, (titulo, dummy_cmap) in MAPAZONASVARIABLES.items():
+            cbmapa.append(variable, titulo)
+        cbmapa.set_active_id(self.mapazonas.variable)
+        cborden = self.ui.get_object('cbordenmapazonas')
+        cborden.append('planta', u'Por planta')
+        cborden.append('valor', u'Por valor medio')
+        cborden.set_active_id(self.mapazonas.orden)
+
+        # Curvas de duración y cargas punta, con exportación de resultados
+        self.curvascarga = CurvasCarga(modelo=self.model)
+        vb = self.ui.get_object('bcargas')
+        vb.pack_start(self.curvascarga, expand=True, fill=True, padding=0)
+
+        # Grupos a los que se pueden aplicar factores de escala
+        cbgrupo = self.ui.get_object('cbgrupofactor')
+        for grupo in GRUPOSLIDER[:-1]: # Quitamos TOTAL
+            cbgrupo.append_text(grupo)
+        cbgrupo.set_active(0)
+
         # Filtro de archivos
         ffilter = self.ui.get_object('filefilter')
         ffilter.set_name('Archivos *.res, *.re2')
@@ -102,36 +146,62 @@ class GtkSol(object):
         self.loadfile(TESTFILE)
 
     def loadfile(self, path=TESTFILE):
-        """Carga archivo en el modelo y actualiza la interfaz"""
-        try:
+        """Inicia la carga de un archivo en el modelo
+
+        La interfaz se actualiza al recibir la notificación de fin de carga.
+        """
+        self.sb.push(0, u'Cargando archivo: %s' % path)
+        if path != self.model.file:
+            # Se cierra al recibir el fin de la carga
+            latencias.inicia('archivo')
+        with latencias.mide('modelo'):
             self.model.file = path
-            self.sb.push(0, u'Seleccionado archivo: %s' % self.model.file)
-
-            e = self.model.edificio
-            self.window.props.title = u"ViSOL [... %s]" % self.model.file[-40:]
-
-            self.tb.set_text(e.resdata)
-            ts = self.edificiots
-            tv = self.edificiotv
-            ts.clear()
-            tv.collapse_all()
-            # Modelo de plantas y zonas
-            ed = e.nombre
-            edificioiter = ts.append(None, (ed, 'edificio', ed, '', '', '', EDIFICIOICON))
-            for planta in e:
-                plantaiter = ts.append(edificioiter, (planta, 'planta', ed, planta, '', '', PLANTAICON))
-                zonas = e[planta]
-                for zona in zonas:
-                    zonaiter = ts.append(plantaiter, (zona, 'zona', ed, planta, zona, '', ZONAICON))
-                    tv.expand_to_path(ts.get_path(zonaiter))
-                    for componente in zonas[zona]:
-                        ts.append(zonaiter, (componente, 'componente', ed, planta, zona, componente, COMPONENTEICON))
-            tv.set_cursor((0,)) # Seleccionar edificio
-
-            self.sb.push(0, u'Cargado modelo: %s' % path)
-        except:
-            self.sb.push(0, u'Error al leer archivo: %s' % self.model.file)
-            raise
+
+    def update(self, subject, **kwargs):
+        """Actualiza la interfaz ante cambios del modelo"""
+        label = kwargs.get('label', None)
+        if label == 'carga':
+            etapa = kwargs['etapa']
+            if etapa == 'error':
+                self.sb.push(0, u'Error al leer archivo: %s (%s)' % (kwargs['file'], kwargs['error']))
+                self.finlatencias()
+            elif etapa == 'fin':
+                texto = u'Cargado modelo y datos horarios: %s' % kwargs['file']
+                if self.model.validacion is not None:
+                    texto += u'. %s' % self.model.validacion.resumen()
+                self.sb.push(0, texto)
+                self.finlatencias()
+            else:
+                self.sb.push(0, u'Cargando archivo (%s, %.0f%%): %s' % (etapa, 100 * kwargs['progreso'],
+                                                                       kwargs['file']))
+        elif label == 'file':
+            self.muestraedificio()
+
+    def muestraedificio(self):
+        """Actualiza la interfaz con el edificio cargado en el modelo"""
+        e = self.model.edificio
+        self.window.props.title = u"ViSOL [... %s]" % self.model.file[-40:]
+
+        self.tb.set_text(e.resdata)
+        ts = self.edificiots
+        tv = self.edificiotv
+        ts.clear()
+        tv.collapse_all()
+        # Modelo de plantas y zonas
+        ed = e.nombre
+        edificioiter = ts.append(None, (ed, 'edificio', ed, '', '', '', EDIFICIOICON))
+        for planta in e:
+            plantaiter = ts.append(edificioiter, (planta, 'planta', ed, planta, '', '', PLANTAICON))
+            zonas = e[planta]
+            for zona in zonas:
+                zonaiter = ts.append(plantaiter, (zona, 'zona', ed, planta, zona, '', ZONAICON))
+                tv.expand_to_path(ts.get_path(zonaiter))
+                for componente in zonas[zona]:
+                    ts.append(zonaiter, (componente, 'componente', ed, planta, zona, componente, COMPONENTEICON))
+        tv.set_cursor((0,)) # Seleccionar edificio
+        self.cambiagrupofactor(self.ui.get_object('cbgrupofactor'))
+
+        self.sb.push(0, u'Cargado modelo: %s' % self.model.file)
 
     def showtextfile(self, button):
         """Cambia la visibilidad de la pestaña de texto"""
@@ -148,7 +218,8 @@ class GtkSol(object):
         out_fmt = self.model.config.get('out_fmt', '%Y%m%d_%H%M%S')
         out_basename = self.model.config.get('out_basename', 'ViSol')
         for child in container.get_children():
-            if child.__gtype_name__ in ['PieChart', 'HistoMeses', 'HistoElementos']:
+            if child.__gtype_name__ in ['PieChart', 'HistoMeses', 'HistoElementos', 'MapaHorario',
+                                         'MapaZonas', 'CurvasCarga']:
                 timestamp = datetime.datetime.now().strftime(out_fmt)
                 filename = "%s-%s-%s.png" % (timestamp, out_basename, self.model.filename)
                 pathname = os.path.join(self.model.dirname, filename)
@@ -156,6 +227,21 @@ class GtkSol(object):
                 self.sb.push(0, u'Guardando captura de pantalla: %s' % pathname)
                 break
 
+    def exportacargas(self, dummy_button):
+        """Guarda los resultados de cargas punta en CSV y JSON"""
+        filas = self.model.filascargas()
+        if not filas:
+            self.sb.push(0, u'Datos horarios no disponibles')
+            return
+        out_fmt = self.model.config.get('out_fmt', '%Y%m%d_%H%M%S')
+        out_basename = self.model.config.get('out_basename', 'ViSol')
+        timestamp = datetime.datetime.now().strftime(out_fmt)
+        basename = "%s-%s-%s-cargas" % (timestamp, out_basename, self.model.filename)
+        pathname = os.path.join(self.model.dirname, basename)
+        exportacsv(filas, pathname + '.csv')
+        exportajson(filas, pathname + '.json')
+        self.sb.push(0, u'Guardando resultados de cargas: %s.csv, .json' % pathname)
+
     def cursorchanged(self, tv):
         """Seleccionada una nueva fila de la vista de árbol"""
         path, dummy_col = tv.get_cursor()
@@ -163,7 +249,16 @@ class GtkSol(object):
             return
         tm = tv.get_model()
         nombre, tipo, ed, pl, zn, comp = tuple(tm[path])[:6]
-        self.model.index = (ed, pl, zn, comp)
+        # Durante la carga de un archivo la selección forma parte de esta
+        if not self.model.cargando:
+            self.iniciolatencias('seleccion')
+        with latencias.mide('modelo'):
+            self.model.index = (ed, pl, zn, comp)
+        self.actualizainfo(nombre, tipo)
+        self.sb.push(0, u'Seleccionado %s: %s' % (tipo, nombre))
+
+    def actualizainfo(self, nombre, tipo):
+        """Actualiza la información del objeto activo"""
         objeto = self.model.activo
         mul = getattr(objeto, 'multiplicador', 1)
         sup = getattr(objeto, 'superficie', None)
@@ -177,17 +272,77 @@ class GtkSol(object):
             txt1 += u'refrigeración: %6.1f<i>kWh/m²año</i>' % ref
         else:
             txt1 += u'\n'
-        self.sb.push(0, u'Seleccionado %s: %s' % (tipo, nombre))
         self.ui.get_object('labelzona').props.label = txt1
 
     def cbelementos(self, dummy_action):
         """Modifica el número de flujos activos en la vista de elementos"""
         he = self.histoelementos
+        self.iniciolatencias('elementos')
         he.showelems = (self.ui.get_object('cbcalpos').props.active,
                         self.ui.get_object('cbcalneg').props.active,
                         self.ui.get_object('cbrefpos').props.active,
                         self.ui.get_object('cbrefneg').props.active)
 
+    def cbhorario(self, checkbutton):
+        """Cambia entre valores diarios y horarios en la gráfica de zonas"""
+        self.iniciolatencias('horario')
+        self.zonaschart.horario = checkbutton.props.active
+
+    def cambiavariablemapa(self, cbmapa):
+        """Cambia la variable representada en el mapa horario"""
+        self.iniciolatencias('mapa')
+        self.mapahorario.variable = cbmapa.get_active_id()
+
+    def cambiavariablemapazonas(self, cbmapa):
+        """Cambia la variable representada en el mapa de zonas"""
+        self.iniciolatencias('mapazonas')
+        self.mapazonas.variable = cbmapa.get_active_id()
+
+    def cambiaordenmapazonas(self, cborden):
+        """Cambia el orden de las zonas en el mapa de zonas"""
+        self.iniciolatencias('mapazonas')
+        self.mapazonas.orden = cborden.get_active_id()
+
+    def cambiagrupofactor(self, cbgrupo):
+        """Muestra el factor de escala del grupo seleccionado"""
+        grupo = cbgrupo.get_active_text()
+        factor = self.model.factores.get(grupo, 1.0) if self.model.edificio is not None else 1.0
+        self.ui.get_object('sbfactor').set_value(round(100 * factor))
+
+    def cambiafactor(self, spinbutton):
+        """Aplica el factor de escala al grupo seleccionado"""
+        if self.model.edificio is None:
+            return
+        grupo = self.ui.get_object('cbgrupofactor').get_active_text()
+        factor = spinbutton.get_value() / 100.0
+        self.iniciolatencias('factor')
+        with latencias.mide('modelo'):
+            self.model.setfactor(grupo, factor)
+        path, dummy_col = self.edificiotv.get_cursor()
+        if path:
+            nombre, tipo = tuple(self.edificiotv.get_model()[path])[:2]
+            self.actualizainfo(nombre, tipo)
+        self.sb.push(0, u'Factor de escala de %s: %.0f%%' % (grupo, 100 * factor))
+
+    def iniciolatencias(self, accion):
+        """Comienza la medida de una acción, que se cierra al quedar libre el bucle"""
+        if not latencias.activo:
+            return
+        latencias.inicia(accion)
+        self.finlatencias()
+
+    def finlatencias(self):
+        """Programa el cierre de la acción en curso para cuando quede libre el bucle"""
+        if latencias.activo:
+            GLib.idle_add(self.cierralatencias, priority=GLib.PRIORITY_LOW)
+
+    def cierralatencias(self):
+        """Termina la medida de la acción en curso y muestra su resumen"""
+        accion = latencias.cierra()
+        if accion is not None:
+            self.sb.push(self.sb.get_context_id('latencias'), latencias.resumen(accion))
+        return False
+
     #{ Funciones generales de aplicación
     def openfile(self, dummy_toolbutton):
         """Abre archivo de resultados"""
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   latencias.py
+#   Medida de tiempos de respuesta de la interfaz
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Medida de tiempos de respuesta de la interfaz
+
+Para cada acción del usuario (apertura de archivo, selección en el árbol,
+cambio de opciones) se mide el tiempo empleado en cada etapa (actualización
+del modelo, update de cada observador, dibujaseries y draw de cada gráfica)
+y el tiempo total hasta el último dibujado de la acción.
+
+Las medidas se guardan, por acción y etapa, en una ventana de las últimas
+mediciones, de la que se obtienen los percentiles 50 y 95, y, si se indica
+un archivo de registro, se añaden a este.
+
+La medida se activa con la opción latencias de visol.cfg o con la variable
+de entorno VISOL_LATENCIAS=1. Desactivada, no tiene coste apreciable.
+"""
+
+import io
+import os
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+class Latencias(object):
+    """Registro de tiempos de respuesta por acción y etapa
+
+    activo - Indica si se realizan medidas
+    logfile - Archivo al que se añaden las medidas (None, sin registro)
+    ventana - Número de medidas guardadas por acción y etapa
+    """
+    def __init__(self, activo=False, logfile=None, ventana=100):
+        self.activo = activo
+        self.logfile = logfile
+        self.ventana = ventana
+        self.medidas = OrderedDict()
+        self.accion = None
+        self._inicio = None
+        self._pintado = None
+
+    def configura(self, config):
+        """Activa las medidas y fija el archivo de registro según config y el entorno"""
+        self.activo = bool(config.get('latencias', False) or
+                           os.environ.get('VISOL_LATENCIAS', '') not in ('', '0'))
+        self.logfile = config.get('latencias_log', None) or None
+
+    def inicia(self, accion):
+        """Comienza la medida de una acción, cerrando la anterior"""
+        if not self.activo:
+            return
+        self.cierra()
+        self.accion = accion
+        self._inicio = time.time()
+        self._pintado = None
+
+    def cierra(self):
+        """Termina la acción en curso, registrando su tiempo total
+
+        El tiempo total llega hasta el último dibujado de la acción o, si no
+        se ha dibujado nada, hasta el momento del cierre.
+        """
+        if not self.activo or self.accion is None:
+            return None
+        fin = self._pintado if self._pintado is not None else time.time()
+        self.registra('total', fin - self._inicio)
+        accion, self.accion = self.accion, None
+        return accion
+
+    def pintado(self):
+        """Anota el final de un dibujado de la acción en curso"""
+        if self.activo and self.accion is not None:
+            self._pintado = time.time()
+
+    @contextmanager
+    def mide(self, etapa):
+        """Mide el tiempo de una etapa de la acción en curso"""
+        if not self.activo or self.accion is None:
+            yield
+            return
+        inicio = time.time()
+        try:
+            yield
+        finally:
+            self.registra(etapa, time.time() - inicio)
+
+    def registra(self, etapa, segundos):
+        """Guarda una medida de la acción en curso [s]"""
+        if not self.activo:
+            return
+        clave = (self.accion, etapa)
+        if clave not in self.medidas:
+            self.medidas[clave] = deque(maxlen=self.ventana)
+        self.medidas[clave].append(segundos)
+        if self.logfile:
+            try:
+                with io.open(self.logfile, 'a', encoding='utf-8') as ff:
+                    ff.write(u'%.3f\t%s\t%s\t%.2f\n' % (time.time(), self.accion,
+                                                        etapa, 1000.0 * segundos))
+            except (IOError, OSError):
+                self.logfile = None
+
+    def percentiles(self, accion, etapa):
+        """Percentiles 50 y 95 [ms] y número de medidas de una acción y etapa"""
+        medidas = self.medidas.get((accion, etapa), None)
+        if not medidas:
+            return None
+        p50, p95 = np.percentile(np.array(medidas), [50, 95]) * 1000.0
+        return p50, p95, len(medidas)
+
+    def resumen(self, accion):
+        """Texto con los percentiles del total y la etapa más lenta de una acción"""
+        total = self.percentiles(accion, 'total')
+        if total is None:
+            return u''
+        texto = u'%s: p50 %.0fms, p95 %.0fms (%i)' % ((accion,) + total)
+        etapas = [(self.percentiles(acc, etapa), etapa)
+                  for (acc, etapa) in self.medidas if acc == accion and etapa != 'total']
+        if etapas:
+            (p50, p95, num), etapa = max(etapas)
+            texto += u'. Más lenta: %s, p50 %.0fms, p95 %.0fms' % (etapa, p50, p95)
+        return texto
+
+# Registro de la aplicación
+latencias = Latencias()
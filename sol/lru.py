@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   lru.py
+#   Caché LRU limitada por tamaño
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Caché LRU limitada por tamaño"""
+
+from collections import OrderedDict
+
+class CacheLRU(object):
+    """Caché de elementos usados recientemente, limitada en bytes
+
+    Al superarse el tamaño máximo se eliminan los elementos usados hace más
+    tiempo. Los elementos mayores que el tamaño máximo no se guardan.
+
+    maxbytes - Tamaño máximo de la caché [bytes]
+    tamano - Función que devuelve el tamaño de un valor [bytes]. Si no se
+             indica, se usa el atributo nbytes del valor.
+    """
+    def __init__(self, maxbytes, tamano=None):
+        self.maxbytes = maxbytes
+        self.tamano = tamano or (lambda valor: valor.nbytes)
+        self.nbytes = 0
+        self._datos = OrderedDict()
+
+    def __contains__(self, clave):
+        return clave in self._datos
+
+    def __len__(self):
+        return len(self._datos)
+
+    def get(self, clave, default=None):
+        """Valor guardado para clave, que pasa a ser el usado más recientemente"""
+        try:
+            valor, _ = self._datos[clave]
+        except KeyError:
+            return default
+        self._datos.move_to_end(clave)
+        return valor
+
+    def put(self, clave, valor, nbytes=None):
+        """Guarda o actualiza un valor, eliminando los más antiguos si es necesario
+
+        Devuelve True si el valor ha quedado guardado.
+        """
+        self.pop(clave)
+        nbytes = self.tamano(valor) if nbytes is None else nbytes
+        if nbytes > self.maxbytes:
+            return False
+        self._datos[clave] = (valor, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.maxbytes:
+            _, (_, viejos) = self._datos.popitem(last=False)
+            self.nbytes -= viejos
+        return True
+
+    def pop(self, clave, default=None):
+        """Elimina y devuelve el valor guardado para clave"""
+        try:
+            valor, nbytes = self._datos.pop(clave)
+        except KeyError:
+            return default
+        self.nbytes -= nbytes
+        return valor
+
+    def clear(self):
+        """Vacía la caché"""
+        self._datos.clear()
+        self.nbytes = 0
@@ -21,6 +21,11 @@
 #   02110-1301, USA.
 """Clases base del patrón Modelo-Observador"""
 
+import weakref
+from collections import OrderedDict
+
+from .latencias import latencias
+
 class Subject(object):
     """Clase para implementar el patrón Observer
     
@@ -29,24 +34,43 @@ class Subject(object):
     Se ha añadido la posibilidad de pasar parámetros arbitrarios en notify,
     para poder filtrar en update.
     
-    Los observadores deben implementar el método update.
+    Los observadores deben implementar el método update. Pueden suscribirse
+    solamente a algunas etiquetas (parámetro label de notify) y se guardan
+    mediante referencias débiles, de modo que no se mantienen vivos por
+    estar suscritos.
+
+    Si se define un programador (p.e. GLib.idle_add) las notificaciones no se
+    envían al momento sino en la siguiente llamada del programador, agrupando
+    las producidas entre tanto: cada observador recibe una sola notificación
+    por etiqueta, la última, en el orden en que se produjeron.
     """
     def __init__(self):
         self._observers = []
         self._block = False
+        self.programador = None
+        self._pendientes = []
 
-    def attach(self, observer):
-        """Añade un nuevo observador al que notificar"""
-        if not observer in self._observers:
-            self._observers.append(observer)
+    def attach(self, observer, labels=None):
+        """Añade un nuevo observador al que notificar
+
+        labels - Etiquetas de las notificaciones que recibe (None, todas)
+        """
+        labels = None if labels is None else frozenset(labels)
+        self._observers = [(ref, lbls) for (ref, lbls) in self._observers
+                           if ref() is not None and ref() is not observer]
+        self._observers.append((weakref.ref(observer), labels))
 
     def detach(self, observer):
         """Elimina un observador al que notificar"""
-        try:
-            self._observers.remove(observer)
-        except ValueError:
-            pass
+        self._observers = [(ref, labels) for (ref, labels) in self._observers
+                           if ref() is not None and ref() is not observer]
     
+    @property
+    def observers(self):
+        """Observadores suscritos y sus etiquetas"""
+        return [(ref(), labels) for (ref, labels) in self._observers
+                if ref() is not None]
+
     def block(self):
         """Bloquea notificaciones"""
         self._block = True
@@ -72,20 +96,49 @@ class Subject(object):
         hace que no se notifique al sujeto1 y el resto recibe en su diccionario
         de parámetros {'modifier':sujeto1, 'label':'cambiamodelo'}
         """
-        if not self._block:
-            for observer in self._observers:
-                if kwargs.get('modifier', None) != observer:
+        if self._block:
+            return
+        if self.programador is None:
+            self._envia([kwargs])
+            return
+        if not self._pendientes:
+            self.programador(self._enviapendientes)
+        self._pendientes.append(kwargs)
+
+    def _enviapendientes(self):
+        """Envía las notificaciones pendientes, agrupadas por etiqueta"""
+        pendientes, self._pendientes = self._pendientes, []
+        self._envia(pendientes)
+        return False
+
+    def _envia(self, notificaciones):
+        """Envía a cada observador la última notificación de cada etiqueta"""
+        for observer, labels in self.observers:
+            ultimas = OrderedDict()
+            for kwargs in notificaciones:
+                label = kwargs.get('label', None)
+                if labels is not None and label not in labels:
+                    continue
+                if kwargs.get('modifier', None) is observer:
+                    continue
+                ultimas.pop(label, None)
+                ultimas[label] = kwargs
+            for kwargs in ultimas.values():
+                with latencias.mide('%s.update' % type(observer).__name__):
                     observer.update(self, **kwargs)
 
 class Observer(object):
     """Clase de la que heredarán los observadores
     
     model hace referencia al objeto de la clase Subject que es observado.
+    labels indica las etiquetas de las notificaciones que recibe (None, todas).
     """
+    labels = None
+
     def __init__(self, model=None):
         self._model = model
         if isinstance(model, Subject):
-            self._model.attach(self)
+            self._model.attach(self, self.labels)
     
     def update(self, subject, **kwargs):
         """Método que deben sobrecargar los observadores
@@ -104,4 +157,4 @@ class Observer(object):
         if self._model:
             self._model.detach(self)
         self._model = newmodel
-        self._model.attach(self)
+        self._model.attach(self, self.labels)
@@ -24,23 +24,51 @@
 """Parser de  archivos de resultados de LIDER"""
 
 import codecs
+import os
 from collections import OrderedDict
 from sol.clases import EdificioLIDER, PlantaLIDER, ZonaLIDER, ComponenteLIDER
+from sol.estadisticas import EstadisticasCarga
 
 try:
     basestring
 except NameError:
     basestring = str
 
-def nextblock(linesiter, startswith):
-    """Avanza el iterador y devuelve la primera línea que empiece por cualquier patrón en startswith"""
+class LineasContadas(object):
+    """Iterador sobre líneas que cuenta las líneas recorridas"""
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self.leidas = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        self.leidas += 1
+        return line
+
+    next = __next__
+
+def nextblock(linesiter, startswith, estadisticas=None):
+    """Avanza el iterador y devuelve la primera línea que empiece por cualquier patrón en startswith
+
+    Si se indican estadisticas (EstadisticasCarga) se cuentan las líneas saltadas.
+    """
     if isinstance(startswith, basestring):
         patterns = [startswith]
     else:
         patterns = startswith
+    saltadas = 0
     for line in linesiter:
         if any(line.startswith(pat) for pat in patterns):
-            return line
+            break
+        saltadas += 1
+    else:
+        line = None
+    if estadisticas is not None:
+        estadisticas.saltadas += saltadas
+    return line
 
 def valores(linea):
     """Devuelve concepto y valores de líneas de detalle
@@ -55,115 +83,141 @@ def valores(linea):
     vals = [float(elem) for elem in elems[1:]]
     return concepto, vals
 
-def loadfile(resfile):
-    """Devuelve un objeto de tipo EdificioLIDER a partir del archivo resfile"""
+def loadfile(resfile, estadisticas=None):
+    """Devuelve un objeto de tipo EdificioLIDER a partir del archivo resfile
+
+    estadisticas - EstadisticasCarga que se rellena con los datos de la lectura
+                   (bytes del archivo, líneas recorridas y saltadas, zonas,
+                   componentes y tiempos de las fases de lectura, análisis y
+                   agregados). Con estadísticas se calculan también las
+                   demandas agregadas del edificio y sus plantas (fase
+                   agregados), que de otro modo se calculan al usarlas.
+    """
+    est = estadisticas if estadisticas is not None else EstadisticasCarga()
     try:
-        data = codecs.open(resfile, "rU", "latin-1").readlines()
+        with est.fase('lectura'):
+            data = codecs.open(resfile, "rU", "latin-1").readlines()
     except IOError:
         print("Errores procesando archivo", resfile)
         raise
-    lines = iter(data)
+    lines = iter(data) if estadisticas is None else LineasContadas(data)
 
     try:
-        edificio = EdificioLIDER()
-        edificio.resdata = ''.join(data)
-
-        zonasstore = OrderedDict()
-
-        # Plantas del edificio
-        nextblock(lines, u'Numero de plantas')
-        numplantas = int(next(lines))
-        edificio.numplantas = numplantas
-
-        for iplanta in range(numplantas):
-            line = nextblock(lines, u'"P')
-            nombreplanta = line.strip(u'" \t\r\n')
-            planta = PlantaLIDER(nombreplanta)
-            edificio[nombreplanta] = planta
-
-            # Zonas de la planta
-            nextblock(lines, u'Numero de zonas')
-            numzonas = int(next(lines))
-            zonasplantanames = []
-            for izona in range(numzonas):
-                numzona, nombrezona = nextblock(lines, u'Zona ').split(u',')
-                nombrezona = nombrezona.strip(u'" \t\r\n')
-                zonasplantanames.append(nombrezona)
-                supzona = float(next(lines))
-
-                zona = ZonaLIDER(nombrezona)
-                zona.numero =  int(numzona[4:])
-                zona.planta = nombreplanta
-                zona.superficie = supzona
-
-                # Grupos de demanda de la zona
-                nextblock(lines, u'Concepto')
-                grupos = OrderedDict()
-                for igrupos in range(9): # 9 grupos de demanda
-                    gline = next(lines).strip()
-                    grupo, vals = valores(gline)
-                    grupos[grupo] = ComponenteLIDER(grupo, *vals)
-                zona.grupos = grupos
-
-                # Componentes de demanda de la zona
-                nextblock(lines, u'Numero de Componentes')
-                numcomponentes = int(next(lines))
-                nextblock(lines, u'Componente,')
-                for icomponente in range(numcomponentes):
-                    cline = next(lines).strip()
-                    componente, vals = valores(cline)
-                    zona[componente] = ComponenteLIDER(componente, *vals)
-
-                planta[nombrezona] = zona
-                zonasstore[nombrezona] = zona
-            edificio[nombreplanta] = planta
-
-        # Datos generales del edificio
-        nextblock(lines, u'RESULTADOS A NIVEL EDIFICIO')
-
-        # Datos generales de demandas del edificio
-        nextblock(lines, [u'Calefacción, Refrigeración anual', u'Calefacción anual'])
-        cal, ref = next(lines).split(u',')
-        edificio.calefaccion = float(cal)
-        edificio.refrigeracion = float(ref)
-        nextblock(lines, u'Calefacción mensual')
-        edificio.calefaccion_meses = [float(x) for x in next(lines).split(u',')]
-        nextblock(lines, u'Refrigeración mensual')
-        edificio.refrigeracion_meses = [float(x) for x in next(lines).split(u',')]
-
-        # Datos generales de las zonas del edificio
-        nextblock(lines, u'Numero de zonas')
-        numzonasedificio = int(next(lines))
-        edificio.numzonas = numzonasedificio
-        nextblock(lines, u'Nombre, m2, multiplicador')
-        zonasnames = []
-        for izona in range(numzonasedificio):
-            zline = next(lines)
-            nombrezona, (sup, multip, cal, ref) = valores(zline)
-            zonasnames.append(nombrezona)
-            zona = zonasstore[nombrezona]
-            # zona.superficie = sup # ya se almacenó antes
-            zona.multiplicador = multip
-            zona.calefaccion = cal
-            zona.refrigeracion = ref
-
-        supedificio, _, _ = next(lines).split(u',')[1:]
-        edificio.superficie = float(supedificio)
-
-        # Demandas mensuales por zonas
-        nextblock(lines, u'Calefacción mensual por zonas')
-        for nombrezona in zonasnames:
-            vals = [float(x) for x in next(lines).split(u',')]
-            zonasstore[nombrezona].calefaccion_meses = vals
-        nextblock(lines, u'Refrigeración mensual por zonas')
-        for nombrezona in zonasnames:
-            vals = [float(x) for x in next(lines).split(u',')]
-            zonasstore[nombrezona].refrigeracion_meses = vals
-
-        return edificio
+        with est.fase('analisis'):
+            edificio = _analiza(data, lines, est)
     except Exception:
         print("Errores de formato del archivo", resfile)
         raise
+    if estadisticas is not None:
+        with est.fase('agregados'):
+            edificio.calculaagregados()
+        if estadisticas.archivo is None:
+            estadisticas.archivo = resfile
+        estadisticas.bytes = os.path.getsize(resfile)
+        estadisticas.lineas = lines.leidas
+        estadisticas.termina()
+    return edificio
+
+def _analiza(data, lines, est):
+    """Construye el EdificioLIDER a partir de las líneas del archivo de resultados"""
+    edificio = EdificioLIDER()
+    edificio.resdata = ''.join(data)
+
+    zonasstore = OrderedDict()
+
+    # Plantas del edificio
+    nextblock(lines, u'Numero de plantas', est)
+    numplantas = int(next(lines))
+    edificio.numplantas = numplantas
+
+    for iplanta in range(numplantas):
+        line = nextblock(lines, u'"P', est)
+        nombreplanta = line.strip(u'" \t\r\n')
+        planta = PlantaLIDER(nombreplanta)
+        edificio[nombreplanta] = planta
+
+        # Zonas de la planta
+        nextblock(lines, u'Numero de zonas', est)
+        numzonas = int(next(lines))
+        zonasplantanames = []
+        for izona in range(numzonas):
+            numzona, nombrezona = nextblock(lines, u'Zona ', est).split(u',')
+            nombrezona = nombrezona.strip(u'" \t\r\n')
+            zonasplantanames.append(nombrezona)
+            supzona = float(next(lines))
+
+            zona = ZonaLIDER(nombrezona)
+            zona.numero =  int(numzona[4:])
+            zona.planta = nombreplanta
+            zona.superficie = supzona
+            est.zonas += 1
+
+            # Grupos de demanda de la zona
+            nextblock(lines, u'Concepto', est)
+            grupos = OrderedDict()
+            for igrupos in range(9): # 9 grupos de demanda
+                gline = next(lines).strip()
+                grupo, vals = valores(gline)
+                grupos[grupo] = ComponenteLIDER(grupo, *vals)
+            zona.grupos = grupos
+
+            # Componentes de demanda de la zona
+            nextblock(lines, u'Numero de Componentes', est)
+            numcomponentes = int(next(lines))
+            est.componentes += numcomponentes
+            nextblock(lines, u'Componente,', est)
+            for icomponente in range(numcomponentes):
+                cline = next(lines).strip()
+                componente, vals = valores(cline)
+                zona[componente] = ComponenteLIDER(componente, *vals)
+
+            planta[nombrezona] = zona
+            zonasstore[nombrezona] = zona
+        edificio[nombreplanta] = planta
+
+    # Datos generales del edificio
+    nextblock(lines, u'RESULTADOS A NIVEL EDIFICIO', est)
+
+    # Datos generales de demandas del edificio
+    nextblock(lines, [u'Calefacción, Refrigeración anual', u'Calefacción anual'], est)
+    cal, ref = next(lines).split(u',')
+    edificio.calefaccion = float(cal)
+    edificio.refrigeracion = float(ref)
+    nextblock(lines, u'Calefacción mensual', est)
+    edificio.calefaccion_meses = [float(x) for x in next(lines).split(u',')]
+    nextblock(lines, u'Refrigeración mensual', est)
+    edificio.refrigeracion_meses = [float(x) for x in next(lines).split(u',')]
+
+    # Datos generales de las zonas del edificio
+    nextblock(lines, u'Numero de zonas', est)
+    numzonasedificio = int(next(lines))
+    edificio.numzonas = numzonasedificio
+    nextblock(lines, u'Nombre, m2, multiplicador', est)
+    zonasnames = []
+    for izona in range(numzonasedificio):
+        zline = next(lines)
+        nombrezona, (sup, multip, cal, ref) = valores(zline)
+        zonasnames.append(nombrezona)
+        zona = zonasstore[nombrezona]
+        # zona.superficie = sup # ya se almacenó antes
+        zona.multiplicador = multip
+        zona.calefaccion = cal
+        zona.refrigeracion = ref
+
+    supedificio, _, _ = next(lines).split(u',')[1:]
+    edificio.superficie = float(supedificio)
+
+    # Demandas mensuales por zonas
+    nextblock(lines, u'Calefacción mensual por zonas', est)
+    for nombrezona in zonasnames:
+        vals = [float(x) for x in next(lines).split(u',')]
+        zonasstore[nombrezona].calefaccion_meses = vals
+    nextblock(lines, u'Refrigeración mensual por zonas', est)
+    for nombrezona in zonasnames:
+        vals = [float(x) for x in next(lines).split(u',')]
+        zonasstore[nombrezona].refrigeracion_meses = vals
+
+    return edificio
 
 if __name__ == '__main__':
     import argparse
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   rts.py
+#   Carga sensible sobre los equipos con los factores de respuesta de las zonas
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Carga sensible sobre los equipos con los factores de respuesta de las zonas
+
+El archivo BIN incluye para cada zona los factores de respuesta ante
+ganancia térmica (p, 2 valores) y ante cambio de la temperatura del local
+(g, 24 valores), que relacionan la carga sobre los equipos (QE) con la carga
+a temperatura de referencia (Q) y la temperatura del local (T):
+
+    sum(p[i] * (QE[t-i] - Q[t-i]), i=0..1) = sum(g[j] * (Tref[t-j] - T[t-j]), j=0..23)
+
+(ver IDAE, "Guía técnica. Procedimientos y aspectos de la simulación de
+instalaciones térmicas en edificios", pp.50-51 y Anexo 6).
+
+El filtro se aplica a la vez a todas las zonas y a todo el año, sin bucles
+por horas, considerando el año como periódico (régimen estacionario
+periódico): la ecuación es entonces una convolución circular que se resuelve
+dividiendo las transformadas de Fourier de ambos miembros. Esto solo es
+posible si el filtro es estable, |p[1]| < |p[0]| (LIDER da p[0] = 1). En las
+zonas con factores que no lo cumplen (p.e. nulos) no se corrige la carga y
+QE = Q (ver factoresvalidos).
+
+Ejemplo:
+
+    python -m sol.rts ResumenRCC.bin
+"""
+
+import numpy as np
+
+def temperaturareferencia(horarios):
+    """Temperatura de referencia por defecto de todas las zonas (zonas x horas) [ºC]
+
+    Es la temperatura del local limitada a las consignas de calefacción
+    (Tmin) y refrigeración (Tmax), de modo que la carga sobre los equipos
+    incluye la necesaria para mantener el local dentro de consigna en las
+    horas en las que queda fuera de ella.
+    """
+    datos = horarios.horarios
+    return np.minimum(np.maximum(datos['Treal'], datos['Tmin']), datos['Tmax'])
+
+def factoresvalidos(p):
+    """Indica para cada zona si sus factores p (zonas x 2) dan un filtro estable
+
+    Con |p[1]| < |p[0]| la transformada de p no se anula en ninguna
+    frecuencia y el filtro periódico tiene solución única.
+    """
+    p = np.asarray(p, dtype=float)
+    return np.abs(p[:, 1]) < np.abs(p[:, 0])
+
+def filtra(p, g, cargas, diferencias):
+    """Aplica los factores de respuesta a series periódicas de todas las zonas
+
+    p - Array zonas x 2 de factores de respuesta ante ganancia térmica
+    g - Array zonas x 24 de factores de respuesta ante cambio de temperatura
+    cargas - Array zonas x horas de cargas a temperatura de referencia [W]
+    diferencias - Array zonas x horas de diferencias Tref - T [ºC]
+
+    Devuelve un array zonas x horas con la carga sobre los equipos [W]. En
+    las zonas sin factores válidos (ver factoresvalidos) es igual a cargas.
+    """
+    horas = cargas.shape[1]
+    validos = factoresvalidos(p)
+    qe = np.array(cargas, dtype=float)
+    if not validos.any():
+        return qe
+    # Transformadas de los factores completados con ceros hasta el año
+    fp = np.fft.rfft(p[validos], n=horas, axis=1)
+    fg = np.fft.rfft(g[validos], n=horas, axis=1)
+    fdiferencias = np.fft.rfft(diferencias[validos], axis=1)
+    qe[validos] += np.fft.irfft(fg * fdiferencias / fp, n=horas, axis=1)
+    return qe
+
+def cargaequipos(horarios, cargas=None, tref=None):
+    """Carga sensible sobre los equipos de todas las zonas de un DatosHorarios (zonas x horas) [W]
+
+    cargas - Cargas a temperatura de referencia (zonas x horas). Por defecto, QS.
+    tref - Temperatura de referencia de las cargas (escalar o zonas x horas).
+           Por defecto, la temperatura del local limitada a las consignas
+           (ver temperaturareferencia).
+
+    Necesita los factores de respuesta de las zonas, por lo que no se puede
+    aplicar a datos agregados de plantas o edificio. En las zonas sin
+    factores válidos (ver factoresvalidos) la carga no se corrige.
+    """
+    datos = horarios.horarios
+    cargas = datos['QS'] if cargas is None else cargas
+    tref = temperaturareferencia(horarios) if tref is None else tref
+    qe = filtra(np.asarray(horarios.zonas['p'], dtype=float),
+                np.asarray(horarios.zonas['g'], dtype=float),
+                np.asarray(cargas, dtype=float),
+                tref - datos['Treal'])
+    return qe.astype(np.float32)
+
+if __name__ == '__main__':
+    import argparse
+    from sol.binparser import DatosHorarios
+    from sol.cargas import fechahora
+
+    parser = argparse.ArgumentParser(description=u'Carga sensible sobre los equipos de las zonas de un archivo BIN de LIDER')
+    parser.add_argument('binfile', action="store", default='ResumenRCC.bin')
+    params = parser.parse_args()
+
+    datos = DatosHorarios.desdeBIN(params.binfile)
+    qe = datos.cargaequipos()
+    validos = factoresvalidos(datos.zonas['p'])
+    if not validos.all():
+        print(u'Zonas sin factores de respuesta válidos (carga sin corregir): %s' %
+              u', '.join(nombre for (nombre, valido) in zip(datos.nombres, validos) if not valido))
+    for i, nombre in enumerate(datos.nombres):
+        print(u'%s: máx. %.0f W (%s), mín. %.0f W (%s)' % (nombre, qe[i].max(), fechahora(qe[i].argmax()),
+                                                           qe[i].min(), fechahora(qe[i].argmin())))
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   snapshot.py
+#   Formato binario compacto para el modelo de edificio de LIDER
+#
+#   Copyright (C) 2014-2015 Rafael Villar Burke <pachi@ietcc.csic.es>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#
+"""Instantáneas binarias de edificios de LIDER
+
+Guarda el modelo de un EdificioLIDER como un conjunto de arrays numéricos
+y una cabecera JSON con tablas de nombres y metadatos, en un único archivo
+que se puede proyectar en memoria (memmap) sin copiar los datos.
+
+Estructura del archivo:
+
+    - Prefijo de 32 bytes: MAGIC (8 bytes), versión (uint32), reservado
+      (uint32), posición de la cabecera (uint64) y longitud de la cabecera
+      (uint64), en formato little endian.
+    - Arrays, alineados a 64 bytes, a partir del byte 64.
+    - Cabecera JSON (utf-8) con metadatos, tablas de nombres y tipo, forma
+      y posición de cada array.
+
+Arrays de zonas (nz zonas, nc componentes, ng grupos):
+
+    zona_planta - Índice de la planta de cada zona (nz)
+    zona_numero - Número de cada zona (nz)
+    zona_superficie, zona_multiplicador - (nz)
+    zona_calefaccion, zona_refrigeracion - Demandas anuales (nz)
+    zona_calefaccion_meses, zona_refrigeracion_meses - (nz x 12)
+    zona_grupos - Flujos por grupo de cada zona (nz x ng x 6)
+    zona_componentes - Posición del primer componente de cada zona en
+                       componentes (nz + 1)
+    componentes - Flujos de los componentes (nc x 6)
+    edificio_calefaccion_meses, edificio_refrigeracion_meses - (12)
+    resdata - Texto del archivo .RES en utf-8 (bytes)
+
+Los valores guardados son los originales, sin factores de escala. Los
+factores aplicados se guardan en la cabecera y se vuelven a aplicar al
+reconstruir el edificio.
+"""
+
+import io
+import json
+import struct
+from collections import OrderedDict
+import numpy as np
+
+from sol.clases import EdificioLIDER, PlantaLIDER, ZonaLIDER, ComponenteLIDER, GRUPOSLIDER
+
+MAGIC = b'VISOLSNP'
+VERSION = 1
+_PREFIJO = struct.Struct('<8sIIQQ')
+_ALINEACION = 64
+
+def _alinea(pos):
+    """Posición alineada siguiente a pos"""
+    return (pos + _ALINEACION - 1) // _ALINEACION * _ALINEACION
+
+def arraysedificio(edificio):
+    """Cabecera (diccionario) y arrays (diccionario ordenado) de un EdificioLIDER"""
+    plantas = list(edificio.keys())
+    zonas = edificio.zonas
+    nz = len(zonas)
+
+    zonanombres, componentenombres = [], []
+    numcomponentes = np.zeros(nz + 1, dtype=np.int64)
+    grupos = np.zeros((nz, len(GRUPOSLIDER), 6))
+    calmeses, refmeses = np.zeros((nz, 12)), np.zeros((nz, 12))
+    cal, ref = np.zeros(nz), np.zeros(nz)
+    componentes = []
+    for iz, zona in enumerate(zonas):
+        zonanombres.append(zona.nombre)
+        cal[iz], ref[iz], calmeses[iz], refmeses[iz] = zona.demandasoriginales()
+        grupos[iz] = [zona.grupos[grupo].valores0 for grupo in GRUPOSLIDER]
+        for nombre in zona:
+            componentenombres.append(nombre)
+            componentes.append(zona[nombre].valores0)
+        numcomponentes[iz + 1] = len(zona)
+
+    edcal, edref, edcalmeses, edrefmeses = edificio.demandasoriginales()
+    cabecera = OrderedDict([('version', VERSION),
+                            ('nombre', edificio.nombre),
+                            ('numplantas', edificio.numplantas),
+                            ('numzonas', edificio.numzonas),
+                            ('superficie', edificio.superficie),
+                            ('calefaccion', edcal),
+                            ('refrigeracion', edref),
+                            ('plantas', plantas),
+                            ('zonas', zonanombres),
+                            ('componentes', componentenombres),
+                            ('grupos', list(GRUPOSLIDER)),
+                            ('factores', list(edificio.factores.items()))])
+    arrays = OrderedDict([
+        ('zona_planta', np.array([plantas.index(zona.planta) for zona in zonas], dtype=np.int32)),
+        ('zona_numero', np.array([zona.numero for zona in zonas], dtype=np.int32)),
+        ('zona_superficie', np.array([zona.superficie for zona in zonas], dtype=float)),
+        ('zona_multiplicador', np.array([zona.multiplicador for zona in zonas], dtype=float)),
+        ('zona_calefaccion', cal),
+        ('zona_refrigeracion', ref),
+        ('zona_calefaccion_meses', calmeses),
+        ('zona_refrigeracion_meses', refmeses),
+        ('zona_grupos', grupos),
+        ('zona_componentes', np.cumsum(numcomponentes)),
+        ('componentes', np.array(componentes, dtype=float).reshape(-1, 6)),
+        ('edificio_calefaccion_meses', np.asarray(edcalmeses, dtype=float)),
+        ('edificio_refrigeracion_meses', np.asarray(edrefmeses, dtype=float)),
+        ('resdata', np.frombuffer(edificio.resdata.encode('utf-8'), dtype=np.uint8)),
+    ])
+    return cabecera, arrays
+
+def empaqueta(cabecera, arrays):
+    """Disposición de cabecera y arrays en un bloque binario
+
+    Devuelve el tamaño total del bloque y una lista de pares (posición,
+    bytes o array) que hay que escribir en él.
+    """
+    cabecera = OrderedDict(cabecera)
+    descripcion = OrderedDict()
+    partes = []
+    pos = _ALINEACION
+    for nombre, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        descripcion[nombre] = OrderedDict([('dtype', array.dtype.str),
+                                           ('shape', list(array.shape)),
+                                           ('offset', pos)])
+        partes.append((pos, array))
+        pos = _alinea(pos + array.nbytes)
+    cabecera['arrays'] = descripcion
+    datoscabecera = json.dumps(cabecera).encode('utf-8')
+    prefijo = _PREFIJO.pack(MAGIC, VERSION, 0, pos, len(datoscabecera))
+    partes = [(0, prefijo)] + partes + [(pos, datoscabecera)]
+    return pos + len(datoscabecera), partes
+
+def escribe(buf, partes):
+    """Escribe en un buffer escribible las partes de un bloque empaquetado"""
+    mv = memoryview(buf).cast('B')
+    for pos, datos in partes:
+        if isinstance(datos, np.ndarray):
+            datos = datos.reshape(-1).view(np.uint8)
+        else:
+            datos = np.frombuffer(datos, dtype=np.uint8)
+        np.frombuffer(mv, dtype=np.uint8, count=len(datos), offset=pos)[:] = datos
+
+def desempaqueta(buf):
+    """Cabecera y arrays (vistas sin copia) de un bloque binario en buf"""
+    magic, version, _, poscabecera, lencabecera = _PREFIJO.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError(u'Formato de instantánea desconocido')
+    if version > VERSION:
+        raise ValueError(u'Versión de instantánea no soportada: %i' % version)
+    cabecera = json.loads(bytes(buf[poscabecera:poscabecera + lencabecera]).decode('utf-8'),
+                          object_pairs_hook=OrderedDict)
+    arrays = OrderedDict()
+    for nombre, desc in cabecera.pop('arrays').items():
+        dtype = np.dtype(desc['dtype'])
+        shape = tuple(desc['shape'])
+        count = int(np.prod(shape)) if shape else 1
+        arrays[nombre] = np.frombuffer(buf, dtype=dtype, count=count,
+                                       offset=desc['offset']).reshape(shape)
+    return cabecera, arrays
+
+def guardasnapshot(edificio, filename):
+    """Guarda una instantánea de un EdificioLIDER en filename"""
+    total, partes = empaqueta(*arraysedificio(edificio))
+    with io.open(filename, 'wb') as ff:
+        for pos, datos in partes:
+            ff.seek(pos)
+            ff.write(datos.tobytes() if isinstance(datos, np.ndarray) else datos)
+        ff.truncate(total)
+
+def cargasnapshot(filename, mmap=True):
+    """Carga una instantánea de edificio guardada con guardasnapshot
+
+    Con mmap=True el archivo se proyecta en memoria y los arrays son vistas
+    de solo lectura que no se leen del disco hasta que se usan.
+    """
+    if mmap:
+        buf = np.memmap(filename, dtype=np.uint8, mode='r')
+    else:
+        with io.open(filename, 'rb') as ff:
+            buf = ff.read()
+    return SnapshotEdificio(*desempaqueta(buf))
+
+class SnapshotEdificio(object):
+    """Instantánea de un edificio en forma de arrays
+
+    cabecera - Diccionario de metadatos y tablas de nombres
+    arrays - Diccionario de arrays del edificio (ver documentación del módulo)
+    """
+    def __init__(self, cabecera, arrays):
+        self.cabecera = cabecera
+        self.arrays = arrays
+
+    @classmethod
+    def desdeedificio(cls, edificio):
+        """Instantánea en memoria de un EdificioLIDER"""
+        return cls(*arraysedificio(edificio))
+
+    @property
+    def zonas(self):
+        return self.cabecera['zonas']
+
+    @property
+    def plantas(self):
+        return self.cabecera['plantas']
+
+    @property
+    def nbytes(self):
+        """Tamaño de los arrays de la instantánea [bytes]"""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def edificio(self):
+        """Reconstruye el EdificioLIDER de la instantánea"""
+        cab, arr = self.cabecera, self.arrays
+        edificio = EdificioLIDER(cab['nombre'])
+        edificio.numplantas = cab['numplantas']
+        edificio.numzonas = cab['numzonas']
+        edificio.superficie = cab['superficie']
+        edificio.calefaccion = cab['calefaccion']
+        edificio.refrigeracion = cab['refrigeracion']
+        edificio.calefaccion_meses = arr['edificio_calefaccion_meses'].tolist()
+        edificio.refrigeracion_meses = arr['edificio_refrigeracion_meses'].tolist()
+        edificio.resdata = arr['resdata'].tobytes().decode('utf-8')
+        for nombreplanta in cab['plantas']:
+            edificio[nombreplanta] = PlantaLIDER(nombreplanta)
+
+        grupos = cab['grupos']
+        componentes = cab['componentes']
+        limites = arr['zona_componentes']
+        valorescomponentes = arr['componentes'].tolist()
+        valoresgrupos = arr['zona_grupos'].tolist()
+        for iz, nombrezona in enumerate(cab['zonas']):
+            nombreplanta = cab['plantas'][arr['zona_planta'][iz]]
+            zona = ZonaLIDER(nombrezona,
+                             superficie=float(arr['zona_superficie'][iz]),
+                             multiplicador=float(arr['zona_multiplicador'][iz]),
+                             calefaccion=float(arr['zona_calefaccion'][iz]),
+                             refrigeracion=float(arr['zona_refrigeracion'][iz]))
+            zona.numero = int(arr['zona_numero'][iz])
+            zona.planta = nombreplanta
+            zona.calefaccion_meses = arr['zona_calefaccion_meses'][iz].tolist()
+            zona.refrigeracion_meses = arr['zona_refrigeracion_meses'][iz].tolist()
+            zona.grupos = OrderedDict((grupo, ComponenteLIDER(grupo, *vals))
+                                      for grupo, vals in zip(grupos, valoresgrupos[iz]))
+            for ic in range(limites[iz], limites[iz + 1]):
+                zona[componentes[ic]] = ComponenteLIDER(componentes[ic], *valorescomponentes[ic])
+            edificio[nombreplanta][nombrezona] = zona
+
+        for nombre, factor in cab['factores']:
+            edificio.aplicafactor(nombre, factor)
+        return edificio
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from sol.resparser import loadfile
+
+    parser = argparse.ArgumentParser(description=u'Instantáneas binarias de archivos de resultados de LIDER')
+    parser.add_argument('resfile', action='store', help=u'Archivo .res de LIDER')
+    parser.add_argument('snapfile', action='store', help=u'Archivo de instantánea generado')
+    args = parser.parse_args()
+
+    guardasnapshot(loadfile(args.resfile), args.snapfile)
+    t0 = time.time()
+    snap = cargasnapshot(args.snapfile)
+    ed = snap.edificio()
+    print(u"Instantánea %s: %i plantas, %i zonas, %i bytes de datos (%.1f ms)" %
+          (args.snapfile, len(ed), len(ed.zonas), snap.nbytes, 1000 * (time.time() - t0)))
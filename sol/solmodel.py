@@ -23,14 +23,247 @@
 """Modelo de datos de la herramienta ViSol"""
 
 import os
-from collections import namedtuple
+import itertools
+import threading
+from collections import namedtuple, OrderedDict
 from .observer import Subject
 from . import resparser
 from . import binparser
+from . import cargas
+from . import validacion
+from .binindex import buscabin
+from .clases import EdificioLIDER, PlantaLIDER, ZonaLIDER
+from .lru import CacheLRU
 from .config import config
 
 Index = namedtuple('Index', ['edificio', 'planta', 'zona', 'componente'])
 
+# Números de serie de los edificios cargados
+_SERIES = itertools.count(1)
+
+# Tamaño aproximado en memoria de los objetos del modelo de edificio [bytes]
+BYTESZONA = 4096
+BYTESCOMPONENTE = 1536
+
+def _mtime(path):
+    """Fecha de modificación de un archivo o None si no existe"""
+    try:
+        return os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+def _clave(path):
+    """Clave de la caché de proyectos para un archivo de resultados"""
+    path = os.path.abspath(path)
+    return (path, _mtime(path))
+
+def gruposedificio(edificio):
+    """Diccionario ordenado de zonas de un edificio y de cada planta, por nombre"""
+    grupos = OrderedDict([(edificio.nombre, [zona for planta in edificio.values()
+                                             for zona in planta])])
+    grupos.update((planta.nombre, list(planta)) for planta in edificio.values())
+    return grupos
+
+class Proyecto(object):
+    """Edificio, datos horarios y datos derivados de un archivo ya cargado
+
+    Se guardan en la caché de proyectos del modelo para poder volver a abrir
+    el archivo sin leerlo de nuevo. Se descartan si cambia el archivo .bin.
+    """
+    def __init__(self, edificio, binfile, horarios=None, bindata=None, serie=None,
+                 validacion=None):
+        self.edificio = edificio
+        self.serie = serie
+        self.binfile = binfile
+        self.binmtime = _mtime(binfile)
+        self.horarios = horarios
+        self.bindata = bindata
+        self.validacion = validacion
+
+    @property
+    def valido(self):
+        """Indica si el archivo .bin no ha cambiado desde la carga"""
+        return _mtime(self.binfile) == self.binmtime
+
+    @property
+    def nbytes(self):
+        """Tamaño aproximado en memoria [bytes]"""
+        edificio = self.edificio
+        zonas = list(edificio.zonas)
+        total = (2 * len(edificio.resdata) + BYTESZONA * len(zonas) +
+                 BYTESCOMPONENTE * sum(len(zona) for zona in zonas))
+        if self.horarios is not None:
+            total += self.horarios.nbytes
+        if self.bindata is not None:
+            total += sum(int(df.memory_usage().sum()) for df in self.bindata)
+        if self.validacion is not None:
+            total += self.validacion.nbytes
+        return total
+
+class CargaArchivo(object):
+    """Carga de un archivo de resultados y su archivo .bin asociado
+
+    La carga se realiza por etapas, notificando el avance al modelo con la
+    etiqueta 'carga':
+
+    - 'res': lectura del archivo de resultados
+    - 'agregados': cálculo de agregados de plantas y edificio
+    - 'bin': proyección en memoria del archivo .bin
+    - 'horarios': lectura completa de los datos horarios y cálculo de sus
+      rangos (binparser.VARIABLESRANGO) y de los datos agregados de plantas
+      y edificio
+
+    El edificio se publica en el modelo en cuanto se han calculado los
+    agregados, de modo que el árbol y las gráficas de demandas pueden usarse
+    antes de leer el archivo .bin. Los datos horarios se publican primero
+    proyectados en memoria, de modo que la zona seleccionada se lee del disco
+    sin esperar al resto, y después ya leídos en su totalidad, junto con la
+    comprobación de las demandas del archivo de resultados con las del .bin
+    (ver validacion.ValidacionDemandas).
+
+    Si la carga se cancela, los resultados posteriores se descartan.
+    """
+    etapas = ('res', 'agregados', 'bin', 'horarios')
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self.error = None
+        self._cancelada = threading.Event()
+
+    def cancela(self):
+        """Cancela la carga. Los resultados obtenidos se descartan"""
+        self._cancelada.set()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def _avance(self, etapa):
+        """Notifica el comienzo de una etapa de la carga"""
+        progreso = float(self.etapas.index(etapa)) / len(self.etapas)
+        self.model.enprincipal(self.model.avancecarga, self, etapa, progreso)
+
+    def ejecuta(self):
+        """Realiza la carga. Puede ejecutarse en un hilo auxiliar"""
+        try:
+            self._avance('res')
+            edificio = resparser.loadfile(self.path)
+            if self.cancelada:
+                return
+            self._avance('agregados')
+            # Agregados del edificio y sus plantas, calculados antes de
+            # publicar el edificio para no hacerlo en el hilo principal
+            edificio.calculaagregados()
+            if self.cancelada:
+                return
+            binfile = buscabin(self.path, [zona.nombre for zona in edificio.zonas])
+            self.model.enprincipal(self.model.publicaedificio, self, edificio, binfile)
+            if binfile is None:
+                self.model.enprincipal(self.model.finalizacarga, self)
+                return
+            self._avance('bin')
+            horarios = binparser.DatosHorarios.desdeBIN(binfile, copia=False)
+            if self.cancelada:
+                return
+            self.model.enprincipal(self.model.publicahorarios, self, horarios)
+            self._avance('horarios')
+            horarios = binparser.DatosHorarios.desdeBIN(binfile)
+            for variable in binparser.VARIABLESRANGO:
+                horarios.rango(variable)
+            # Agregados de plantas y edificio, que no se calculan en el hilo principal
+            grupos = gruposedificio(edificio)
+            agregados = horarios.agrupa(grupos)
+            agregados.rango('Treal')
+            for nombre in grupos:
+                agregados.diarios(nombre)
+            comprobacion = validacion.ValidacionDemandas.desdedatos(edificio, horarios)
+            if self.cancelada:
+                return
+            self.model.enprincipal(self.model.publicahorarios, self, horarios, comprobacion)
+        except Exception as exc:
+            self.error = exc
+            self.model.enprincipal(self.model.errorcarga, self, exc)
+            return
+        self.model.enprincipal(self.model.finalizacarga, self)
+
+class Precalculo(object):
+    """Cálculo anticipado de los datos de los nodos vecinos del objeto activo
+
+    Tras cada selección es probable pasar a la zona anterior o siguiente o a
+    la planta que la contiene. Sus demandas, grupos y valores diarios del
+    archivo .bin se calculan en tiempo libre del bucle principal (con el
+    programador del modelo), un nodo en cada llamada y como máximo maxnodos
+    nodos. Una nueva selección cancela el cálculo pendiente.
+
+    Los datos horarios agregados de plantas y edificio se calculan en la
+    carga del archivo (ver CargaArchivo) y aquí no se calculan nunca.
+    """
+    def __init__(self, model, maxnodos=6):
+        self.model = model
+        self.maxnodos = maxnodos
+        self._generacion = 0
+        self._pendientes = []
+
+    def vecinos(self, index):
+        """Objetos próximos al de índice dado, por orden de probabilidad de uso"""
+        edificio = self.model.edificio
+        plantas = list(edificio.values())
+        if index.planta == '':
+            return plantas
+        planta = edificio[index.planta]
+        pos = plantas.index(planta)
+        if index.zona == '':
+            # Plantas anterior y siguiente y primera zona de la planta
+            objetos = plantas[pos + 1:pos + 2] + plantas[max(pos - 1, 0):pos]
+            return objetos + list(planta.values())[:1] + [edificio]
+        zonas = list(planta.values())
+        zona = planta[index.zona]
+        i = zonas.index(zona)
+        # Zonas siguientes y anteriores, alternando, y planta que las contiene
+        objetos = [zona] if index.componente != '' else []
+        for salto in range(1, self.maxnodos):
+            objetos.extend(zonas[j] for j in (i + salto, i - salto) if 0 <= j < len(zonas))
+        return objetos[:self.maxnodos - 1] + [planta]
+
+    def inicia(self, index):
+        """Cancela el cálculo pendiente y programa el de los vecinos de index"""
+        self._generacion += 1
+        self._pendientes = []
+        if self.model.programador is None or self.model.edificio is None:
+            return
+        self._pendientes = self.vecinos(index)[:self.maxnodos]
+        self.model.programador(self._paso, self._generacion)
+
+    def cancela(self):
+        """Cancela el cálculo pendiente"""
+        self._generacion += 1
+        self._pendientes = []
+
+    def _paso(self, generacion):
+        """Calcula los datos de un nodo. Devuelve True si quedan nodos pendientes"""
+        if generacion != self._generacion or not self._pendientes:
+            return False
+        self.calcula(self._pendientes.pop(0))
+        return bool(self._pendientes)
+
+    def calcula(self, objeto):
+        """Calcula y guarda los datos derivados de un objeto del edificio"""
+        objeto.demandas
+        objeto.calefaccion_meses
+        objeto.refrigeracion_meses
+        objeto.grupos
+        horarios = self.model.horarios
+        if isinstance(objeto, ZonaLIDER) and horarios is not None and objeto.nombre in horarios:
+            horarios.diarios(objeto.nombre)
+            horarios.rango('Treal', objeto.nombre)
+        elif isinstance(objeto, (PlantaLIDER, EdificioLIDER)) and horarios is not None:
+            # Con los datos proyectados aún no se han calculado los agregados
+            if not horarios.proyectado:
+                agregados = self.model.horariosagregados
+                agregados.diarios(objeto.nombre)
+                agregados.rango('Treal')
+
 class VISOLModel(Subject):
     """Modelo para la aplicación ViSOL"""
     modos = ('edificio', 'planta', 'zona', 'componente')
@@ -42,6 +275,21 @@ class VISOLModel(Subject):
         self._modo = None  # Tipo del objeto activo
         self._index = None # Índice del objeto activo
         self._file = None
+        self._binfile = None
+        self.horarios = None # Datos horarios del archivo .bin (DatosHorarios)
+        # Comprobación de demandas con el archivo .bin (ValidacionDemandas)
+        self.validacion = None
+        self._bindata = None
+        # Carga en hilo auxiliar y función para ejecutar tareas en el hilo
+        # principal (p.e. GLib.idle_add). Sin ella, se ejecutan directamente.
+        self.asincrono = False
+        self.programador = None
+        self._carga = None # Carga de archivo en curso
+        # Proyectos cargados recientemente, limitados por tamaño (cachemb en MB)
+        self.proyectos = CacheLRU(self.config.get('cachemb', 512) * 2**20)
+        self._clave = None # Clave del proyecto actual en la caché
+        self.precalculo = Precalculo(self)
+        self._serie = 0 # Número de serie del edificio
 
     @property
     def modo(self):
@@ -75,6 +323,87 @@ class VISOLModel(Subject):
             self.activo = edf[idx.planta][idx.zona][idx.componente]
 
         self.notify(label='index')
+        self.precalculo.inicia(self._index)
+
+    @property
+    def horariosagregados(self):
+        """Datos horarios agregados del edificio y sus plantas (DatosHorarios) o None
+
+        Cada planta y el edificio son una "zona", de nombre el de la planta o
+        el edificio (ver DatosHorarios.agrupa). Se guardan con los datos
+        horarios del archivo.
+        """
+        if self.horarios is None or self.edificio is None:
+            return None
+        return self.horarios.agrupa(self.grupos())
+
+    def grupos(self):
+        """Diccionario ordenado de zonas del edificio y de cada planta, por nombre"""
+        return gruposedificio(self.edificio)
+
+    def analisisconfort(self, modo=None):
+        """Horas y grados hora fuera de consigna (AnalisisConfort) de zonas o de plantas y edificio
+
+        modo - 'zona' para las zonas y 'planta' o 'edificio' para plantas y
+               edificio. Por defecto, el modo actual.
+        """
+        if self.horarios is None:
+            return None
+        modo = modo or self.modo
+        return self.horarios.confort(None if modo == 'zona' else self.grupos())
+
+    @property
+    def umbralescarga(self):
+        """Umbrales de carga total por superficie [W/m²] (opción umbralescarga)"""
+        return cargas.umbrales(self.config)
+
+    def analisiscargas(self, modo=None):
+        """Cargas punta y curvas de duración (AnalisisCargas) de zonas o de plantas y edificio
+
+        modo - 'zona' para las zonas y 'planta' o 'edificio' para los datos
+               agregados. Por defecto, el modo actual.
+        """
+        modo = modo or self.modo
+        horarios = self.horarios if modo == 'zona' else self.horariosagregados
+        if horarios is None:
+            return None
+        return horarios.cargas(self.umbralescarga)
+
+    def filascargas(self):
+        """Resultados de cargas de edificio, plantas y zonas para su exportación"""
+        if self.horarios is None:
+            return []
+        tipos = dict((planta, u'planta') for planta in self.edificio)
+        tipos[self.edificio.nombre] = u'edificio'
+        return (self.analisiscargas('edificio').filas(tipos) +
+                self.analisiscargas('zona').filas(u'zona'))
+
+    @property
+    def factores(self):
+        """Factores de escala aplicados a grupos o componentes del edificio"""
+        return self.edificio.factores
+
+    @property
+    def revision(self):
+        """Identificador del edificio cargado y de sus factores de escala
+
+        Cambia al cargar un edificio o modificar sus factores, de modo que
+        sirve para saber si siguen siendo válidos los datos calculados a
+        partir del edificio.
+        """
+        if self.edificio is None:
+            return None
+        return (self._serie, tuple(self.factores.items()))
+
+    def setfactor(self, nombre, factor=1.0):
+        """Aplica un factor de escala a un grupo o componente del edificio
+
+        Solo se recalcula la contribución de las zonas afectadas.
+        """
+        if self.edificio is None or self.factores.get(nombre, 1.0) == factor:
+            return
+        self.edificio.aplicafactor(nombre, factor)
+        self.notify(label='factores')
 
     @property
     def file(self):
@@ -82,30 +411,161 @@ class VISOLModel(Subject):
 
     @file.setter
     def file(self, value):
-        if value != self.file:
-            if not os.path.exists(value):
+        if self._carga is not None:
+            if value == self._carga.path:
                 return
-            self._file = value
-            self.edificio = resparser.loadfile(value)
-            # Probamos primero a ver si hay un bin con el mismo nombre que el res,
-            # luego uno con ResumenRCC_nombrearchivores.bin y
-            # finalmente el primero que encuentre.
-            respathdir = self.dirname
-            binfiles = [ff for ff in os.listdir(respathdir) if ff.lower().endswith('.bin')]
-            if binfiles:
-                samename = self.filename + '.bin'
-                resumenrccname = 'ResumenRCC_' + self.filename + '.bin'
-                if samename in binfiles:
-                    binfile = samename
-                elif resumenrccname in binfiles:
-                    binfile = resumenrccname
-                else:
-                    binfile = binfiles[0]
-                self._binfile = os.path.join(respathdir, binfile)
-                self.bindata = binparser.readBIN(self._binfile)
-            else:
-                self._binfile = None
-                self.bindata = None
+            if value == self.file:
+                # Volvemos al archivo actual cancelando la carga en curso
+                self._carga.cancela()
+                self._carga = None
+                return
+        if value != self.file:
+            self.cargar(value)
+
+    @property
+    def cargando(self):
+        """Indica si hay una carga de archivo en curso"""
+        return self._carga is not None
+
+    def cargar(self, path):
+        """Carga un archivo de resultados y su archivo .bin asociado
+
+        Con asincrono=True la carga se hace en un hilo auxiliar y cancela la
+        que estuviese en curso. El edificio se sustituye al terminar la carga,
+        notificándolo con la etiqueta 'file'.
+
+        Los archivos cargados recientemente se toman de la caché de proyectos.
+        """
+        if not os.path.exists(path):
+            return
+        if self._carga is not None:
+            self._carga.cancela()
+            self._carga = None
+        clave = _clave(path)
+        proyecto = self.proyectos.get(clave)
+        if proyecto is not None and not proyecto.valido:
+            self.proyectos.pop(clave)
+            proyecto = None
+        if proyecto is not None:
+            self._guardaproyecto()
+            self._muestraproyecto(path, clave, proyecto)
+            return
+        carga = CargaArchivo(self, path)
+        self._carga = carga
+        if self.asincrono:
+            hilo = threading.Thread(target=carga.ejecuta, name='CargaArchivo')
+            hilo.daemon = True
+            hilo.start()
+        else:
+            carga.ejecuta()
+            if carga.error is not None:
+                raise carga.error
+
+    def enprincipal(self, funcion, *args):
+        """Ejecuta funcion en el hilo principal, usando el programador si existe"""
+        if self.programador is None:
+            funcion(*args)
+        else:
+            self.programador(funcion, *args)
+
+    def avancecarga(self, carga, etapa, progreso):
+        """Notifica el avance de una carga que no se ha cancelado"""
+        if carga is self._carga:
+            self.notify(label='carga', etapa=etapa, progreso=progreso, file=carga.path)
+        return False
+
+    def errorcarga(self, carga, error):
+        """Notifica el error en una carga que no se ha cancelado"""
+        if carga is self._carga:
+            self._carga = None
+            self.notify(label='carga', etapa='error', error=error, file=carga.path)
+        return False
+
+    def publicaedificio(self, carga, edificio, binfile):
+        """Sustituye el edificio por el de una carga que no se ha cancelado
+
+        Los datos horarios anteriores se descartan hasta que la carga
+        publique los nuevos.
+        """
+        if carga is not self._carga or carga.cancelada:
+            return False
+        self._guardaproyecto()
+        self.precalculo.cancela()
+        self._clave = None
+        self._file = carga.path
+        self.edificio = edificio
+        self._serie = next(_SERIES)
+        self._binfile = binfile
+        self.horarios = None
+        self.validacion = None
+        self._bindata = None
+        self.activo = None
+        self._modo = None
+        self._index = None
+        self.notify(label='file', file=carga.path)
+        return False
+
+    def publicahorarios(self, carga, horarios, validacion=None):
+        """Sustituye los datos horarios por los de una carga no cancelada
+
+        validacion - Comprobación de las demandas con los datos horarios, si
+                     ya se ha realizado
+        """
+        if carga is not self._carga or carga.cancelada:
+            return False
+        self.horarios = horarios
+        self.validacion = validacion
+        self._bindata = None
+        self.notify(label='horarios', file=carga.path)
+        return False
+
+    def finalizacarga(self, carga):
+        """Da por terminada una carga que no se ha cancelado"""
+        if carga is not self._carga or carga.cancelada:
+            return False
+        self._carga = None
+        self._clave = _clave(carga.path)
+        self._guardaproyecto()
+        self.notify(label='carga', etapa='fin', progreso=1.0, file=carga.path)
+        return False
+
+    def _guardaproyecto(self):
+        """Guarda el proyecto actual, ya cargado, en la caché de proyectos
+
+        Se vuelve a guardar al abandonarlo para contabilizar los datos
+        derivados calculados mientras estuvo activo.
+        """
+        if self._clave is None:
+            return
+        self.proyectos.put(self._clave, Proyecto(self.edificio, self._binfile,
+                                                 self.horarios, self._bindata,
+                                                 self._serie, self.validacion))
+
+    def _muestraproyecto(self, path, clave, proyecto):
+        """Sustituye el proyecto actual por uno de la caché de proyectos"""
+        self.precalculo.cancela()
+        self._clave = clave
+        self._file = path
+        self.edificio = proyecto.edificio
+        self._serie = proyecto.serie
+        self._binfile = proyecto.binfile
+        self.horarios = proyecto.horarios
+        self.validacion = proyecto.validacion
+        self._bindata = proyecto.bindata
+        self.activo = None
+        self._modo = None
+        self._index = None
+        self.notify(label='file', file=path)
+        if self.horarios is not None:
+            self.notify(label='horarios', file=path)
+        self.notify(label='carga', etapa='fin', progreso=1.0, file=path)
+
+    @property
+    def bindata(self):
+        """Dataframes de datos de zonas del archivo .bin (ver binparser.readBIN)"""
+        if self._bindata is None and self.horarios is not None:
+            self._bindata = self.horarios.dataframes()
+        return self._bindata
 
     @property
     def filename(self):
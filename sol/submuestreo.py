@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   submuestreo.py
+#   Submuestreo de series horarias para su representación
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Submuestreo de series horarias para su representación
+
+Representar las 8760 horas de una serie es lento e inútil cuando el eje
+tiene unos cientos de píxeles. Las series se agrupan en intervalos y de cada
+intervalo se representan el mínimo y el máximo, lo que conserva la envolvente
+que se vería al dibujar todos los puntos.
+
+Los mínimos y máximos se guardan precalculados por horas, días y semanas
+(Piramide), de modo que para cada intervalo visible se parte del nivel más
+grueso que sigue teniendo al menos un intervalo por píxel.
+"""
+
+import numpy as np
+
+# Horas de cada intervalo en los niveles de la pirámide: hora, día y semana
+PASOS = (1, 24, 168)
+
+class Piramide(object):
+    """Mínimos y máximos de una serie horaria por horas, días y semanas
+
+    niveles - Lista de tuplas (paso, mínimos, máximos) con paso en horas
+    """
+    def __init__(self, valores, pasos=PASOS):
+        valores = np.asarray(valores, dtype=float)
+        self.horas = len(valores)
+        self.niveles = [(1, valores, valores)]
+        for paso in pasos[1:]:
+            inicios = np.arange(0, self.horas, paso)
+            self.niveles.append((paso,
+                                 np.minimum.reduceat(valores, inicios),
+                                 np.maximum.reduceat(valores, inicios)))
+
+    @property
+    def nbytes(self):
+        """Tamaño de los niveles agregados y de la serie si no es una vista [bytes]"""
+        paso, valores, _ = self.niveles[0]
+        return ((valores.nbytes if valores.base is None else 0) +
+                sum(mn.nbytes + mx.nbytes for (paso, mn, mx) in self.niveles[1:]))
+
+    def tramo(self, inicio, fin, npuntos):
+        """Mínimos y máximos de las horas [inicio, fin) en unos npuntos intervalos
+
+        Devuelve la hora de comienzo de cada intervalo, el paso de los
+        intervalos [h] y sus mínimos y máximos. Con paso 1 los mínimos y
+        máximos coinciden con los valores horarios.
+        """
+        inicio, fin = max(int(inicio), 0), min(int(np.ceil(fin)), self.horas)
+        npuntos = max(int(npuntos), 1)
+        # Nivel más grueso con al menos npuntos intervalos
+        for paso, minimos, maximos in reversed(self.niveles):
+            if (fin - inicio) // paso >= npuntos or paso == 1:
+                break
+        i0, i1 = inicio // paso, -(-fin // paso)
+        minimos, maximos = minimos[i0:i1], maximos[i0:i1]
+        indices = np.arange(len(minimos))
+        grupo = len(minimos) // npuntos
+        if grupo > 1:
+            # Agrupamos de nuevo para no superar el número de puntos
+            indices = indices[::grupo]
+            minimos = np.minimum.reduceat(minimos, indices)
+            maximos = np.maximum.reduceat(maximos, indices)
+        return (i0 + indices) * paso, paso * max(grupo, 1), minimos, maximos
+
+    def envolvente(self, inicio, fin, npuntos):
+        """Puntos (horas, valores) de la envolvente de las horas [inicio, fin)
+
+        Cada intervalo aporta su mínimo y su máximo, de modo que la línea que
+        los une cubre los mismos píxeles que la de todos los valores horarios.
+        Sin submuestreo se devuelven directamente los valores horarios.
+        """
+        horas, paso, minimos, maximos = self.tramo(inicio, fin, npuntos)
+        if paso == 1:
+            return horas, minimos
+        # El mínimo y el máximo se sitúan en la mitad del intervalo
+        horas = np.repeat(horas + 0.5 * paso, 2)
+        return horas, np.column_stack((minimos, maximos)).ravel()
@@ -42,3 +42,18 @@ APPROOT = get_main_dir()
 def get_resource(*path_list):
     "Localiza un recurso del proyecto en base al directorio base del paquete"
     return os.path.abspath(os.path.join(APPROOT, *path_list))
+
+def get_cachedir(*path_list):
+    """Localiza un archivo en el directorio de caché del usuario
+
+    En Windows es %LOCALAPPDATA%\\ViSol y en otros sistemas
+    $XDG_CACHE_HOME/visol (por defecto, ~/.cache/visol). No se crea el
+    directorio.
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA', None) or os.path.expanduser('~')
+        directorio = os.path.join(base, 'ViSol')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', None) or os.path.expanduser(os.path.join('~', '.cache'))
+        directorio = os.path.join(base, 'visol')
+    return os.path.abspath(os.path.join(directorio, *path_list))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   validacion.py
+#   Comprobación de las demandas del archivo de resultados con el archivo BIN
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Comprobación de las demandas del archivo de resultados con el archivo BIN
+
+Los flujos por componentes del archivo de resultados se obtienen a
+temperatura interior constante, pero las demandas de edificio y zonas
+corresponden a la temperatura interior variable, igual que los datos
+horarios del archivo BIN (ver TODO.txt).
+
+Las demandas mensuales de cada zona se obtienen del archivo BIN sumando la
+carga sensible (QS) en las horas con demanda de calefacción (daCal) y de
+refrigeración (daRef), para todas las zonas a la vez y con una suma por
+tramos en los límites de cada mes, y se comparan con las demandas mensuales
+por zonas del archivo de resultados (calefaccion_meses y
+refrigeracion_meses, en kWh/m²). La carga latente (QL) de esas horas se
+calcula aparte, ya que no forma parte de las demandas del archivo de
+resultados.
+
+Ejemplo:
+
+    python -m sol.validacion test.res test.bin
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from sol.confort import INICIOSMES
+
+# Demandas comparadas y variable horaria que indica las horas con demanda
+DEMANDAS = OrderedDict([('calefaccion', 'daCal'), ('refrigeracion', 'daRef')])
+# Diferencia absoluta [kWh/m²] y relativa admisibles entre ambos archivos
+TOLERANCIA = 0.05
+TOLERANCIARELATIVA = 0.01
+
+def demandasmensuales(horarios, variable='QS'):
+    """Demandas mensuales de todas las zonas de un DatosHorarios [kWh/m²]
+
+    variable - Carga horaria integrada en las horas con demanda [W]
+
+    Devuelve un diccionario ordenado con un array zonas x 12 para cada
+    demanda de DEMANDAS.
+    """
+    datos = horarios.horarios
+    area = np.maximum(np.asarray(horarios.zonas['Area'], dtype=float), 1e-6)[:, None]
+    # Una sola suma por tramos para las dos demandas de todas las zonas
+    horasdemanda = np.stack([datos[indicador] != 0 for indicador in DEMANDAS.values()])
+    cargas = np.where(horasdemanda, datos[variable], 0.0)
+    sumas = np.add.reduceat(cargas, INICIOSMES, axis=2, dtype=float) / (1000.0 * area)
+    return OrderedDict(zip(DEMANDAS, sumas))
+
+class ValidacionDemandas(object):
+    """Comparación de las demandas mensuales por zonas de los archivos de resultados y BIN
+
+    nombres - Nombres de las zonas comunes a ambos archivos
+    bin, res - Diccionarios de arrays zonas x 12 con las demandas de cada
+               archivo para cada demanda de DEMANDAS [kWh/m²]
+    latente - Diccionario de arrays zonas x 12 con la carga latente de las
+              horas con demanda del archivo BIN [kWh/m²]
+    sinbin, sinres - Zonas que solo están en el archivo de resultados o BIN
+    """
+    def __init__(self, nombres, bin, res, latente=None, sinbin=(), sinres=()):
+        self.nombres = list(nombres)
+        self.bin = bin
+        self.res = res
+        self.latente = latente
+        self.sinbin = list(sinbin)
+        self.sinres = list(sinres)
+        self._indice = dict((nombre, i) for (i, nombre) in enumerate(self.nombres))
+
+    @classmethod
+    def desdedatos(cls, edificio, horarios):
+        """Compara las demandas de un edificio (EdificioLIDER) con las de su DatosHorarios"""
+        zonasres = OrderedDict((zona.nombre, zona) for zona in edificio.zonas)
+        enres = set(zonasres)
+        nombres = [nombre for nombre in horarios.nombres if nombre in enres]
+        indices = [i for (i, nombre) in enumerate(horarios.nombres) if nombre in enres]
+        enbin = OrderedDict((demanda, valores[indices])
+                            for (demanda, valores) in demandasmensuales(horarios).items())
+        latente = OrderedDict((demanda, valores[indices])
+                              for (demanda, valores) in demandasmensuales(horarios, 'QL').items())
+        res = OrderedDict((demanda, np.array([getattr(zonasres[nombre], demanda + '_meses')
+                                              for nombre in nombres], dtype=float).reshape(-1, 12))
+                          for demanda in DEMANDAS)
+        sinbin = [nombre for nombre in zonasres if nombre not in horarios]
+        sinres = [nombre for nombre in horarios.nombres if nombre not in enres]
+        return cls(nombres, enbin, res, latente, sinbin, sinres)
+
+    def __contains__(self, nombre):
+        return nombre in self._indice
+
+    def diferencias(self, demanda):
+        """Diferencias mensuales BIN - resultados de una demanda (zonas x 12) [kWh/m²]"""
+        return self.bin[demanda] - self.res[demanda]
+
+    def anual(self, demanda, origen='bin'):
+        """Demandas anuales de todas las zonas de un archivo ('bin' o 'res') [kWh/m²]"""
+        return getattr(self, origen)[demanda].sum(axis=1)
+
+    def discrepancias(self, tolerancia=TOLERANCIA, relativa=TOLERANCIARELATIVA):
+        """Lista de diccionarios ordenados con las demandas que no coinciden
+
+        Se comparan los valores mensuales y anuales de cada zona. Una demanda
+        no coincide si su diferencia supera la tolerancia absoluta [kWh/m²] y
+        la relativa al valor del archivo de resultados.
+        """
+        filas = []
+        for demanda in DEMANDAS:
+            # Columnas 0 a 11 para los meses y 12 para el año
+            enbin = np.column_stack([self.bin[demanda], self.anual(demanda, 'bin')])
+            enres = np.column_stack([self.res[demanda], self.anual(demanda, 'res')])
+            diferencia = enbin - enres
+            fuera = np.abs(diferencia) > np.maximum(tolerancia, relativa * np.abs(enres))
+            for i, j in zip(*np.nonzero(fuera)):
+                filas.append(OrderedDict([('nombre', self.nombres[i]),
+                                          ('demanda', demanda),
+                                          ('mes', u'anual' if j == 12 else int(j) + 1),
+                                          ('res', round(float(enres[i, j]), 2)),
+                                          ('bin', round(float(enbin[i, j]), 2)),
+                                          ('diferencia', round(float(diferencia[i, j]), 2))]))
+        return filas
+
+    def resumen(self, tolerancia=TOLERANCIA, relativa=TOLERANCIARELATIVA):
+        """Texto con el resultado de la comprobación"""
+        discrepancias = self.discrepancias(tolerancia, relativa)
+        zonas = set(fila['nombre'] for fila in discrepancias)
+        texto = u'%i de %i zonas con demandas distintas en los archivos de resultados y BIN' % (
+            len(zonas), len(self.nombres))
+        if self.sinbin or self.sinres:
+            texto += u' (%i zonas sin datos horarios, %i sin resultados)' % (len(self.sinbin),
+                                                                              len(self.sinres))
+        return texto
+
+    @property
+    def nbytes(self):
+        """Tamaño de los resultados [bytes]"""
+        return sum(valores.nbytes for resultados in (self.bin, self.res, self.latente or {})
+                   for valores in resultados.values())
+
+if __name__ == '__main__':
+    import argparse
+    from sol.binparser import DatosHorarios
+    from sol.resparser import loadfile
+
+    parser = argparse.ArgumentParser(description=u'Comprueba las demandas de un archivo de resultados con su archivo BIN')
+    parser.add_argument('resfile', action="store", default='test.res')
+    parser.add_argument('binfile', action="store", default='test.bin')
+    parser.add_argument('-t', '--tolerancia', action="store", type=float, default=TOLERANCIA,
+                        help=u'Diferencia absoluta admisible [kWh/m²]')
+    parser.add_argument('-r', '--relativa', action="store", type=float, default=TOLERANCIARELATIVA,
+                        help=u'Diferencia relativa admisible')
+    params = parser.parse_args()
+
+    validacion = ValidacionDemandas.desdedatos(loadfile(params.resfile),
+                                               DatosHorarios.desdeBIN(params.binfile))
+    for fila in validacion.discrepancias(params.tolerancia, params.relativa):
+        print(u'%(nombre)s, %(demanda)s, mes %(mes)s: res %(res).2f, bin %(bin).2f kWh/m²' % fila)
+    print(validacion.resumen(params.tolerancia, params.relativa))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   variantes.py
+#   Matriz de variantes de un edificio a partir de varios archivos .res
+#
+#   Copyright (C) 2014-2015 Rafael Villar Burke <pachi@ietcc.csic.es>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#
+"""Matriz de variantes de un mismo edificio
+
+Reúne los resultados de varios archivos .res de un edificio (variantes de
+aislamiento, vidrios, orientación...) en un único array alineado de
+dimensiones variantes x zonas x grupos x 6, donde la última dimensión
+corresponde a (cal+, cal-, cal, ref+, ref-, ref) [kWh/m²·año].
+
+Las zonas se alinean por nombre. Si una zona no existe en alguna variante
+sus valores quedan como NaN.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+
+from sol.resparser import loadfile
+from sol.clases import GRUPOSLIDER
+
+DEMANDAS = ('cal+', 'cal-', 'cal', 'ref+', 'ref-', 'ref')
+
+def _flujoszonas(resfile):
+    """Nombres, superficies y flujos por grupo de las zonas de un archivo .res
+
+    Se ejecuta en procesos auxiliares, por lo que devuelve solamente arrays
+    y listas de nombres, y no el objeto EdificioLIDER completo.
+    """
+    edificio = loadfile(resfile)
+    zonas = edificio.zonas
+    nombres = [zona.nombre for zona in zonas]
+    superficies = numpy.array([zona.superficie * zona.multiplicador
+                               for zona in zonas])
+    flujos = numpy.array([[zona.grupos[grupo].values for grupo in GRUPOSLIDER]
+                          for zona in zonas])
+    return nombres, superficies, flujos
+
+class MatrizVariantes(object):
+    """Matriz alineada de resultados de variantes de un edificio
+
+    archivos - Rutas de los archivos .res de cada variante
+    zonas - Nombres de las zonas, en orden de aparición en las variantes
+    grupos - Nombres de los grupos de demanda (GRUPOSLIDER)
+    cubo - Array variantes x zonas x grupos x 6 de flujos [kWh/m²·año]
+    superficies - Array variantes x zonas de superficies (con multiplicador) [m²]
+    """
+    grupos = GRUPOSLIDER
+    demandas = DEMANDAS
+
+    def __init__(self, archivos, zonas, cubo, superficies, mtimes=None):
+        self.archivos = list(archivos)
+        self.zonas = list(zonas)
+        self.cubo = cubo
+        self.superficies = superficies
+        self.mtimes = (numpy.asarray(mtimes, dtype=float) if mtimes is not None
+                       else numpy.array([os.path.getmtime(ff) for ff in archivos]))
+        self._indicezonas = dict((nombre, i) for (i, nombre) in enumerate(self.zonas))
+
+    @classmethod
+    def desdearchivos(cls, archivos, cache=None, procesos=None):
+        """Construye la matriz a partir de una lista de archivos .res
+
+        archivos - Rutas de los archivos .res de las variantes
+        cache - Ruta del archivo .npz de caché del cubo alineado. Si existe y
+                corresponde a los mismos archivos sin modificar se usa sin
+                volver a analizar los .res. Si no, se genera tras el análisis.
+        procesos - Número de procesos de análisis (None, según CPUs; 1, sin
+                   procesos auxiliares)
+        """
+        archivos = [os.path.abspath(ff) for ff in archivos]
+        if cache and os.path.exists(cache):
+            matriz = cls.carga(cache)
+            if matriz.esvalida(archivos):
+                return matriz
+
+        if procesos == 1:
+            resultados = [_flujoszonas(ff) for ff in archivos]
+        else:
+            with ProcessPoolExecutor(max_workers=procesos) as executor:
+                resultados = list(executor.map(_flujoszonas, archivos))
+
+        # Alineación de zonas por nombre
+        indice = {}
+        for nombres, _, _ in resultados:
+            for nombre in nombres:
+                if nombre not in indice:
+                    indice[nombre] = len(indice)
+        zonas = sorted(indice, key=indice.get)
+
+        nv, nz, ng = len(archivos), len(zonas), len(GRUPOSLIDER)
+        cubo = numpy.full((nv, nz, ng, len(DEMANDAS)), numpy.nan)
+        superficies = numpy.full((nv, nz), numpy.nan)
+        for iv in range(nv):
+            nombres, sups, flujos = resultados[iv]
+            # Liberamos cada resultado parcial al pasarlo al cubo
+            resultados[iv] = None
+            pos = [indice[nombre] for nombre in nombres]
+            cubo[iv, pos] = flujos
+            superficies[iv, pos] = sups
+
+        matriz = cls(archivos, zonas, cubo, superficies)
+        if cache:
+            matriz.guarda(cache)
+        return matriz
+
+    def esvalida(self, archivos):
+        """Comprueba si la matriz corresponde a los archivos sin modificar"""
+        if [os.path.abspath(ff) for ff in archivos] != self.archivos:
+            return False
+        try:
+            mtimes = [os.path.getmtime(ff) for ff in self.archivos]
+        except OSError:
+            return False
+        return numpy.array_equal(mtimes, self.mtimes)
+
+    def guarda(self, filename):
+        """Guarda el cubo alineado y sus metadatos en un archivo .npz"""
+        with open(filename, 'wb') as ff:
+            numpy.savez_compressed(ff,
+                                   cubo=self.cubo,
+                                   superficies=self.superficies,
+                                   zonas=numpy.array(self.zonas, dtype=numpy.str_),
+                                   archivos=numpy.array(self.archivos, dtype=numpy.str_),
+                                   mtimes=self.mtimes)
+
+    @classmethod
+    def carga(cls, filename):
+        """Carga una matriz guardada con guarda()"""
+        with numpy.load(filename) as data:
+            return cls(data['archivos'].tolist(), data['zonas'].tolist(),
+                       data['cubo'], data['superficies'], data['mtimes'])
+
+    @property
+    def variantes(self):
+        """Nombres de las variantes (nombre de archivo sin extensión)"""
+        return [os.path.splitext(os.path.basename(ff))[0] for ff in self.archivos]
+
+    def demanda(self, tipo='cal', grupo=u'TOTAL'):
+        """Array variantes x zonas con la demanda de un tipo y grupo [kWh/m²·año]
+
+        tipo - Tipo de demanda: 'cal+', 'cal-', 'cal', 'ref+', 'ref-', 'ref'
+        grupo - Nombre del grupo de demanda
+        """
+        return self.cubo[:, :, self.grupos.index(grupo), self.demandas.index(tipo)]
+
+    def mejorvariante(self, tipo='cal', grupo=u'TOTAL'):
+        """Índice de la variante de menor demanda (en valor absoluto) para cada zona"""
+        return numpy.nanargmin(numpy.abs(self.demanda(tipo, grupo)), axis=0)
+
+    def peorvariante(self, tipo='cal', grupo=u'TOTAL'):
+        """Índice de la variante de mayor demanda (en valor absoluto) para cada zona"""
+        return numpy.nanargmax(numpy.abs(self.demanda(tipo, grupo)), axis=0)
+
+    def edificio(self):
+        """Array variantes x grupos x 6 con los flujos del edificio [kWh/m²·año]
+
+        Media de los flujos de las zonas ponderada por su superficie.
+        """
+        sup = numpy.nan_to_num(self.superficies)
+        total = numpy.einsum('vzgd,vz->vgd', numpy.nan_to_num(self.cubo), sup)
+        return total / sup.sum(axis=1)[:, None, None]
+
+    def sensibilidad(self, referencia=0):
+        """Variación de los flujos del edificio de cada variante respecto a otra
+
+        Devuelve un array variantes x grupos x 6 con la diferencia de los
+        flujos del edificio de cada variante con los de la variante de
+        referencia [kWh/m²·año].
+        """
+        flujos = self.edificio()
+        return flujos - flujos[referencia]
+
+    def zona(self, nombre):
+        """Array variantes x grupos x 6 de flujos de la zona indicada"""
+        return self.cubo[:, self._indicezonas[nombre]]
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=u'Matriz de variantes de archivos de resultados de LIDER')
+    parser.add_argument('files', nargs='+', action='store',
+                        help=u'Archivos .res de las variantes')
+    parser.add_argument('-c', '--cache', action='store', default=None,
+                        help=u'Archivo .npz de caché de la matriz')
+    parser.add_argument('-t', '--tipo', action='store', default='cal',
+                        choices=DEMANDAS, help=u'Tipo de demanda analizada')
+    args = parser.parse_args()
+
+    matriz = MatrizVariantes.desdearchivos(args.files, cache=args.cache)
+    variantes = matriz.variantes
+    print(u"Matriz de %i variantes, %i zonas" % (len(variantes), len(matriz.zonas)))
+    mejores = matriz.mejorvariante(args.tipo)
+    peores = matriz.peorvariante(args.tipo)
+    for nombre, imejor, ipeor in zip(matriz.zonas, mejores, peores):
+        print(u"%s: mejor %s, peor %s" % (nombre, variantes[imejor], variantes[ipeor]))
+    sens = matriz.sensibilidad()[:, :, DEMANDAS.index(args.tipo)]
+    print(u"* Sensibilidad de grupos respecto a %s [kWh/m²·año]" % variantes[0])
+    for variante, fila in zip(variantes, sens):
+        print(variante, u", ".join(u"%s: %.2f" % (grupo, val)
+                                    for grupo, val in zip(GRUPOSLIDER, fila)))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   ventilacion.py
+#   Caudales de ventilación e infiltraciones y renovaciones hora
+#
+#   Copyright (C) 2015 Rafael Villar Burke <pachi@rvburke.com>
+#
+#   This program is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License
+#   as published by the Free Software Foundation; either version 2
+#   of the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software
+#   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+#   02110-1301, USA.
+"""Caudales de ventilación e infiltraciones y renovaciones hora
+
+El archivo BIN da el caudal másico de ventilación e infiltraciones de cada
+zona (Vventinf, kg/s). El caudal volumétrico es Vventinf·3600/ρ [m³/h] y las
+renovaciones hora (ren/h) el cociente entre este y el volumen de la zona.
+
+AnalisisVentilacion obtiene para todas las zonas a la vez las renovaciones
+horarias, sus medias diarias, mensuales, por temporada y anual, y las del
+conjunto de las zonas (total del edificio).
+
+Ejemplo:
+
+    python -m sol.ventilacion ResumenRCC.bin
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from sol.confort import DIASMES, INICIOSMES
+
+# Densidad del aire [kg/m³]
+DENSIDADAIRE = 1.225
+# Meses (1 a 12) de cada temporada. Verano de junio a septiembre.
+TEMPORADAS = OrderedDict([('invierno', (1, 2, 3, 4, 5, 10, 11, 12)),
+                          ('verano', (6, 7, 8, 9))])
+
+def caudal(vventinf):
+    """Caudal volumétrico [m³/h] a partir del caudal másico [kg/s]"""
+    return np.asarray(vventinf) * 3600.0 / DENSIDADAIRE
+
+class AnalisisVentilacion(object):
+    """Renovaciones hora de las zonas de un DatosHorarios
+
+    nombres - Nombres de las zonas (o grupos de zonas)
+    volumen - Volumen de cada zona [m³]
+    horarias - Array zonas x 8760 de renovaciones hora [ren/h]
+    diarias - Array zonas x 365 de renovaciones hora medias diarias [ren/h]
+    mensuales - Array zonas x 12 de renovaciones hora medias mensuales [ren/h]
+    temporadas - Diccionario de arrays con las renovaciones hora medias de
+                 cada temporada de TEMPORADAS [ren/h]
+    anuales - Renovaciones hora medias anuales de cada zona [ren/h]
+    total - Renovaciones hora horarias del conjunto de las zonas, con sus
+            multiplicadores [ren/h]
+    """
+    def __init__(self, horarios):
+        self.nombres = list(horarios.nombres)
+        self._indice = dict((nombre, i) for (i, nombre) in enumerate(self.nombres))
+        self.volumen = np.asarray(horarios.zonas['Volumen'], dtype=float)
+        volumen = np.maximum(self.volumen, 1e-6)[:, None]
+        caudales = caudal(horarios.horarios['Vventinf'])
+        self.horarias = (caudales / volumen).astype(np.float32)
+        nzonas, horas = self.horarias.shape
+        self.diarias = self.horarias[:, :365 * 24].reshape(nzonas, 365, 24).mean(axis=2)
+        horasmes = 24.0 * np.array(DIASMES)
+        self.mensuales = np.add.reduceat(self.horarias, INICIOSMES, axis=1, dtype=float) / horasmes
+        self.temporadas = OrderedDict()
+        for temporada, meses in TEMPORADAS.items():
+            meses = np.array(meses) - 1
+            self.temporadas[temporada] = ((self.mensuales[:, meses] * horasmes[meses]).sum(axis=1) /
+                                          horasmes[meses].sum())
+        self.anuales = self.horarias.mean(axis=1, dtype=float)
+        multiplicador = np.asarray(horarios.zonas['multiplicador'], dtype=float)
+        self.total = (np.dot(multiplicador, caudales) /
+                      max(np.dot(multiplicador, self.volumen), 1e-6)).astype(np.float32)
+
+    def indice(self, nombre):
+        """Índice de la zona de nombre dado"""
+        return self._indice[nombre]
+
+    def __contains__(self, nombre):
+        return nombre in self._indice
+
+    def zona(self, nombre):
+        """Renovaciones hora horarias de una zona [ren/h]"""
+        return self.horarias[self._indice[nombre]]
+
+    def resumen(self, nombre):
+        """Diccionario ordenado con las renovaciones hora medias anual y por temporadas de una zona"""
+        i = self._indice[nombre]
+        resumen = OrderedDict([('anual', self.anuales[i])])
+        resumen.update((temporada, valores[i]) for (temporada, valores) in self.temporadas.items())
+        return resumen
+
+    @property
+    def nbytes(self):
+        """Tamaño de los resultados [bytes]"""
+        return (self.horarias.nbytes + self.diarias.nbytes + self.mensuales.nbytes +
+                self.total.nbytes)
+
+if __name__ == '__main__':
+    import argparse
+    from sol.binparser import DatosHorarios
+
+    parser = argparse.ArgumentParser(description=u'Renovaciones hora de las zonas de un archivo BIN de LIDER')
+    parser.add_argument('binfile', action="store", default='ResumenRCC.bin')
+    params = parser.parse_args()
+
+    analisis = DatosHorarios.desdeBIN(params.binfile).ventilacion()
+    for nombre in analisis.nombres:
+        resumen = analisis.resumen(nombre)
+        print(u'%s: %s' % (nombre, u', '.join(u'%s %.2f ren/h' % (periodo, valor)
+                                               for (periodo, valor) in resumen.items())))
+    print(u'Total: %.2f ren/h' % analisis.total.mean())
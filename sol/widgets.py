@@ -21,20 +21,36 @@
 #   Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 #   02110-1301, USA.
 
+import datetime
 import math
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cairo
 import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('GTK3Cairo')
 import matplotlib.pyplot as plt
+import matplotlib.dates
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_gtk3cairo import FigureCanvasGTK3Cairo
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.transforms import offset_copy
 from pandas.plotting import register_matplotlib_converters
 
 register_matplotlib_converters()
 
 from .observer import Observer
+from .latencias import latencias
+from .lru import CacheLRU
+from .config import config
+from .cargas import fechahora
+from .confort import fueraconsigna
+from .ventilacion import caudal
 
 MESES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
          'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
@@ -44,8 +60,218 @@ def myround(x, base=5):
     """Redondea al valor más próximo a base"""
     return int(base * round(float(x)/base))
 
+# Horas del año, duración mínima del periodo de valores horarios mostrado [h]
+# y factor de reducción del periodo en cada paso de zoom
+HORASANO = 8760
+MINHORAS = 24
+FACTORZOOM = 0.8
+# Modos con gráfica de valores horarios y texto del objeto en el título
+MODOSHORARIOS = OrderedDict([('zona', u'de zona'), ('planta', u'de planta'),
+                             ('edificio', u'del edificio')])
+# Fecha (en días de Matplotlib) de la hora 0 de los datos horarios
+ORIGENHORAS = matplotlib.dates.date2num(datetime.datetime(2007, 1, 1))
+
+# Variables del mapa horario: título y mapa de colores
+MAPAVARIABLES = OrderedDict([('Treal', (u'Temperatura [ºC]', 'coolwarm')),
+                             ('QS', (u'Carga sensible [W]', 'RdBu_r')),
+                             ('demanda', (u'Demanda de calefacción o refrigeración', 'bwr'))])
+
+# Variables del mapa de zonas: título y mapa de colores, y unidades
+MAPAZONASVARIABLES = OrderedDict([('demanda', (u'Demanda mensual [kWh/m²]', 'RdBu_r')),
+                                  ('horassobre', (u'Horas mensuales sobre consigna', 'Reds')),
+                                  ('horasbajo', (u'Horas mensuales bajo consigna', 'Blues')),
+                                  ('Treal', (u'Temperatura media diaria [ºC]', 'coolwarm')),
+                                  ('carga', (u'Carga térmica media diaria [W/m²]', 'RdBu_r')),
+                                  ('renovaciones', (u'Renovaciones hora medias diarias [ren/h]', 'viridis'))])
+MAPAZONASUNIDADES = {'demanda': u'kWh/m²', 'horassobre': u'h', 'horasbajo': u'h',
+                     'Treal': u'ºC', 'carga': u'W/m²', 'renovaciones': u'ren/h'}
+# Número máximo de zonas con nombre en el eje del mapa de zonas
+MAXETIQUETASZONAS = 40
+
+# Imágenes de las gráficas ya dibujadas, compartida por todas las gráficas
+CACHEDIBUJOS = CacheLRU(config.get('cachedibujosmb', 64) * 2**20)
+
+class CacheDibujos(object):
+    """Gráfica que guarda las imágenes dibujadas en una caché LRU
+
+    La figura de Matplotlib se rehace (dibuja) solamente cuando cambia su
+    clave (clavefigura): gráfica, revisión de los datos del modelo, objeto
+    activo y opciones de presentación (opcionesdibujo). La imagen de la
+    figura se guarda en CACHEDIBUJOS con esa clave y el tamaño de la gráfica,
+    de modo que al volver a un objeto ya visto solo se copia la imagen.
+
+    Las gráficas con enhilo=True se dibujan con Agg en un hilo auxiliar, en
+    una figura nueva (construyefigura) a partir del estado del modelo tomado
+    en el hilo principal (estadodibujo). La imagen se entrega al hilo
+    principal con el programador del modelo y se descarta si entre tanto ha
+    cambiado la clave. Mientras, se muestra la imagen anterior. Si falla el
+    dibujo, se muestra el error en lugar de la gráfica, sin guardarlo en la
+    caché, para volver a intentarlo al cambiar la clave.
+    """
+    _clavefigura = None
+    enhilo = False
+    _hilo = None
+    _clavependiente = None
+    _ultimaclave = None
+    _ultimasuperficie = None
+
+    def opcionesdibujo(self):
+        """Opciones de presentación que modifican la figura"""
+        return ()
+
+    def clavefigura(self):
+        """Clave que identifica el contenido de la figura"""
+        model = self.model
+        return (self.nombremedida, model.file, model.revision, model.index,
+                self.opcionesdibujo())
+
+    def dibuja(self):
+        """Rehace la figura para el objeto activo"""
+        pass
+
+    def actualizafigura(self):
+        """Rehace la figura si ha cambiado su clave"""
+        if self.model.activo is None:
+            return
+        clave = self.clavefigura()
+        if clave != self._clavefigura:
+            with latencias.mide(self.nombremedida + '.dibujaseries'):
+                self.dibuja()
+            self._clavefigura = clave
+
+    def estadodibujo(self):
+        """Datos del modelo necesarios para construir la figura en otro hilo"""
+        return None
+
+    def construyefigura(self, figura, estado):
+        """Construye en una figura nueva la gráfica correspondiente a estado"""
+        pass
+
+    def _programa(self, clave, ancho, alto, escala):
+        """Programa el dibujo en el hilo auxiliar de la figura para clave"""
+        if clave == self._clavependiente:
+            return
+        self._clavependiente = clave
+        if self._hilo is None:
+            self._hilo = ThreadPoolExecutor(max_workers=1)
+        self._hilo.submit(self._dibujaenhilo, clave, ancho, alto, escala,
+                          self.figure.dpi, self.estadodibujo(), time.time())
+
+    def _dibujaenhilo(self, clave, ancho, alto, escala, dpi, estado, inicio):
+        """Construye y rasteriza la figura con Agg (hilo auxiliar)"""
+        if clave != self._clavependiente:
+            return # Obsoleta antes de empezar
+        ancho, alto = max(int(ancho * escala), 1), max(int(alto * escala), 1)
+        try:
+            argb = self._rasteriza(ancho, alto, dpi, lambda figura: self.construyefigura(figura, estado))
+        except Exception as exc:
+            traceback.print_exc()
+            mensaje = u'Error al dibujar la gráfica:\n%s' % exc
+            def error(figura):
+                figura.text(0.5, 0.5, mensaje, ha='center', va='center', wrap=True)
+            try:
+                argb = self._rasteriza(ancho, alto, dpi, error)
+            except Exception:
+                traceback.print_exc()
+                argb = None
+            self.model.programador(self._fallido, clave, escala, argb)
+            return
+        self.model.programador(self._dibujado, clave, escala, argb, inicio)
+
+    def _rasteriza(self, ancho, alto, dpi, construye):
+        """Imagen ARGB32 (alto x ancho x 4) de una figura nueva construida con Agg"""
+        figura = Figure(figsize=(float(ancho) / dpi, float(alto) / dpi), dpi=dpi)
+        FigureCanvasAgg(figura)
+        construye(figura)
+        figura.canvas.draw()
+        # El búfer es plano en versiones antiguas de Matplotlib. Se usa el
+        # tamaño del renderer, que redondea el de la figura.
+        renderer = figura.canvas.get_renderer()
+        rgba = np.frombuffer(figura.canvas.buffer_rgba(), dtype=np.uint8).reshape(
+            int(renderer.height), int(renderer.width), 4)
+        # Agg da RGBA y Cairo ARGB32 en el orden de bytes nativo. Al ser la
+        # figura opaca es indiferente que el alfa esté premultiplicado o no.
+        orden = [2, 1, 0, 3] if sys.byteorder == 'little' else [3, 0, 1, 2]
+        return np.ascontiguousarray(rgba[..., orden])
+
+    def _superficie(self, argb, escala):
+        """Superficie Cairo a partir de una imagen ARGB32"""
+        alto, ancho = argb.shape[:2]
+        superficie = cairo.ImageSurface.create_for_data(argb, cairo.FORMAT_ARGB32,
+                                                        ancho, alto, ancho * 4)
+        superficie.set_device_scale(escala, escala)
+        return superficie
+
+    def _dibujado(self, clave, escala, argb, inicio):
+        """Recibe en el hilo principal una imagen dibujada en el hilo auxiliar"""
+        if clave != self._clavependiente:
+            return False # Obsoleta, ha cambiado la selección
+        self._clavependiente = None
+        latencias.registra(self.nombremedida + '.hilo', time.time() - inicio)
+        self._guardasuperficie(clave, self._superficie(argb, escala))
+        self.queue_draw()
+        return False
+
+    def _fallido(self, clave, escala, argb):
+        """Recibe en el hilo principal el fallo de un dibujo en el hilo auxiliar
+
+        La imagen del error (argb, si se ha podido dibujar) se muestra para
+        esa clave pero no se guarda en la caché.
+        """
+        if clave != self._clavependiente:
+            return False
+        self._clavependiente = None
+        if argb is not None:
+            self._ultimaclave, self._ultimasuperficie = clave, self._superficie(argb, escala)
+            self.queue_draw()
+        return False
+
+    def _guardasuperficie(self, clave, superficie):
+        """Guarda una imagen dibujada en la caché y como última imagen"""
+        self._ultimaclave, self._ultimasuperficie = clave, superficie
+        if self.model.activo is not None:
+            CACHEDIBUJOS.put(clave, superficie, superficie.get_stride() * superficie.get_height())
+
+    def nuevasuperficie(self, ancho, alto, escala):
+        """Superficie Cairo de ancho x alto píxeles lógicos"""
+        superficie = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                        max(int(ancho * escala), 1), max(int(alto * escala), 1))
+        superficie.set_device_scale(escala, escala)
+        return superficie
+
+    def renderiza(self, widget, superficie):
+        """Dibuja la figura en una superficie Cairo"""
+        FigureCanvasGTK3Cairo.on_draw_event(self, widget, cairo.Context(superficie))
+
+    def on_draw_event(self, widget, ctx):
+        """Pinta la imagen de la caché o, si no existe, dibuja la figura y la guarda"""
+        allocation = self.get_allocation()
+        escala = getattr(self, 'device_pixel_ratio', 1)
+        clave = (self.clavefigura(), allocation.width, allocation.height, escala)
+        superficie = CACHEDIBUJOS.get(clave)
+        if superficie is None and clave == self._ultimaclave:
+            superficie = self._ultimasuperficie
+        if superficie is None:
+            if (self.enhilo and self.model.programador is not None and
+                self.model.activo is not None):
+                # Mientras se dibuja en el hilo auxiliar se muestra la imagen anterior
+                self._programa(clave, allocation.width, allocation.height, escala)
+                if self._ultimasuperficie is not None:
+                    ctx.set_source_surface(self._ultimasuperficie, 0, 0)
+                    ctx.paint()
+                return False
+            self.actualizafigura()
+            superficie = self.nuevasuperficie(allocation.width, allocation.height, escala)
+            with latencias.mide(self.nombremedida + '.draw'):
+                self.renderiza(widget, superficie)
+            self._guardasuperficie(clave, superficie)
+        ctx.set_source_surface(superficie, 0, 0)
+        ctx.paint()
+        latencias.pintado()
+        return False
 
-class PieGlobal(FigureCanvasGTK3Cairo, Observer):
+
+class PieGlobal(CacheDibujos, FigureCanvasGTK3Cairo, Observer):
     """Gráfico circular de Matplotlib
 
     Representa el balance neto de energía para cada componente del edificio.
@@ -53,6 +279,8 @@ class PieGlobal(FigureCanvasGTK3Cairo, Observer):
     calefacción o refrigeración.
     """
     __gtype_name__ = 'PieChart'
+    labels = ('index', 'factores')
+    enhilo = True
 
     def __init__(self, tipodemanda='cal+', modelo=None):
         """Constructor
@@ -64,7 +292,6 @@ class PieGlobal(FigureCanvasGTK3Cairo, Observer):
         Observer.__init__(self, modelo)
 
         self.tipodemanda = tipodemanda
-        self.needsredraw = False
 
         self._titles = {'cal+': u'Periodo de calefacción. Ganancias térmicas',
                         'cal-': u'Periodo de calefacción. Pérdidas térmicas',
@@ -75,6 +302,11 @@ class PieGlobal(FigureCanvasGTK3Cairo, Observer):
         self.fig.add_subplot(aspect='equal')
         FigureCanvasGTK3Cairo.__init__(self, self.fig)
 
+    @property
+    def nombremedida(self):
+        """Nombre de la gráfica en las medidas de latencia"""
+        return 'PieGlobal(%s)' % self.tipodemanda
+
     def colors(self, nelems):
         """Devuelve lista de colores en un rango"""
         sign = -1 if self.tipodemanda.endswith('-') else 1
@@ -83,21 +315,33 @@ class PieGlobal(FigureCanvasGTK3Cairo, Observer):
         colorlist = ['#%02x%02x%02x' % (aa, (bb + i*step) % 256, cc) for i in range(nelems)]
         return colorlist
 
-    def dibujaseries(self):
-        """Dibuja series de datos"""
+    def estadodibujo(self):
+        """Demandas y grupos del objeto activo, excluido el grupo 'TOTAL'"""
+        model = self.model
+        return dict(modo=model.modo,
+                    demandas=list(model.activo.demandas[self.tipodemanda][:-1]),
+                    grupos=list(model.edificio.gruposlider[:-1]))
+
+    def construyefigura(self, figura, estado):
+        self.dibujaseries(figura, estado)
 
-        # demandas y grupos, excluido el grupo 'TOTAL'
-        demandas = self.model.activo.demandas[self.tipodemanda][:-1]
-        grupos = self.model.edificio.gruposlider[:-1] # Quitamos TOTAL
-        self.fig.clear()
-        ax = self.fig.gca(aspect='equal')
-        self.fig.text(0.5, 0.98,
+    def dibujaseries(self, fig, estado):
+        """Dibuja series de datos
+
+        fig - Figura en la que se dibuja
+        estado - Datos del modelo (ver estadodibujo)
+        """
+        demandas = estado['demandas']
+        grupos = estado['grupos']
+        fig.clear()
+        ax = fig.add_subplot(111, aspect='equal')
+        fig.text(0.5, 0.98,
                       (self._titles[self.tipodemanda] +
                        u'\nTotal: %4.1f kWh/m²año' % sum(demandas)),
                       size='medium', ha='center', va='top')
 
         # No damos esta información en modo componente
-        if self.model.modo == 'componente':
+        if estado['modo'] == 'componente':
             ax.axis('off')
             ax.annotate(u"Información no disponible para componentes",
                         (0.5, 0.5), xycoords='axes fraction', ha='center')
@@ -191,31 +435,24 @@ class PieGlobal(FigureCanvasGTK3Cairo, Observer):
                                         relpos=(0.0 if ha=='left' else 1.0, 0.5),
                                         patchB=patch))
 
-    def do_draw(self, cr):
-        if not self.needsredraw:
-            return False
-        self.needsredraw = False
-        self.dibujaseries()
-        self.draw()
-        return False
+    def dibuja(self):
+        self.dibujaseries(self.fig, self.estadodibujo())
 
     def update(self, subject, **kwargs):
-        if kwargs.get('label', None) in ['index']:
-            self.needsredraw = True
-        else:
-            self.needsredraw = False
         self.queue_draw()
 
     def save(self, filename='piechart.png', dpi=100):
         """Guardar y mostrar gráfica"""
+        self.actualizafigura()
         self.fig.canvas.print_figure(filename,
                                      format='png',
                                      facecolor='w',
                                      dpi=dpi)
 
-class HistoBase(FigureCanvasGTK3Cairo, Observer):
+class HistoBase(CacheDibujos, FigureCanvasGTK3Cairo, Observer):
     """Histograma de Matplotlib"""
     __gtype_name__ = 'HistoBase'
+    labels = ('index', 'factores')
 
     def __init__(self, modelo=None):
         """Constructor
@@ -232,7 +469,6 @@ class HistoBase(FigureCanvasGTK3Cairo, Observer):
         self.title = ''
         self.xlabel = ''
         self.ylabel = ''
-        self.needsredraw = False
 
         # Tamaños de letra y transformaciones para etiquetas de barras
         fontsize = matplotlib.rcParams['font.size']
@@ -245,44 +481,95 @@ class HistoBase(FigureCanvasGTK3Cairo, Observer):
         self.trpos = offset_copy(self.ax1.transData, fig=self.fig,
                                  x=0, y=labeloffset, units='points')
 
-    def autolabel(self, ax, rects):
-        """Etiquetar valores fuera de las barras"""
+        # Artistas que cambian con el objeto activo. Si los hay, el resto de
+        # la figura (fondo) se dibuja una sola vez y se guarda en la caché
+        # con la clave clavefondo, y los artistas se dibujan sobre ella.
+        self.animados = []
+
+    @property
+    def nombremedida(self):
+        """Nombre de la gráfica en las medidas de latencia"""
+        return type(self).__name__
+
+    def posicionetiqueta(self, rect):
+        """Posición, transformación y texto de la etiqueta de valor de una barra"""
+        height = rect.get_height()
+        # rect.get_y() es la base del rectángulo y es 0 si es positivo
+        rectbasey = rect.get_y()
+        if rectbasey == 0:  # rectángulo en la parte positiva
+            tr = self.trpos
+            rectbasey = height
+            k = 1.0
+        else:               # rectángulo en la parte negativa
+            tr = self.trneg
+            k = -1.0
+        return (rect.get_x() + rect.get_width() / 2.0, rectbasey,
+                tr, '%.1f' % (k*round(height, 1)))
+
+    def autolabel(self, ax, rects, todas=False):
+        """Etiquetar valores fuera de las barras
+
+        Con todas=True se etiquetan también las barras nulas, con etiquetas
+        ocultas, y se devuelve la lista de etiquetas.
+        """
+        textos = []
         for rect in rects:
             height = rect.get_height()
-            if height:
-                # rect.get_y() es la base del rectángulo y es 0 si es positivo
-                rectbasey = rect.get_y()
-                if rectbasey == 0:  # rectángulo en la parte positiva
-                    tr = self.trpos
-                    rectbasey = height
-                    k = 1.0
-                else:               # rectángulo en la parte negativa
-                    tr = self.trneg
-                    k = -1.0
-                ax.text(rect.get_x() + rect.get_width() / 2.0, rectbasey,
-                        '%.1f' % (k*round(height, 1)), ha='center', va='bottom',
-                        size=self.labelfs, transform=tr)
-
-    def do_draw(self, cr):
-        if not self.needsredraw:
-            return False
-        self.needsredraw = False
+            if height or todas:
+                x, y, tr, texto = self.posicionetiqueta(rect)
+                textos.append(ax.text(x, y, texto, ha='center', va='bottom',
+                                      size=self.labelfs, transform=tr,
+                                      visible=bool(height)))
+        return textos
+
+    def actualizaetiqueta(self, texto, rect):
+        """Actualiza la etiqueta de valor de una barra tras cambiar su altura"""
+        x, y, tr, valor = self.posicionetiqueta(rect)
+        texto.set_position((x, y))
+        texto.set_transform(tr)
+        texto.set_text(valor)
+        texto.set_visible(bool(rect.get_height()))
+
+    def clavefondo(self):
+        """Clave de la imagen de fondo de la figura"""
+        return (self.nombremedida, 'fondo', self.model.file, self.model.revision)
+
+    def renderiza(self, widget, superficie):
+        """Dibuja la figura en una superficie Cairo
+
+        Con artistas animados se copia la imagen de fondo, que se dibuja y
+        guarda en la caché si no existe, y se dibujan sobre ella los artistas.
+        """
+        if not self.animados:
+            return CacheDibujos.renderiza(self, widget, superficie)
+        escala = getattr(self, 'device_pixel_ratio', 1)
+        clave = (self.clavefondo(), superficie.get_width(), superficie.get_height(), escala)
+        fondo = CACHEDIBUJOS.get(clave)
+        if fondo is None:
+            # La figura se dibuja sin los artistas animados
+            allocation = self.get_allocation()
+            fondo = self.nuevasuperficie(allocation.width, allocation.height, escala)
+            CacheDibujos.renderiza(self, widget, fondo)
+            CACHEDIBUJOS.put(clave, fondo, fondo.get_stride() * fondo.get_height())
+        ctx = cairo.Context(superficie)
+        ctx.set_source_surface(fondo, 0, 0)
+        ctx.paint()
+        ctx.scale(1.0 / escala, 1.0 / escala)
+        self._renderer.set_context(ctx)
+        for artista in self.animados:
+            artista.draw(self._renderer)
+
+    def dibuja(self):
         ax1 = self.ax1
         ax1.clear() # Limpia imagen de datos anteriores
+        self.animados = []
         ax1.grid(True)
         ax1.set_title(self.title, size='large')
         ax1.set_xlabel(self.xlabel, fontdict=dict(color='0.5'))
         ax1.set_ylabel(self.ylabel, fontdict=dict(color='0.5'))
         self.dibujaseries(ax1)
-        self.draw()
-        return False
 
-    # ver si dibuja pasa a ser esto
     def update(self, subject, **kwargs):
-        if kwargs.get('label', None) in ['grupos', 'index']:
-            self.needsredraw = True
-        else:
-            self.needsredraw = False
         self.queue_draw()
 
     def dibujaseries(self, ax):
@@ -291,6 +578,7 @@ class HistoBase(FigureCanvasGTK3Cairo, Observer):
 
     def save(self, filename='histobase.png', dpi=100):
         """Guardar y mostrar gráfica"""
+        self.actualizafigura()
         self.fig.canvas.print_figure(filename,
                                      format='png',
                                      facecolor='w',
@@ -313,6 +601,33 @@ class HistoMeses(HistoBase):
         self.title = u"Demanda neta mensual"
         self.xlabel = u"Periodo"
         self.ylabel = u"Demanda [kWh/m²mes]"
+        # Barras y etiquetas de calefacción y refrigeración y clave del fondo
+        # con el que se crearon
+        self._barras = ()
+        self._etiquetas = ()
+        self._fondo = None
+
+    def dibuja(self):
+        """Actualiza las barras o, si no existen o ha cambiado el fondo, rehace la figura
+
+        La estructura de la gráfica (12 meses x 2 series, ejes y leyenda) no
+        cambia al seleccionar otro objeto del mismo edificio, y basta con
+        cambiar la altura de las barras y la posición y texto de sus etiquetas.
+        """
+        if (self.animados and self.model.modo != 'componente' and
+            self._fondo == self.clavefondo()):
+            self.actualizaseries()
+        else:
+            HistoBase.dibuja(self)
+
+    def actualizaseries(self):
+        """Actualiza altura y etiquetas de las barras para el objeto activo"""
+        obj = self.model.activo
+        valores = (obj.calefaccion_meses, obj.refrigeracion_meses)
+        for rects, textos, demandas in zip(self._barras, self._etiquetas, valores):
+            for rect, texto, demanda in zip(rects, textos, demandas):
+                rect.set_height(demanda)
+                self.actualizaetiqueta(texto, rect)
 
     def dibujaseries(self, ax1):
         """Representa histograma de demanda mensual para una zona
@@ -345,11 +660,19 @@ class HistoMeses(HistoBase):
         _min, _max = self.model.edificio.minmaxmeses()
         _min, _max = myround(_min, 5), myround(_max, 5)
         ax1.set_ylim(_min - 10, _max + 10)
-        self.autolabel(ax1, rects1)
-        self.autolabel(ax1, rects2)
+        textos1 = self.autolabel(ax1, rects1, todas=True)
+        textos2 = self.autolabel(ax1, rects2, todas=True)
+        # Barras y etiquetas se dibujan sobre el fondo y se reutilizan
+        self._barras = (rects1, rects2)
+        self._etiquetas = (textos1, textos2)
+        self._fondo = self.clavefondo()
+        self.animados = list(rects1) + list(rects2) + textos1 + textos2
+        for artista in self.animados:
+            artista.set_animated(True)
 
     def save(self, filename='meseschart.png', dpi=100):
         """Guardar y mostrar gráfica"""
+        self.actualizafigura()
         self.fig.canvas.print_figure(filename,
                                      format='png',
                                      facecolor='w',
@@ -383,7 +706,10 @@ class HistoElementos(HistoBase):
     def showelems(self, value):
         if value != self._showelems:
             self._showelems = value
-            self.model.notify(label='grupos')
+            self.queue_draw()
+
+    def opcionesdibujo(self):
+        return self._showelems
 
     def dibujaseries(self, ax1):
         """Representa histograma de demanda por elemento
@@ -447,9 +773,11 @@ class HistoElementos(HistoBase):
         ax1.grid(False)
         self.fig.subplots_adjust(bottom=0.17, left=.15)
 
-class ZonasGraph(FigureCanvasGTK3Cairo, Observer):
+class ZonasGraph(CacheDibujos, FigureCanvasGTK3Cairo, Observer):
     """Gráficas de zonas con Matplotlib"""
     __gtype_name__ = 'ZonasGraph'
+    labels = ('index', 'horarios', 'carga')
+    enhilo = True
 
     def __init__(self, modelo=None):
         """Constructor
@@ -462,55 +790,193 @@ class ZonasGraph(FigureCanvasGTK3Cairo, Observer):
 
         self.fig = Figure()
         FigureCanvasGTK3Cairo.__init__(self, self.fig)
-        self.ax1 = self.fig.add_subplot(311)
-        self.ax2 = self.fig.add_subplot(312, sharex=self.ax1)
-        self.ax3 = self.fig.add_subplot(313, sharex=self.ax1)
-        self.ax4 = self.ax3.twinx()
-        self.ax4.patch.set_visible(False)
-
-        self.fig.suptitle(u'Valores diarios de zona', size='large')
-        self.fig.subplots_adjust(left=0.15,
-                                 #right=0.9,
-                                 top=0.9, bottom=0.1,
-                                 wspace=0.2, hspace=0.4)
-        self.needsredraw = False
-
-    def do_draw(self, cr):
-        if not self.needsredraw:
-            return False
-        self.needsredraw = False
-        self.dibujaseries()
-        self.draw()
-        return False
+        self.ax1, self.ax2, self.ax3, self.ax4 = self.creaejes(self.fig)
 
-    # ver si dibuja pasa a ser esto
-    def update(self, subject, **kwargs):
-        if kwargs.get('label', None) in ['grupos', 'index']:
-            self.needsredraw = True
+        # Valores horarios del periodo [inicio, fin) (horas del año)
+        self._horario = False
+        self._rango = (0, HORASANO)
+        self._arrastre = None
+        self.mpl_connect('scroll_event', self.zoom)
+        self.mpl_connect('button_press_event', self.iniciaarrastre)
+        self.mpl_connect('motion_notify_event', self.arrastra)
+        self.mpl_connect('button_release_event', self.terminaarrastre)
+
+    @property
+    def horario(self):
+        """Muestra valores horarios (True) o diarios (False)"""
+        return self._horario
+
+    @horario.setter
+    def horario(self, value):
+        if value != self._horario:
+            self._horario = value
+            self.queue_draw()
+
+    @property
+    def rango(self):
+        """Periodo (inicio, fin) de valores horarios mostrado [h]"""
+        return self._rango
+
+    @rango.setter
+    def rango(self, value):
+        inicio, fin = value
+        duracion = min(max(int(round(fin - inicio)), MINHORAS), HORASANO)
+        inicio = min(max(int(round(inicio)), 0), HORASANO - duracion)
+        rango = (inicio, inicio + duracion)
+        if rango != self._rango:
+            self._rango = rango
+            self.queue_draw()
+
+    def horaenpixel(self, x):
+        """Hora del año correspondiente a la posición horizontal x [px]"""
+        bbox = self.ax1.bbox
+        inicio, fin = self._rango
+        return inicio + (x - bbox.x0) / bbox.width * (fin - inicio)
+
+    def interactivo(self, event):
+        """Indica si el evento actúa sobre los valores horarios de una zona"""
+        return (self._horario and self.model.activo is not None and
+                self.model.modo in MODOSHORARIOS and
+                event.inaxes in (self.ax1, self.ax2, self.ax3, self.ax4))
+
+    def zoom(self, event):
+        """Amplía o reduce el periodo mostrado en torno a la hora del cursor"""
+        if not self.interactivo(event):
+            return
+        factor = FACTORZOOM if event.button == 'up' else 1.0 / FACTORZOOM
+        hora = self.horaenpixel(event.x)
+        inicio, fin = self._rango
+        self.rango = (hora - (hora - inicio) * factor, hora + (fin - hora) * factor)
+
+    def iniciaarrastre(self, event):
+        """Comienza el desplazamiento del periodo mostrado o, con doble clic, lo restablece"""
+        if not self.interactivo(event) or event.button != 1:
+            return
+        if event.dblclick:
+            self._arrastre = None
+            self.rango = (0, HORASANO)
         else:
-            self.needsredraw = False
-        self.queue_draw()
+            self._arrastre = (event.x, self._rango)
 
-    def dibujaseries(self):
-        """Dibuja series de datos"""
-        ax1 = self.ax1
-        ax2 = self.ax2
-        ax3 = self.ax3
-        ax4 = self.ax4
+    def arrastra(self, event):
+        """Desplaza el periodo mostrado según el movimiento del cursor"""
+        if self._arrastre is None or event.x is None:
+            return
+        x0, (inicio, fin) = self._arrastre
+        horas = (x0 - event.x) / self.ax1.bbox.width * (fin - inicio)
+        self.rango = (inicio + horas, fin + horas)
+
+    def terminaarrastre(self, event):
+        """Termina el desplazamiento del periodo mostrado"""
+        self._arrastre = None
+
+    def creaejes(self, fig):
+        """Crea los ejes de la gráfica en la figura fig"""
+        ax1 = fig.add_subplot(311)
+        ax2 = fig.add_subplot(312, sharex=ax1)
+        ax3 = fig.add_subplot(313, sharex=ax1)
+        ax4 = ax3.twinx()
+        ax4.patch.set_visible(False)
+
+        fig.subplots_adjust(left=0.15,
+                            #right=0.9,
+                            top=0.9, bottom=0.1,
+                            wspace=0.2, hspace=0.4)
+        return ax1, ax2, ax3, ax4
+
+    def estadodibujo(self):
+        """Datos del modelo para la figura
+
+        Para plantas y edificio se incluyen los grupos de zonas con los que
+        se agregan los datos horarios. Los datos agregados y el análisis de
+        confort no se calculan aquí, en el hilo principal, sino al dibujar
+        (ver datosdibujo).
+        """
+        model = self.model
+        grupos = model.grupos() if model.modo in ('planta', 'edificio') else None
+        return dict(modo=model.modo, nombre=model.activo.nombre,
+                    horarios=model.horarios, grupos=grupos, cargando=model.cargando,
+                    horario=self._horario, rango=self._rango)
+
+    def datosdibujo(self, estado):
+        """Datos horarios y análisis de confort (AnalisisConfort) del estado
+
+        Para plantas y edificio, los datos horarios agregados. Se calculan
+        solo la primera vez (ver DatosHorarios.agrupa y DatosHorarios.confort).
+        """
+        horarios, grupos = estado['horarios'], estado['grupos']
+        if horarios is None:
+            return None, None
+        confort = horarios.confort(grupos)
+        if grupos is not None:
+            horarios = horarios.agrupa(grupos)
+        return horarios, confort
+
+    def construyefigura(self, figura, estado):
+        self.dibujaseries(self.creaejes(figura), estado)
+
+    def dibuja(self):
+        self.dibujaseries((self.ax1, self.ax2, self.ax3, self.ax4), self.estadodibujo())
+
+    def opcionesdibujo(self):
+        """Disponibilidad de los datos horarios y periodo de valores horarios mostrado"""
+        if self.model.horarios is not None:
+            # Con los datos proyectados la escala es la de la zona (ver DatosHorarios.rango)
+            disponibles = 'proyectados' if self.model.horarios.proyectado else 'horarios'
+        else:
+            disponibles = 'cargando' if self.model.cargando else 'sin horarios'
+        return disponibles, self._rango if self._horario else None
+
+    def update(self, subject, **kwargs):
+        label = kwargs.get('label', None)
+        if label == 'index' or (self.model.modo in MODOSHORARIOS and
+                                (label == 'horarios' or kwargs.get('etapa', None) == 'fin')):
+            # Datos horarios disponibles o carga terminada (haya o no .bin)
+            self.queue_draw()
+
+    @property
+    def nombremedida(self):
+        """Nombre de la gráfica en las medidas de latencia"""
+        return type(self).__name__
+
+    def mensaje(self, ejes, texto):
+        """Oculta los ejes y muestra un texto en su lugar"""
+        for ax in ejes[:3]:
+            ax.axis('off')
+            ax.annotate(texto, (0.5, 0.5), xycoords='axes fraction', ha='center')
+        ejes[3].axis('off')
+
+    def dibujaseries(self, ejes, estado):
+        """Dibuja series de datos
+
+        ejes - Ejes de la figura (ver creaejes)
+        estado - Datos del modelo (ver estadodibujo)
+        """
+        ax1, ax2, ax3, ax4 = ejes
 
         #Limpia datos anteriores
         ax1.clear()
         ax2.clear()
         ax3.clear()
         ax4.clear()
+        objeto = MODOSHORARIOS.get(estado['modo'], u'zona')
+        ax1.figure.suptitle(u'Valores %s %s' % (u'horarios' if estado['horario'] else u'diarios',
+                                                objeto), size='large')
 
         # No damos esta información en modo componente
-        if self.model.modo in ['componente', 'planta', 'edificio']:
-            for ax in [ax1, ax2, ax3]:
-                ax.axis('off')
-                ax.annotate(u"Información solo disponible para zonas",
-                            (0.5, 0.5), xycoords='axes fraction', ha='center')
-            ax4.axis('off')
+        if estado['modo'] not in MODOSHORARIOS:
+            self.mensaje(ejes, u"Información no disponible para componentes")
+            return
+
+        # Los datos horarios pueden no estar disponibles aún
+        horarios, confort = self.datosdibujo(estado)
+        estado = dict(estado, horarios=horarios, confort=confort)
+        nombre = estado['nombre']
+        if horarios is None or nombre not in horarios:
+            if estado['cargando']:
+                self.mensaje(ejes, u"Cargando datos horarios...")
+            else:
+                self.mensaje(ejes, u"Datos horarios no disponibles")
             return
 
         ax1.axis('on')
@@ -519,66 +985,627 @@ class ZonasGraph(FigureCanvasGTK3Cairo, Observer):
         ax4.axis('on')
         ax4.patch.set_visible(False)
 
-        ax1.set_title(u'Temperatura diaria (máxima, media, mínima)', size='medium')
-        ax2.set_title(u'Carga térmica diaria (sensible, latente, total)', size='medium')
-        ax3.set_title(u'Caudal diario de ventilación e infiltraciones', size='medium')
         ax1.set_ylabel(u'Temperatura\n$T$, $T_{min}$, $T_{max}$\n[ºC]', fontdict=dict(alpha=0.75, size='small'))
         ax2.set_ylabel(u'Carga térmica\n$Q_S$, $Q_S + Q_L$\n[W]', fontdict=dict(alpha=0.75, size='small'))
         ax3.set_ylabel(u'Ventilación e infiltraciones\n[m3/h]', fontdict=dict(alpha=0.75, size='small'))
         ax4.set_ylabel(u'[ren/h]', fontdict=dict(alpha=0.75, size='small'))
 
-        zidf, zcdf, zddf = self.model.bindata
-        zonedf = zddf[zddf.Nombre == self.model.activo.nombre]
-        zonedf.index = pd.date_range('1/1/2007', periods=8760,
-                                     freq='H')
-        tdmed = zonedf.Temp.resample('D').mean()
-        tdmin = zonedf.Temp.resample('D').min()
-        tdmax = zonedf.Temp.resample('D').max()
+        if estado['horario']:
+            self.dibujahorarios(ejes, estado)
+            return
+
+        ax1.set_title(u'Temperatura diaria (máxima, media, mínima)', size='medium')
+        ax2.set_title(u'Carga térmica diaria (sensible, latente, total)', size='medium')
+        ax3.set_title(u'Caudal diario de ventilación e infiltraciones', size='medium')
+
+        diarios = horarios.diarios(nombre)
+        dias = pd.date_range('1/1/2007', periods=365, freq='D')
+        tdmed = diarios['Tmed']
+        tdmin = diarios['Tmin']
+        tdmax = diarios['Tmax']
 
         #tdmed.plot(ax=ax1, color='black', lw=0.5)
-        ax1.plot(tdmed.index, tdmed, color='black', lw=0.5)
-        ax1.fill_between(tdmed.index, tdmed, tdmax, facecolor='red', alpha=.2)
-        ax1.fill_between(tdmed.index, tdmin, tdmed, facecolor='blue', alpha=.2)
-        mintemp = np.ceil(zddf.Temp.min()) -3
-        maxtemp = np.floor(zddf.Temp.max()) + 3
+        ax1.plot(dias, tdmed, color='black', lw=0.5)
+        ax1.fill_between(dias, tdmed, tdmax, facecolor='red', alpha=.2)
+        ax1.fill_between(dias, tdmin, tdmed, facecolor='blue', alpha=.2)
+        trealmin, trealmax = horarios.rango('Treal', nombre)
+        mintemp = np.ceil(trealmin) -3
+        maxtemp = np.floor(trealmax) + 3
         ax1.set_ylim(mintemp, maxtemp)
+        if estado['modo'] == 'zona':
+            self.bandasconsigna(ax1, horarios, nombre, dias, 0, 365 * 24)
+        self.textoconsigna(ax1, estado['confort'], nombre)
 
-        #TODO: Ver cómo indicar zonas sobre y bajo consigna
         #TODO: o poner bandas de verano e invierno
 
-        qldtot = zonedf.QLat.resample('D').sum() / 24.0
-        qsdtot = zonedf.QSen.resample('D').sum() / 24.0
+        qldtot = diarios['QL']
+        qsdtot = diarios['QS']
         qtot = (qldtot + qsdtot)
 
         #qsdtot.plot(ax=ax2, color='blue', lw=0.5)
-        ax2.plot(qsdtot.index, qsdtot, color='blue', lw=0.5, alpha=0.5)
+        ax2.plot(dias, qsdtot, color='blue', lw=0.5, alpha=0.5)
 
         #qtot.plot(ax=ax2, color='black', lw=0.5)
-        ax2.plot(qtot.index, qtot, color='black', lw=0.5)
-        ax2.fill_between(qsdtot.index, 0, qsdtot, facecolor='blue', alpha=.2)
-        ax2.fill_between(qtot.index, qsdtot, qtot, facecolor='red', alpha=.2)
+        ax2.plot(dias, qtot, color='black', lw=0.5)
+        ax2.fill_between(dias, 0, qsdtot, facecolor='blue', alpha=.2)
+        ax2.fill_between(dias, qsdtot, qtot, facecolor='red', alpha=.2)
 
         ax1.get_xaxis().set_major_formatter(matplotlib.dates.DateFormatter('%b'))
 
-        # 3600 s/h * 1.2922 kg/m3
-        veninftot = zonedf.Vventinf.resample('D').mean() * 3600.0 / 1.225
-        #veninftot = zonedf.Vventinf * 3600.0 / 1.225
-        ax3.plot(veninftot.index, veninftot, color='black', lw=0.5)
-        ax3.fill_between(veninftot.index, 0, veninftot, facecolor='cyan', alpha=.2)
+        veninftot = caudal(diarios['Vventinf'])
+        ax3.plot(dias, veninftot, color='black', lw=0.5)
+        ax3.fill_between(dias, 0, veninftot, facecolor='cyan', alpha=.2)
 
-        zoneinfo = zidf.loc[self.model.activo.nombre]
-        zonevolume = zoneinfo.Volumen
+        zonevolume = horarios.zonas['Volumen'][horarios.indice(nombre)]
+        renovaciones = horarios.ventilacion().resumen(nombre)
         ax3.text(.05, .85,
-                 u'Vol. zona = %.2f m3\n%.2f[ren/h]' % (zonevolume,
-                                               zonedf.Vventinf.mean() * 3600.0 / 1.225 / zonevolume),
+                 u'Vol. %s = %.2f m3\n%.2f[ren/h] (invierno %.2f, verano %.2f)' %
+                 (estado['modo'], zonevolume, renovaciones['anual'],
+                  renovaciones['invierno'], renovaciones['verano']),
                  transform=ax3.transAxes, size='small', va='top')
         ymin, ymax = ax3.get_ylim()
         ax4.set_ylim(ymin/zonevolume, ymax/zonevolume)
 
+    def bandasconsigna(self, ax, horarios, nombre, fechas, inicio, fin):
+        """Sombrea los periodos de una zona con temperatura sobre (rojo) o bajo (azul) consigna
+
+        fechas - Fechas de los periodos, días (365) u horas de inicio a fin
+        inicio, fin - Horas del año representadas
+        """
+        sobre, bajo = fueraconsigna(*(horarios.zona(nombre, var)[inicio:fin]
+                                      for var in ('Treal', 'Tmin', 'Tmax')))
+        if len(fechas) < fin - inicio:
+            # Días con alguna hora fuera de consigna
+            sobre, bajo = sobre.reshape(-1, 24).max(axis=1), bajo.reshape(-1, 24).max(axis=1)
+        for fuera, color in ((sobre, 'red'), (bajo, 'blue')):
+            ax.fill_between(fechas, 0, 1, where=fuera > 0, step='post', facecolor=color,
+                            alpha=0.1, lw=0, transform=ax.get_xaxis_transform())
+
+    def textoconsigna(self, ax, confort, nombre):
+        """Muestra las horas y grados hora anuales fuera de consigna"""
+        if confort is None or nombre not in confort:
+            return
+        valores = confort.zona(nombre)
+        ax.text(.01, .95, u'Sobre consigna: %.0f h (%.0f ºC·h)\nBajo consigna: %.0f h (%.0f ºC·h)' %
+                (valores['horassobre'], valores['gradoshorasobre'],
+                 valores['horasbajo'], valores['gradoshorabajo']),
+                transform=ax.transAxes, size='x-small', va='top')
+
+    def dibujahorarios(self, ejes, estado):
+        """Dibuja los valores horarios del periodo estado['rango']
+
+        Cada serie se submuestrea a un par de valores (mínimo y máximo) por
+        píxel del eje a partir de su pirámide de mínimos y máximos.
+        """
+        ax1, ax2, ax3, ax4 = ejes
+        horarios = estado['horarios']
+        nombre = estado['nombre']
+        inicio, fin = estado['rango']
+        npuntos = ax1.bbox.width
+
+        def serie(variable):
+            horas, valores = horarios.piramide(nombre, variable).envolvente(inicio, fin, npuntos)
+            return ORIGENHORAS + horas / 24.0, valores
+
+        ax1.set_title(u'Temperatura horaria', size='medium')
+        ax2.set_title(u'Carga térmica horaria (sensible, total)', size='medium')
+        ax3.set_title(u'Caudal horario de ventilación e infiltraciones', size='medium')
+
+        ax1.plot(*serie('Treal'), color='black', lw=0.5)
+        trealmin, trealmax = horarios.rango('Treal', nombre)
+        ax1.set_ylim(np.ceil(trealmin) - 3, np.floor(trealmax) + 3)
+
+        ax2.plot(*serie('QS'), color='blue', lw=0.5, alpha=0.5)
+        ax2.plot(*serie('QS+QL'), color='black', lw=0.5)
+
+        fechas, vventinf = serie('Vventinf')
+        ax3.plot(fechas, caudal(vventinf), color='black', lw=0.5)
+
+        if estado['modo'] == 'zona':
+            self.bandasconsigna(ax1, horarios, nombre,
+                                ORIGENHORAS + np.arange(inicio, fin) / 24.0, inicio, fin)
+        self.textoconsigna(ax1, estado['confort'], nombre)
+
+        ax1.set_xlim(ORIGENHORAS + inicio / 24.0, ORIGENHORAS + fin / 24.0)
+        ax1.get_xaxis().set_major_locator(matplotlib.dates.AutoDateLocator(interval_multiples=False))
+        formato = ('%b' if fin - inicio > 60 * 24 else
+                   '%d %b' if fin - inicio > 3 * 24 else '%d %b %H:%M')
+        ax1.get_xaxis().set_major_formatter(matplotlib.dates.DateFormatter(formato))
+
+        zonevolume = horarios.zonas['Volumen'][horarios.indice(nombre)]
+        ymin, ymax = ax3.get_ylim()
+        ax4.set_ylim(ymin/zonevolume, ymax/zonevolume)
+
     def save(self, filename='histobase.png', dpi=100):
         """Guardar y mostrar gráfica"""
+        self.actualizafigura()
+        self.fig.canvas.print_figure(filename,
+                                     format='png',
+                                     facecolor='w',
+                                     dpi=dpi)
+
+
+class MapaHorario(CacheDibujos, FigureCanvasGTK3Cairo, Observer):
+    """Mapa de días x horas de una variable horaria de zona"""
+    __gtype_name__ = 'MapaHorario'
+    labels = ('index', 'horarios', 'carga')
+
+    def __init__(self, modelo=None):
+        """Constructor
+
+        modelo - Modelo de la aplicación (VISOLModel)
+        """
+        Observer.__init__(self, modelo)
+
+        self.fig = Figure()
+        FigureCanvasGTK3Cairo.__init__(self, self.fig)
+        self.ax1 = self.fig.add_axes([0.1, 0.12, 0.75, 0.78])
+        self.cax = self.fig.add_axes([0.88, 0.12, 0.03, 0.78])
+        self._variable = 'Treal'
+
+    @property
+    def variable(self):
+        """Variable representada (clave de MAPAVARIABLES)"""
+        return self._variable
+
+    @variable.setter
+    def variable(self, value):
+        if value != self._variable:
+            self._variable = value
+            self.queue_draw()
+
+    def opcionesdibujo(self):
+        """Variable representada y disponibilidad de los datos horarios"""
+        if self.model.horarios is not None:
+            # Con los datos proyectados la escala es la de la zona (ver DatosHorarios.rango)
+            disponibles = 'proyectados' if self.model.horarios.proyectado else 'horarios'
+        else:
+            disponibles = 'cargando' if self.model.cargando else 'sin horarios'
+        return self._variable, disponibles
+
+    def update(self, subject, **kwargs):
+        label = kwargs.get('label', None)
+        if label == 'index' or (self.model.modo == 'zona' and
+                                (label == 'horarios' or kwargs.get('etapa', None) == 'fin')):
+            self.queue_draw()
+
+    @property
+    def nombremedida(self):
+        """Nombre de la gráfica en las medidas de latencia"""
+        return type(self).__name__
+
+    def dibuja(self):
+        self.dibujaseries(self.ax1, self.cax)
+
+    def dibujaseries(self, ax1, cax):
+        """Dibuja el mapa como una única imagen de 365 x 24 valores"""
+        model = self.model
+        ax1.clear()
+        cax.clear()
+        horarios = model.horarios
+        nombre = model.activo.nombre
+        if model.modo != 'zona' or horarios is None or nombre not in horarios:
+            ax1.axis('off')
+            cax.axis('off')
+            if model.modo != 'zona':
+                texto = u"Información solo disponible para zonas"
+            elif model.cargando:
+                texto = u"Cargando datos horarios..."
+            else:
+                texto = u"Datos horarios no disponibles"
+            ax1.annotate(texto, (0.5, 0.5), xycoords='axes fraction', ha='center')
+            return
+        ax1.axis('on')
+        cax.axis('on')
+
+        titulo, cmap = MAPAVARIABLES[self._variable]
+        if self._variable == 'demanda':
+            datos = horarios.mapa(nombre, 'daRef') - horarios.mapa(nombre, 'daCal')
+            vmin, vmax = -1, 1
+        else:
+            datos = horarios.mapa(nombre, self._variable)
+            vmin, vmax = horarios.rango(self._variable, nombre)
+            if self._variable == 'QS':
+                # Escala simétrica: pérdidas en azul y ganancias en rojo
+                vmax = max(abs(vmin), abs(vmax))
+                vmin = -vmax
+
+        # Días en el eje x y horas en el eje y (la traspuesta es también una vista)
+        imagen = ax1.imshow(datos.T, aspect='auto', origin='lower',
+                            interpolation='nearest', cmap=cmap, vmin=vmin, vmax=vmax,
+                            extent=(ORIGENHORAS, ORIGENHORAS + 365, 0, 24))
+        self.fig.colorbar(imagen, cax=cax)
+        if self._variable == 'demanda':
+            cax.set_yticks([-1, 0, 1])
+            cax.set_yticklabels([u'Cal.', u'-', u'Ref.'])
+
+        ax1.set_title(u'%s. Zona %s' % (titulo, nombre), size='medium')
+        ax1.set_ylabel(u'Hora', fontdict=dict(alpha=0.75, size='small'))
+        ax1.set_yticks([0, 6, 12, 18, 24])
+        ax1.xaxis_date()
+        ax1.get_xaxis().set_major_locator(matplotlib.dates.MonthLocator())
+        ax1.get_xaxis().set_major_formatter(matplotlib.dates.DateFormatter('%b'))
+
+    def save(self, filename='mapahorario.png', dpi=100):
+        """Guardar y mostrar gráfica"""
+        self.actualizafigura()
         self.fig.canvas.print_figure(filename,
                                      format='png',
                                      facecolor='w',
                                      dpi=dpi)
 
+
+class MapaZonas(CacheDibujos, FigureCanvasGTK3Cairo, Observer):
+    """Mapa de zonas x tiempo (días o meses) del edificio o de una planta
+
+    Los resultados horarios de todas las zonas (confort, ventilación y
+    valores diarios) se calculan al construir la figura en el hilo auxiliar.
+
+    Al pasar el cursor sobre el mapa se llama a alleer con el texto de la
+    zona, el periodo y el valor de la celda, obtenidos a partir de la
+    posición sin buscar entre los elementos de la figura.
+    """
+    __gtype_name__ = 'MapaZonas'
+    labels = ('index', 'horarios', 'carga')
+    enhilo = True
+
+    def __init__(self, modelo=None):
+        """Constructor
+
+        modelo - Modelo de la aplicación (VISOLModel)
+        """
+        Observer.__init__(self, modelo)
+
+        self.fig = Figure()
+        FigureCanvasGTK3Cairo.__init__(self, self.fig)
+        self.ax1 = self.fig.add_axes([0.15, 0.1, 0.7, 0.8])
+        self.cax = self.fig.add_axes([0.88, 0.1, 0.03, 0.8])
+        self._variable = 'demanda'
+        self._orden = 'planta'
+        # Función a la que se pasa el texto de la celda bajo el cursor
+        self.alleer = None
+        # Clave, zonas, plantas, periodos y valores de la última figura dibujada
+        self._lectura = None
+        self.mpl_connect('motion_notify_event', self.lee)
+
+    @property
+    def variable(self):
+        """Variable representada (clave de MAPAZONASVARIABLES)"""
+        return self._variable
+
+    @variable.setter
+    def variable(self, value):
+        if value != self._variable:
+            self._variable = value
+            self.queue_draw()
+
+    @property
+    def orden(self):
+        """Orden de las zonas: 'planta' (orden del edificio) o 'valor' (de mayor a menor media)"""
+        return self._orden
+
+    @orden.setter
+    def orden(self, value):
+        if value != self._orden:
+            self._orden = value
+            self.queue_draw()
+
+    def ambito(self):
+        """Planta representada o '' para todo el edificio"""
+        return self.model.index.planta if self.model.modo == 'planta' else ''
+
+    def clavefigura(self):
+        """Clave que identifica el contenido de la figura
+
+        La figura depende de la planta seleccionada y no del objeto activo, de
+        modo que se comparte entre el edificio, sus zonas y sus componentes.
+        """
+        model = self.model
+        return (self.nombremedida, model.file, model.revision, self.ambito(),
+                self.opcionesdibujo())
+
+    def opcionesdibujo(self):
+        """Variable, orden y disponibilidad de los datos horarios"""
+        if self.model.horarios is not None:
+            # Con los datos proyectados el mapa se rehace al terminar la carga
+            disponibles = 'proyectados' if self.model.horarios.proyectado else 'horarios'
+        else:
+            disponibles = 'cargando' if self.model.cargando else 'sin horarios'
+        return self._variable, self._orden, disponibles
+
+    def update(self, subject, **kwargs):
+        label = kwargs.get('label', None)
+        if label == 'index' or label == 'horarios' or kwargs.get('etapa', None) == 'fin':
+            self.queue_draw()
+
+    @property
+    def nombremedida(self):
+        """Nombre de la gráfica en las medidas de latencia"""
+        return type(self).__name__
+
+    def estadodibujo(self):
+        """Datos del modelo para la figura, que incluyen su clave para las lecturas"""
+        model = self.model
+        return dict(clave=self.clavefigura(), edificio=model.edificio, horarios=model.horarios,
+                    variable=self._variable, orden=self._orden, ambito=self.ambito(),
+                    cargando=model.cargando)
+
+    def construyefigura(self, figura, estado):
+        ax1 = figura.add_axes([0.15, 0.1, 0.7, 0.8])
+        cax = figura.add_axes([0.88, 0.1, 0.03, 0.8])
+        lectura = self.dibujaseries(ax1, cax, estado)
+        self.model.programador(self._guardalectura, lectura)
+
+    def _guardalectura(self, lectura):
+        """Recibe en el hilo principal los datos de la figura dibujada en el hilo auxiliar"""
+        self._lectura = lectura
+        return False
+
+    def dibuja(self):
+        self._lectura = self.dibujaseries(self.ax1, self.cax, self.estadodibujo())
+
+    def datos(self, estado):
+        """Zonas, plantas y array zonas x periodos de la variable en todo el edificio
+
+        Devuelve None si la variable necesita datos horarios no disponibles.
+        """
+        edificio = estado['edificio']
+        variable = estado['variable']
+        zonas = [edificio[planta][zona] for planta in edificio for zona in edificio[planta]]
+        if variable == 'demanda':
+            # Demanda mensual del archivo de resultados (zonas x 12)
+            datos = (np.array([zona.calefaccion_meses for zona in zonas]) +
+                     np.array([zona.refrigeracion_meses for zona in zonas]))
+        else:
+            horarios = estado['horarios']
+            if horarios is None:
+                return None
+            zonas = [zona for zona in zonas if zona.nombre in horarios]
+            indices = [horarios.indice(zona.nombre) for zona in zonas]
+            if variable in ('horassobre', 'horasbajo'):
+                # Horas mensuales fuera de consigna (zonas x 12)
+                datos = horarios.confort().mensual[variable]
+            elif variable == 'renovaciones':
+                datos = horarios.ventilacion().diarias
+            elif variable == 'carga':
+                datos = horarios.diariaszonas('QS+QL') / horarios.zonas['Area'][:, None]
+            else:
+                datos = horarios.diariaszonas(variable)
+            datos = datos[indices]
+        nombres = np.array([zona.nombre for zona in zonas])
+        plantas = np.array([zona.planta for zona in zonas])
+        return nombres, plantas, datos
+
+    def dibujaseries(self, ax1, cax, estado):
+        """Dibuja el mapa como una única imagen de zonas x periodos
+
+        Devuelve la clave de la figura y las zonas, plantas, periodos y valores
+        representados, o None si no hay datos.
+        """
+        ax1.clear()
+        cax.clear()
+        variable, orden = estado['variable'], estado['orden']
+        datos = self.datos(estado)
+        if datos is None:
+            ax1.axis('off')
+            cax.axis('off')
+            texto = (u"Cargando datos horarios..." if estado['cargando'] else
+                     u"Datos horarios no disponibles")
+            ax1.annotate(texto, (0.5, 0.5), xycoords='axes fraction', ha='center')
+            return None
+        ax1.axis('on')
+        cax.axis('on')
+
+        nombres, plantas, datos = datos
+        # Escala de colores común a todo el edificio
+        titulo, cmap = MAPAZONASVARIABLES[variable]
+        if variable == 'Treal':
+            vmin, vmax = datos.min(), datos.max()
+        elif variable in ('horassobre', 'horasbajo'):
+            vmin, vmax = 0, max(datos.max(), 1)
+        elif variable == 'renovaciones':
+            vmin, vmax = 0, max(datos.max(), 1e-3)
+        else:
+            vmax = max(np.abs(datos).max(), 1e-3)
+            vmin = -vmax
+
+        ambito = estado['ambito']
+        if ambito:
+            filas = np.flatnonzero(plantas == ambito)
+            nombres, plantas, datos = nombres[filas], plantas[filas], datos[filas]
+        if orden == 'valor':
+            filas = np.argsort(-datos.mean(axis=1), kind='mergesort')
+            nombres, plantas, datos = nombres[filas], plantas[filas], datos[filas]
+        nfilas, ncolumnas = datos.shape
+
+        imagen = ax1.imshow(datos, aspect='auto', interpolation='nearest', cmap=cmap,
+                            vmin=vmin, vmax=vmax, extent=(0, ncolumnas, nfilas, 0))
+        ax1.figure.colorbar(imagen, cax=cax)
+
+        if ncolumnas == 12:
+            periodos = [mes[:3] for mes in MESES]
+            ax1.set_xticks(np.arange(12) + 0.5)
+            ax1.set_xticklabels(periodos, size='small')
+        else:
+            fechas = pd.date_range('1/1/2007', periods=ncolumnas, freq='D')
+            periodos = [u'%i %s' % (fecha.day, MESES[fecha.month - 1][:3]) for fecha in fechas]
+            ax1.set_xticks(np.flatnonzero(fechas.day == 1))
+            ax1.set_xticklabels([mes[:3] for mes in MESES], size='small')
+
+        # Separación entre plantas y nombres de zonas o plantas
+        cambios = np.flatnonzero(plantas[1:] != plantas[:-1]) + 1
+        if orden == 'planta' and len(cambios):
+            ax1.hlines(cambios, 0, ncolumnas, colors='black', lw=0.5)
+        if nfilas <= MAXETIQUETASZONAS:
+            ax1.set_yticks(np.arange(nfilas) + 0.5)
+            ax1.set_yticklabels(nombres, size='x-small')
+        elif orden == 'planta':
+            inicios = np.concatenate(([0], cambios))
+            finales = np.concatenate((cambios, [nfilas]))
+            ax1.set_yticks((inicios + finales) / 2.0)
+            ax1.set_yticklabels(plantas[inicios], size='x-small')
+        else:
+            ax1.set_yticks([])
+
+        ax1.set_title(u'%s. %s' % (titulo, ambito or u'Edificio'), size='medium')
+        return estado['clave'], variable, nombres, plantas, periodos, datos
+
+    def lectura(self, x, y):
+        """Texto de la celda en la posición x, y [px] o None fuera del mapa
+
+        Se usan los datos de la última figura dibujada si corresponde a la
+        clave actual. La celda se obtiene de la posición relativa en los ejes,
+        que ocupan la misma fracción de la figura en el hilo auxiliar.
+        """
+        if self._lectura is None or self._lectura[0] != self.clavefigura():
+            return None
+        _, variable, nombres, plantas, periodos, datos = self._lectura
+        relx, rely = self.ax1.transAxes.inverted().transform((x, y))
+        fila = int(np.floor((1 - rely) * datos.shape[0]))
+        columna = int(np.floor(relx * datos.shape[1]))
+        if not (0 <= fila < datos.shape[0] and 0 <= columna < datos.shape[1]):
+            return None
+        return u'%s (%s), %s: %.2f %s' % (nombres[fila], plantas[fila], periodos[columna],
+                                         datos[fila, columna], MAPAZONASUNIDADES[variable])
+
+    def lee(self, event):
+        """Pasa a alleer el texto de la celda bajo el cursor"""
+        if self.alleer is None or self.model.activo is None or event.inaxes is not self.ax1:
+            return
+        texto = self.lectura(event.x, event.y)
+        if texto is not None:
+            self.alleer(texto)
+
+    def save(self, filename='mapazonas.png', dpi=100):
+        """Guardar y mostrar gráfica"""
+        self.actualizafigura()
+        self.fig.canvas.print_figure(filename,
+                                     format='png',
+                                     facecolor='w',
+                                     dpi=dpi)
+
+
+class CurvasCarga(CacheDibujos, FigureCanvasGTK3Cairo, Observer):
+    """Curvas de duración de carga y cargas punta de zona, planta o edificio
+
+    El análisis de cargas (ordenación de los valores horarios de todas las
+    zonas) se realiza al construir la figura en el hilo auxiliar.
+    """
+    __gtype_name__ = 'CurvasCarga'
+    labels = ('index', 'horarios', 'carga')
+    enhilo = True
+
+    def __init__(self, modelo=None):
+        """Constructor
+
+        modelo - Modelo de la aplicación (VISOLModel)
+        """
+        Observer.__init__(self, modelo)
+
+        self.fig = Figure()
+        FigureCanvasGTK3Cairo.__init__(self, self.fig)
+        self.ax1 = self.fig.add_subplot(111)
+        self.fig.subplots_adjust(left=0.15, top=0.9, bottom=0.12)
+
+    def opcionesdibujo(self):
+        """Disponibilidad de los datos horarios"""
+        if self.model.horarios is not None:
+            return 'horarios'
+        return 'cargando' if self.model.cargando else 'sin horarios'
+
+    def update(self, subject, **kwargs):
+        label = kwargs.get('label', None)
+        if label == 'index' or (self.model.modo in MODOSHORARIOS and
+                                (label == 'horarios' or kwargs.get('etapa', None) == 'fin')):
+            self.queue_draw()
+
+    @property
+    def nombremedida(self):
+        """Nombre de la gráfica en las medidas de latencia"""
+        return type(self).__name__
+
+    def estadodibujo(self):
+        """Datos del modelo para la figura
+
+        Para plantas y edificio se incluyen los grupos de zonas con los que
+        se agregan los datos horarios al dibujar.
+        """
+        model = self.model
+        grupos = model.grupos() if model.modo in ('planta', 'edificio') else None
+        return dict(modo=model.modo, nombre=model.activo.nombre, horarios=model.horarios,
+                    grupos=grupos, umbrales=model.umbralescarga, cargando=model.cargando)
+
+    def construyefigura(self, figura, estado):
+        ax1 = figura.add_subplot(111)
+        figura.subplots_adjust(left=0.15, top=0.9, bottom=0.12)
+        self.dibujaseries(ax1, estado)
+
+    def dibuja(self):
+        self.dibujaseries(self.ax1, self.estadodibujo())
+
+    def analisis(self, estado):
+        """Análisis de cargas (AnalisisCargas) de zonas o de plantas y edificio del estado"""
+        horarios = estado['horarios']
+        if horarios is None or estado['modo'] not in MODOSHORARIOS:
+            return None
+        if estado['grupos'] is not None:
+            horarios = horarios.agrupa(estado['grupos'])
+        return horarios.cargas(estado['umbrales'])
+
+    def dibujaseries(self, ax1, estado):
+        """Dibuja las curvas de duración de las cargas sensible, latente y total
+
+        Las curvas, monótonas, se submuestrean a un punto por píxel del eje
+        incluyendo sus extremos.
+        """
+        ax1.clear()
+        nombre = estado['nombre']
+        analisis = self.analisis(estado)
+        if analisis is None or nombre not in analisis:
+            ax1.axis('off')
+            if estado['modo'] not in MODOSHORARIOS:
+                texto = u"Información no disponible para componentes"
+            elif estado['cargando']:
+                texto = u"Cargando datos horarios..."
+            else:
+                texto = u"Datos horarios no disponibles"
+            ax1.annotate(texto, (0.5, 0.5), xycoords='axes fraction', ha='center')
+            return
+        ax1.axis('on')
+
+        i = analisis.indice(nombre)
+        numhoras = analisis.curvas['QT'].shape[1]
+        horas = np.unique(np.linspace(0, numhoras - 1, max(int(ax1.bbox.width), 2)).astype(int))
+        for carga, color, texto in (('QS', 'blue', u'Sensible'), ('QL', 'green', u'Latente'),
+                                    ('QT', 'black', u'Total')):
+            ax1.plot(horas, analisis.curva(nombre, carga)[horas], color=color, lw=1, label=texto)
+        ax1.axhline(0, color='gray', lw=0.5)
+        # Umbrales de carga total, en ambos sentidos
+        area = analisis.area[i]
+        for umbral in analisis.umbrales:
+            ax1.axhline(umbral * area, color='red', lw=0.5, ls='--', alpha=0.5)
+            ax1.axhline(-umbral * area, color='blue', lw=0.5, ls='--', alpha=0.5)
+
+        maximo, minimo = analisis.maximos['QT'][i], analisis.minimos['QT'][i]
+        texto = [u'Punta de refrigeración: %.0f W (%.1f W/m²), %s' %
+                 (maximo, maximo / area, fechahora(analisis.horasmaximo['QT'][i])),
+                 u'Punta de calefacción: %.0f W (%.1f W/m²), %s' %
+                 (minimo, minimo / area, fechahora(analisis.horasminimo['QT'][i]))]
+        texto.extend(u'Horas con |Q| > %g W/m²: %i' % (umbral, horasumbral)
+                     for (umbral, horasumbral) in zip(analisis.umbrales, analisis.horasumbral[i]))
+        ax1.text(.98, .95, u'\n'.join(texto), transform=ax1.transAxes,
+                 size='small', va='top', ha='right')
+
+        ax1.set_xlim(0, numhoras)
+        ax1.set_title(u'Curvas de duración de carga. %s' % nombre, size='medium')
+        ax1.set_xlabel(u'Horas', fontdict=dict(alpha=0.75, size='small'))
+        ax1.set_ylabel(u'Carga térmica [W]', fontdict=dict(alpha=0.75, size='small'))
+        ax1.legend(loc='lower left', prop={'size': 'small'})
+
+    def save(self, filename='curvascarga.png', dpi=100):
+        """Guardar y mostrar gráfica"""
+        self.actualizafigura()
+        self.fig.canvas.print_figure(filename,
+                                     format='png',
+                                     facecolor='w',
+                                     dpi=dpi)